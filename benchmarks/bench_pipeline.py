@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+main() 处理流程的基准测试。
+
+在临时目录中生成指定行数的工作簿，把 benchmarks/fake_gemini.py 作为 `gemini` 放到 PATH 最前面，
+然后完整运行一次 main.main()，报告：
+    - 吞吐量（行/秒）
+    - Excel 导出次数、耗时及其占总耗时的比例
+    - 每行调用次数（实际 gemini 调用次数 / 行数）
+    - 重试放大系数（实际 gemini 调用次数 / 无重试时应有的调用次数，即 去重后的公司数 / BATCH_SIZE）
+
+用法示例：
+    python benchmarks/bench_pipeline.py --rows 1000 10000 100000 --concurrency 8 --batch-size 5 \\
+        --latency uniform:20,80 --errors "Error 502:0.02,ECONNRESET:0.01,timeout:0.002" --quota 500:5
+
+fake_gemini 的延迟、错误比例和配额窗口通过命令行参数传入，其余 main.py 配置仍可通过环境变量覆盖。
+使用 --backend http 时改为启动 fake_gemini 的 HTTP 服务模式，测试 HTTP 查询后端。
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+
+def generate_workbook(path: str, rows: int):
+    """生成包含 rows 家公司的测试工作簿（约 5% 的公司名称重复出现）"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(['company_name', 'company_name_tc', 'Email', 'address'])
+    for i in range(rows):
+        number = i if i % 20 else i // 20
+        sheet.append([f"Benchmark Trading {number} Limited", f"基准贸易{number}有限公司", None, f"Unit {i}, Hong Kong"])
+    workbook.save(path)
+
+
+def install_fake_gemini(bin_dir: str):
+    """在 bin_dir 中创建名为 gemini 的包装脚本，调用 fake_gemini.py"""
+    wrapper = os.path.join(bin_dir, 'gemini')
+    with open(wrapper, 'w', encoding='utf-8') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCHMARK_DIR, "fake_gemini.py")}" "$@"\n')
+    os.chmod(wrapper, os.stat(wrapper).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def start_fake_server() -> tuple:
+    """在空闲端口上启动 fake_gemini 的 HTTP 服务，返回 (进程, 接口地址)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, os.path.join(BENCHMARK_DIR, 'fake_gemini.py'), '--serve', str(port)])
+    # 等待服务开始监听
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def run_once(main_module, rows: int, work_dir: str) -> dict:
+    """生成 rows 行的工作簿并运行一次 main()，返回统计结果"""
+    case_dir = os.path.join(work_dir, f"rows_{rows}")
+    os.makedirs(case_dir, exist_ok=True)
+    os.chdir(case_dir)
+    generate_workbook(main_module.EXCEL_FILE, rows)
+    state_file = os.path.join(case_dir, 'fake_gemini_state.json')
+    os.environ['FAKE_GEMINI_STATE'] = state_file
+
+    # 无重试时应有的调用次数：去重后每家公司只查询一次，每批 BATCH_SIZE 家
+    df = main_module.read_input_table(main_module.EXCEL_FILE, main_module.SHEET_NAME)
+    companies = len(main_module.cluster_company_rows(df, df.index.tolist())) if main_module.DEDUPE_ENABLED else rows
+    expected_calls = math.ceil(companies / max(1, main_module.BATCH_SIZE))
+
+    # 统计 Excel 导出的次数与耗时
+    save_stats = {'count': 0, 'seconds': 0.0}
+    original_export = main_module.export_workbook
+
+    def timed_export(df, *args):
+        started = time.perf_counter()
+        original_export(df, *args)
+        save_stats['count'] += 1
+        save_stats['seconds'] += time.perf_counter() - started
+
+    main_module.export_workbook = timed_export
+    try:
+        started = time.perf_counter()
+        main_module.main([])
+        wall_seconds = time.perf_counter() - started
+    finally:
+        main_module.export_workbook = original_export
+
+    with open(state_file, 'r', encoding='utf-8') as f:
+        fake_state = json.load(f)
+    calls = fake_state.get('calls', 0)
+    return {
+        'rows': rows,
+        'wall_seconds': round(wall_seconds, 3),
+        'rows_per_second': round(rows / wall_seconds, 2) if wall_seconds else None,
+        'saves': save_stats['count'],
+        'save_seconds': round(save_stats['seconds'], 3),
+        'save_share': round(save_stats['seconds'] / wall_seconds, 4) if wall_seconds else None,
+        'gemini_calls': calls,
+        'quota_errors': fake_state.get('quota_errors', 0),
+        'companies': companies,
+        'calls_per_row': round(calls / rows, 3) if rows else None,
+        'retry_amplification': round(calls / expected_calls, 3) if expected_calls else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main() 处理流程基准测试（使用 fake gemini，不消耗真实配额）')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='测试的工作簿行数')
+    parser.add_argument('--backend', choices=['cli', 'http'], default='cli', help='LOOKUP_BACKEND')
+    parser.add_argument('--concurrency', type=int, default=8, help='MAX_CONCURRENT_TASKS')
+    parser.add_argument('--batch-size', type=int, default=1, help='BATCH_SIZE')
+    parser.add_argument('--checkpoint-rows', type=int, default=500, help='EXCEL_CHECKPOINT_ROWS')
+    parser.add_argument('--latency', default='uniform:20,80', help='fake gemini 延迟分布，见 fake_gemini.py')
+    parser.add_argument('--errors', default='', help='fake gemini 错误比例，如 "Error 502:0.02,timeout:0.001"')
+    parser.add_argument('--quota', default='', help='fake gemini 配额窗口，如 500:5（每 5 秒最多 500 次）')
+    parser.add_argument('--timeout', type=float, default=2, help='GEMINI_TIMEOUT_SECONDS，注入 timeout 错误时生效')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    parser.add_argument('--verbose', action='store_true', help='输出 main() 的控制台日志')
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    work_dir = tempfile.mkdtemp(prefix='email_investigator_bench_')
+    bin_dir = os.path.join(work_dir, 'bin')
+    os.makedirs(bin_dir)
+    install_fake_gemini(bin_dir)
+
+    # main.py 在导入时读取环境变量配置，因此需要在导入前设置
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    os.environ.setdefault('LOOKUP_CACHE_ENABLED', '0')
+    os.environ.setdefault('REQUESTS_PER_MINUTE', '0')
+    os.environ.setdefault('QUOTA_BACKOFF_BASE_SECONDS', '1')
+    os.environ['MAX_CONCURRENT_TASKS'] = str(args.concurrency)
+    os.environ['BATCH_SIZE'] = str(args.batch_size)
+    os.environ['EXCEL_CHECKPOINT_ROWS'] = str(args.checkpoint_rows)
+    os.environ['FAKE_GEMINI_LATENCY'] = args.latency
+    os.environ['FAKE_GEMINI_ERRORS'] = args.errors
+    os.environ['FAKE_GEMINI_QUOTA'] = args.quota
+    os.environ['FAKE_GEMINI_TIMEOUT_SLEEP'] = str(args.timeout * 2)
+    os.environ['LOOKUP_BACKEND'] = args.backend
+    os.chdir(work_dir)
+    sys.path.insert(0, REPO_DIR)
+    import main as main_module
+
+    main_module.GEMINI_TIMEOUT_SECONDS = args.timeout
+    main_module.API_RETRY_DELAY_SECONDS = 0
+    if not args.verbose:
+        # 关闭控制台日志和等待动画，只测量处理流程本身
+        main_module.console_logger.setLevel(logging.WARNING + 1)
+        main_module.spinning_cursor = lambda seconds, message="": time.sleep(seconds)
+
+    results = []
+    for rows in args.rows:
+        server = None
+        if args.backend == 'http':
+            # 每个用例使用独立的状态文件，服务进程需在设置状态文件后启动
+            os.environ['FAKE_GEMINI_STATE'] = os.path.join(work_dir, f"rows_{rows}", 'fake_gemini_state.json')
+            os.makedirs(os.path.dirname(os.environ['FAKE_GEMINI_STATE']), exist_ok=True)
+            server, base_url = start_fake_server()
+            for backend in main_module.lookup_scheduler.backends:
+                backend.__init__(backend.model, base_url, backend.api_key, backend.pool.maxsize)
+        try:
+            result = run_once(main_module, rows, work_dir)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        results.append(result)
+        print(f"{result['rows']:>8} 行 | {result['wall_seconds']:>9.2f} 秒 | {result['rows_per_second']:>9.2f} 行/秒 | "
+              f"导出 {result['saves']:>4} 次 {result['save_seconds']:>7.2f} 秒 ({result['save_share']:.1%}) | "
+              f"调用 {result['gemini_calls']:>7} 次 ({result['calls_per_row']:.3f} 次/行) | 重试放大 {result['retry_amplification']:.3f}", flush=True)
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"工作目录: {work_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+gemini-cli 的本地替身，用于在不消耗真实配额的情况下测量吞吐量和回归。
+
+两种运行方式：
+1. 作为 `gemini` 可执行文件：从标准输入读取提示词，把回复写到标准输出，
+   出错时把与真实 gemini-cli 相同的错误文本写到标准错误并以非零状态退出。
+2. `python fake_gemini.py --serve PORT`：启动 Gemini 兼容的 generateContent HTTP 服务，
+   供 LOOKUP_BACKEND=http 使用。
+
+行为通过环境变量配置：
+    FAKE_GEMINI_LATENCY   延迟分布：fixed:毫秒 | uniform:最小毫秒,最大毫秒 | lognormal:中位数毫秒,sigma
+                          （默认 uniform:20,80）
+    FAKE_GEMINI_ERRORS    错误比例，逗号分隔的 类型:概率，类型为 RESOURCE_EXHAUSTED、Error 502、
+                          ECONNRESET、PERMISSION_DENIED、timeout（默认无错误）
+    FAKE_GEMINI_TIMEOUT_SLEEP  注入 timeout 错误时的挂起时间（秒，默认 3600）
+    FAKE_GEMINI_QUOTA     配额窗口：次数:秒，窗口内调用超过次数后返回 RESOURCE_EXHAUSTED（默认不限）
+    FAKE_GEMINI_NOT_FOUND_RATE  返回 "Not Found" 的比例（默认 0.3）
+    FAKE_GEMINI_STATE     调用计数状态文件，多个进程共享（默认 fake_gemini_state.json）
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+
+STATE_FILE = os.getenv('FAKE_GEMINI_STATE', 'fake_gemini_state.json')
+TIMEOUT_SLEEP_SECONDS = float(os.getenv('FAKE_GEMINI_TIMEOUT_SLEEP', '3600'))
+NOT_FOUND_RATE = float(os.getenv('FAKE_GEMINI_NOT_FOUND_RATE', '0.3'))
+
+# 与 main.py 中检测的 stderr 文本保持一致
+ERROR_STDERR = {
+    'RESOURCE_EXHAUSTED': 'Error: [429] RESOURCE_EXHAUSTED: Quota exceeded for quota metric',
+    'Error 502': 'API Error: Error 502 (Server Error)!!1',
+    'ECONNRESET': 'Error: read ECONNRESET',
+    'PERMISSION_DENIED': 'Error: [403] PERMISSION_DENIED: The caller does not have permission',
+}
+# HTTP 模式下对应的状态码
+ERROR_HTTP_STATUS = {
+    'RESOURCE_EXHAUSTED': (429, 'RESOURCE_EXHAUSTED'),
+    'Error 502': (502, 'UNAVAILABLE'),
+    'ECONNRESET': (503, 'UNAVAILABLE'),
+    'PERMISSION_DENIED': (403, 'PERMISSION_DENIED'),
+}
+
+
+def parse_latency(spec: str):
+    """解析延迟分布配置，返回一个无参函数，每次调用返回一次延迟（秒）"""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v]
+    if kind == 'fixed':
+        return lambda: values[0] / 1000
+    if kind == 'lognormal':
+        median_ms, sigma = values
+        return lambda: random.lognormvariate(0, sigma) * median_ms / 1000
+    low_ms, high_ms = values
+    return lambda: random.uniform(low_ms, high_ms) / 1000
+
+
+def parse_errors(spec: str) -> list:
+    """解析错误比例配置，返回 [(类型, 概率), ...]"""
+    errors = []
+    for item in spec.split(','):
+        if item.strip():
+            kind, _, probability = item.rpartition(':')
+            errors.append((kind.strip(), float(probability)))
+    return errors
+
+
+def record_call() -> bool:
+    """
+    在共享状态文件中记录一次调用。
+
+    Returns:
+        bool: 当前配额窗口内是否仍有配额
+    """
+    quota = os.getenv('FAKE_GEMINI_QUOTA', '')
+    with open(STATE_FILE, 'a+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            state = json.loads(f.read() or '{}')
+        except json.JSONDecodeError:
+            state = {}
+        now = time.time()
+        state['calls'] = state.get('calls', 0) + 1
+        allowed = True
+        if quota:
+            limit, window_seconds = (float(v) for v in quota.split(':'))
+            if now - state.get('window_start', 0) >= window_seconds:
+                state['window_start'] = now
+                state['window_calls'] = 0
+            state['window_calls'] = state.get('window_calls', 0) + 1
+            allowed = state['window_calls'] <= limit
+        if not allowed:
+            state['quota_errors'] = state.get('quota_errors', 0) + 1
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+    return allowed
+
+
+def answer_for(company_name: str) -> str:
+    """根据公司名称确定性地生成回复，同一公司每次返回相同结果"""
+    digest = int(hashlib.md5(company_name.encode('utf-8')).hexdigest(), 16)
+    if (digest % 1000) / 1000 < NOT_FOUND_RATE:
+        return 'Not Found'
+    return f"contact{digest % 100000}@example.com"
+
+
+def fields_for(company_name: str, prompt: str) -> dict:
+    """生成提示词中要求的额外字段（phone、website、source_url、confidence）"""
+    digest = int(hashlib.md5(company_name.encode('utf-8')).hexdigest(), 16)
+    values = {
+        'phone': f"+852 {2000 + digest % 8000} {digest % 10000:04d}",
+        'website': f"https://www.company{digest % 100000}.example.com",
+        'source_url': f"https://www.company{digest % 100000}.example.com/contact",
+        'confidence': ('high', 'medium', 'low')[digest % 3],
+    }
+    return {name: value for name, value in values.items() if f'"{name}"' in prompt}
+
+
+def build_reply(prompt: str) -> str:
+    """按照提示词类型（单家或批量）生成回复文本"""
+    items = re.findall(r'^(\d+)\. 英文名: (.*) \| 中文名: (.*)$', prompt, re.M)
+    if items:
+        return json.dumps([{'id': int(number), 'email': answer_for(en + tc), **fields_for(en + tc, prompt)}
+                           for number, en, tc in items], ensure_ascii=False)
+    en = re.search(r'英文名: (.*)', prompt)
+    tc = re.search(r'中文名: (.*)', prompt)
+    return answer_for((en.group(1) if en else '') + (tc.group(1) if tc else ''))
+
+
+def pick_error(errors: list):
+    """按配置的比例随机选择一种错误，不出错时返回 None"""
+    roll = random.random()
+    for kind, probability in errors:
+        if roll < probability:
+            return kind
+        roll -= probability
+    return None
+
+
+def run_cli():
+    """作为 gemini 可执行文件运行"""
+    prompt = sys.stdin.read()
+    time.sleep(parse_latency(os.getenv('FAKE_GEMINI_LATENCY', 'uniform:20,80'))())
+    error = 'RESOURCE_EXHAUSTED' if not record_call() else pick_error(parse_errors(os.getenv('FAKE_GEMINI_ERRORS', '')))
+    if error == 'timeout':
+        time.sleep(TIMEOUT_SLEEP_SECONDS)
+    if error in ERROR_STDERR:
+        sys.stderr.write(ERROR_STDERR[error] + '\n')
+        sys.exit(1)
+    print('Loaded cached credentials.')
+    print(build_reply(prompt))
+
+
+def serve(port: int):
+    """启动 Gemini 兼容的 generateContent HTTP 替身服务"""
+    # 仅在服务模式下导入，缩短作为可执行文件时的启动时间
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    latency = parse_latency(os.getenv('FAKE_GEMINI_LATENCY', 'uniform:20,80'))
+    errors = parse_errors(os.getenv('FAKE_GEMINI_ERRORS', ''))
+
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            prompt = ''.join(part.get('text', '') for part in body.get('contents', [{}])[0].get('parts', []))
+            time.sleep(latency())
+            error = 'RESOURCE_EXHAUSTED' if not record_call() else pick_error(errors)
+            if error == 'timeout':
+                time.sleep(TIMEOUT_SLEEP_SECONDS)
+            if error in ERROR_HTTP_STATUS:
+                status, reason = ERROR_HTTP_STATUS[error]
+                payload = {'error': {'code': status, 'status': reason, 'message': ERROR_STDERR[error]}}
+            else:
+                status = 200
+                payload = {'candidates': [{'content': {'parts': [{'text': build_reply(prompt)}]}}]}
+            data = json.dumps(payload).encode('utf-8')
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except ConnectionError:
+                # 客户端已断开（例如对冲请求中落败的调用被中止）
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]))
+    else:
+        run_cli()
@@ -7,11 +7,28 @@
 
 # --- 导入模块 ---
 import pandas as pd
+import numpy as np
+import openpyxl
+import argparse
+import csv
 import subprocess
 import sys
 import time
 import logging
 import os
+import re
+import math
+import random
+import json
+import queue
+import sqlite3
+import socket
+import http.client
+import urllib.parse
+import threading
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # --- 配置 ---
 # Excel文件相关配置
@@ -20,17 +37,121 @@ SHEET_NAME = 'Sheet1'  # 工作表名称
 COMPANY_NAME_EN_COL = 'company_name'  # 公司英文名列
 COMPANY_NAME_TC_COL = 'company_name_tc'  # 公司中文名列
 EMAIL_COL = 'Email'  # 邮箱结果列
+# 可额外提取的字段及其结果列：同一次调用中与邮箱一并返回，每个字段写入单独的列
+FIELD_COLUMNS = {'phone': 'Phone', 'website': 'Website', 'source_url': 'Source URL', 'confidence': 'Confidence'}
+EXTRACT_FIELDS = [f.strip() for f in os.getenv('EXTRACT_FIELDS', '').split(',') if f.strip()]  # 额外提取的字段（逗号分隔，如 phone,website），为空表示只查邮箱
+if set(EXTRACT_FIELDS) - set(FIELD_COLUMNS):
+    raise ValueError(f"EXTRACT_FIELDS 中包含未知字段: {sorted(set(EXTRACT_FIELDS) - set(FIELD_COLUMNS))}，可选: {list(FIELD_COLUMNS)}")
+RESULT_COLUMNS = [EMAIL_COL] + [FIELD_COLUMNS[name] for name in EXTRACT_FIELDS]  # 写回输入文件的所有结果列
+# 视为"未处理"的邮箱列取值（空白或可重试的错误结果）
+UNPROCESSED_MARKERS = ['', 'Error: No output', 'Error: Gemini call failed']
+
+# 结果日志（journal）与检查点配置
+EXCEL_CHECKPOINT_ROWS = int(os.getenv('EXCEL_CHECKPOINT_ROWS', '50'))  # 每处理多少条记录导出一次Excel
+EXCEL_CHECKPOINT_SECONDS = int(os.getenv('EXCEL_CHECKPOINT_SECONDS', '300'))  # 距上次导出超过多少秒时导出一次Excel
+
+# 查询缓存配置（跨运行、跨工作簿共享）
+LOOKUP_CACHE_ENABLED = os.getenv('LOOKUP_CACHE_ENABLED', '1') == '1'  # 是否启用本地查询缓存
+LOOKUP_CACHE_FILE = os.getenv('LOOKUP_CACHE_FILE', 'lookup_cache.sqlite')  # 缓存数据库文件
+CACHE_TTL_FOUND_DAYS = float(os.getenv('CACHE_TTL_FOUND_DAYS', '90'))  # 已找到邮箱的缓存有效期（天）
+CACHE_TTL_NOT_FOUND_DAYS = float(os.getenv('CACHE_TTL_NOT_FOUND_DAYS', '7'))  # "Not Found" 结果的缓存有效期（天）
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '200000'))  # 缓存最大条目数，超出时淘汰最久未使用的条目
+CACHE_EVICT_INTERVAL = int(os.getenv('CACHE_EVICT_INTERVAL', '100'))  # 每写入多少条检查一次缓存容量（两次检查之间最多超出这么多条）
+
+# 处理顺序配置：按优先级列和启发式规则排序，配额有限时先处理最重要的行
+PRIORITY_COL = os.getenv('PRIORITY_COL', 'Priority')  # 优先级列（数值，默认越小越优先，空白排在最后），表格中没有该列时忽略
+PRIORITY_DESCENDING = os.getenv('PRIORITY_DESCENDING', '0') == '1'  # 为 1 时优先级数值越大越优先
+# 优先级相同时依次使用的启发式规则（逗号分隔，为空表示不使用）：
+#   fewest_attempts  尝试次数少的行优先（从未查询过的行排在重试的行之前）
+#   both_names       同时有英文名和中文名的行优先（更容易查到）
+PRIORITY_HEURISTICS = [h.strip() for h in os.getenv('PRIORITY_HEURISTICS', 'fewest_attempts,both_names').split(',') if h.strip()]
+if set(PRIORITY_HEURISTICS) - {'fewest_attempts', 'both_names'}:
+    raise ValueError(f"PRIORITY_HEURISTICS 中包含未知规则: {sorted(set(PRIORITY_HEURISTICS) - {'fewest_attempts', 'both_names'})}")
+
+# 结果校验与重新查询配置
+REQUERY_LIMIT = int(os.getenv('REQUERY_LIMIT', '100'))  # 重新查询疑似错误记录（菜单选项 4）时每次最多查询的记录数
+REQUERY_MIN_SCORE = float(os.getenv('REQUERY_MIN_SCORE', '0.3'))  # 重新查询评分低于该值的记录不会被重新查询
+# 疑似错误的各类标记及其权重（越高表示重新查询越可能得到更好的结果），评分 = 1 - ∏(1 - 权重)
+SUSPECT_WEIGHTS = {
+    'invalid_syntax': 1.0,   # 格式不合法（例如模型返回的说明文字被当作邮箱保存）
+    'junk': 0.9,             # 占位、示例或无效地址（noreply、example.com、图片文件名等）
+    'duplicate': 0.6,        # 同一邮箱出现在多家不同的公司
+    'domain_mismatch': 0.4,  # 邮箱域名与公司英文名无关
+    'low_confidence': 0.3,   # 模型给出的可信度为 low（需提取 confidence 字段）
+    'not_found': 0.25,       # "Not Found"：重新查询仍有一定机会找到
+    'free_mail': 0.2,        # 免费邮箱（gmail、yahoo 等），可能不是官方邮箱
+}
+SUSPECT_LABELS = {'invalid_syntax': '格式错误', 'junk': '无效地址', 'duplicate': '重复地址', 'domain_mismatch': '域名不符',
+                  'low_confidence': '低可信度', 'not_found': '未找到', 'free_mail': '免费邮箱'}
+FREE_MAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'yahoo.com.hk', 'hotmail.com', 'hotmail.com.hk', 'outlook.com',
+    'live.com', 'msn.com', 'icloud.com', 'me.com', 'qq.com', '163.com', '126.com', 'sina.com', 'aol.com',
+    'netvigator.com', 'protonmail.com',
+}
+
+# 名称归并配置
+DEDUPE_ENABLED = os.getenv('DEDUPE_ENABLED', '1') == '1'  # 是否把表格中只有写法差异的公司归并后只查询一次
+
+# 分层解析配置：先查本地数据源，只有都未命中时才调用Gemini
+COMPANY_DIRECTORY_FILE = os.getenv('COMPANY_DIRECTORY_FILE', '')  # 本地公司名录文件（.csv 或 .sqlite），为空表示不使用
+DOMAIN_RULE_ENABLED = os.getenv('DOMAIN_RULE_ENABLED', '1') == '1'  # 是否根据名录中的官网域名推导邮箱
+DOMAIN_EMAIL_PREFIX = os.getenv('DOMAIN_EMAIL_PREFIX', 'info')  # 推导邮箱时使用的前缀，如 info@域名
+
+# Token 用量与预算配置
+PROMPT_VARIANT = os.getenv('PROMPT_VARIANT', 'full')  # 提示词版本：'full' 为完整搜索策略，'compact' 为精简版（token 更少，命中率可能略低）
+USAGE_DB_FILE = os.getenv('USAGE_DB_FILE', 'usage.sqlite')  # 按日累计用量的数据库（多个进程共享每日预算），为空表示只统计本次运行
+USAGE_LOG_FILE = os.getenv('USAGE_LOG_FILE', 'usage_log.csv')  # 逐行记录每条结果分摊的调用次数和 token 数，为空表示不记录
+COST_PER_MILLION_INPUT_TOKENS = float(os.getenv('COST_PER_MILLION_INPUT_TOKENS', '0.30'))  # 每百万输入 token 的价格（美元）
+COST_PER_MILLION_OUTPUT_TOKENS = float(os.getenv('COST_PER_MILLION_OUTPUT_TOKENS', '2.50'))  # 每百万输出 token 的价格（美元）
+BUDGET_RUN_CALLS = int(os.getenv('BUDGET_RUN_CALLS', '0'))  # 每次运行最多调用次数，0 表示不限
+BUDGET_RUN_TOKENS = int(os.getenv('BUDGET_RUN_TOKENS', '0'))  # 每次运行最多 token 数（输入+输出），0 表示不限
+BUDGET_DAY_CALLS = int(os.getenv('BUDGET_DAY_CALLS', '0'))  # 每日最多调用次数，0 表示不限
+BUDGET_DAY_TOKENS = int(os.getenv('BUDGET_DAY_TOKENS', '0'))  # 每日最多 token 数（输入+输出），0 表示不限
+
+# 分片处理配置（多个进程/多台机器通过共享的 SQLite 文件认领行区间）
+SHARD_STORE_FILE = os.getenv('SHARD_STORE_FILE', '')  # 共享分片数据库，为空时使用 <输入文件名>_<工作表>_shards.sqlite
+SHARD_RANGE_SIZE = int(os.getenv('SHARD_RANGE_SIZE', '100'))  # 每个区间的行数
+SHARD_LEASE_SECONDS = int(os.getenv('SHARD_LEASE_SECONDS', '300'))  # 区间租约有效期（秒），过期未续约的区间会被重新认领
+SHARD_POLL_SECONDS = float(os.getenv('SHARD_POLL_SECONDS', '5'))  # 其余区间都被其他进程持有时，重新尝试认领的间隔（秒）
+
+# 无人值守（监视目录）模式配置
+WATCH_POLL_SECONDS = int(os.getenv('WATCH_POLL_SECONDS', '10'))  # 扫描监视目录的间隔（秒）
+WATCH_FILE_EXTENSIONS = ('.xlsx', '.csv', '.parquet')  # 监视目录中会被处理的文件类型
+WATCH_SETTLE_SECONDS = 5  # 文件最后修改后至少经过多少秒才开始处理，避免处理尚未复制完成的文件
+
+# 运行指标导出配置
+METRICS_JSON_FILE = os.getenv('METRICS_JSON_FILE', 'metrics.json')  # JSON 指标摘要文件，为空表示不导出
+METRICS_PROM_FILE = os.getenv('METRICS_PROM_FILE', 'metrics.prom')  # Prometheus textfile 指标文件，为空表示不导出
+METRICS_EXPORT_SECONDS = int(os.getenv('METRICS_EXPORT_SECONDS', '30'))  # 运行期间刷新指标文件的间隔（秒）
 
 # 日志配置
 LOG_FILE = 'not_found_log.log'  # 日志文件名
 
 # Gemini API相关配置
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')  # 从环境变量获取模型名称，默认为'gemini-2.5-flash'
-RETRY_INTERVAL_MINUTES = 30  # 配额错误重试间隔（分钟）
-TASK_INTERVAL_SECONDS = 10  # 任务间隔时间（秒）
-GEMINI_TIMEOUT_SECONDS = 3600  # Gemini调用超时时间（秒）
+GEMINI_MODELS = [m.strip() for m in os.getenv('GEMINI_MODELS', GEMINI_MODEL).split(',') if m.strip()]  # 配额用尽时按顺序切换的模型列表（逗号分隔）
+RETRY_INTERVAL_MINUTES = 30  # 配额错误探测间隔上限（分钟）
+QUOTA_BACKOFF_BASE_SECONDS = int(os.getenv('QUOTA_BACKOFF_BASE_SECONDS', '60'))  # 配额错误首次探测间隔（秒），之后指数递增直到上限
+MAX_CONCURRENT_TASKS = int(os.getenv('MAX_CONCURRENT_TASKS', '1'))  # 并发查询数（工作线程数），1 为串行
+REQUESTS_PER_MINUTE = float(os.getenv('REQUESTS_PER_MINUTE', '6'))  # 令牌桶限速：每分钟最多发起的查询数
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '1'))  # 令牌桶容量（允许的突发查询数）
+GEMINI_TIMEOUT_SECONDS = 3600  # Gemini调用超时时间上限（秒），调用耗时样本不足时使用
+ADAPTIVE_TIMEOUT_ENABLED = os.getenv('ADAPTIVE_TIMEOUT_ENABLED', '1') == '1'  # 是否根据最近调用耗时的分位数自动设置超时时间
+ADAPTIVE_TIMEOUT_FACTOR = float(os.getenv('ADAPTIVE_TIMEOUT_FACTOR', '3'))  # 自适应超时 = p95 耗时 × 该系数
+ADAPTIVE_TIMEOUT_MIN_SECONDS = float(os.getenv('ADAPTIVE_TIMEOUT_MIN_SECONDS', '60'))  # 自适应超时的下限（秒）
+LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', '200'))  # 计算耗时分位数时保留的最近成功调用数
+LATENCY_MIN_SAMPLES = int(os.getenv('LATENCY_MIN_SAMPLES', '20'))  # 成功调用样本达到该数量后才启用自适应超时与对冲请求
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', '0') == '1'  # 是否启用对冲请求：调用超过分位数耗时仍未返回时再发起一次相同调用，先返回者胜出
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '90'))  # 发起对冲请求前等待的耗时分位数
 MAX_API_CALL_RETRIES = 3  # API调用（非配额）最大重试次数
 API_RETRY_DELAY_SECONDS = 5  # API调用重试间隔（秒）
+LOOKUP_BACKEND = os.getenv('LOOKUP_BACKEND', 'cli')  # 查询后端：'cli' 调用 gemini-cli 子进程，'http' 通过连接池直接请求 Gemini 兼容接口
+GEMINI_API_BASE_URL = os.getenv('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com')  # HTTP 后端的接口地址（可指向本地替身服务）
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')  # 使用的 API Key（cli 后端为空时使用 gemini-cli 的登录凭据）
+GEMINI_API_KEYS = [k.strip() for k in os.getenv('GEMINI_API_KEYS', GEMINI_API_KEY).split(',') if k.strip()]  # 配额用尽时按顺序切换的 API Key 列表（逗号分隔）
+GEMINI_API_SEARCH_GROUNDING = os.getenv('GEMINI_API_SEARCH_GROUNDING', '1') == '1'  # HTTP 后端是否启用 Google 搜索增强
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '0'))  # HTTP 长连接池大小，0 表示与并发查询数一致
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '1'))  # 每次调用查询的公司数，大于1时启用批量提示词
 
 # --- AI 提示词模板 ---
 # 定义发送给Gemini的提示词模板，包含详细的搜索策略和输出要求
@@ -50,11 +171,1661 @@ PROMPT_TEMPLATE = (
     "如果找到邮箱，请只返回邮箱地址。如果找不到，请只返回 \"Not Found\"。"
 )
 
+# 批量查询提示词模板：一次调用查询多家公司，要求以JSON数组返回，便于逐家解析和校验
+BATCH_PROMPT_TEMPLATE = (
+    "你是一名顶尖的企业信息调查员，专注于查找香港地区公司的联系方式。你的任务是基于我提供的公司列表，通过联网搜索，为每一家公司找到官方联系邮箱。\n\n"
+    "--- 公司列表 ---\n"
+    "{company_list}\n\n"
+    "--- 建议搜索策略 (请优先使用) ---\n"
+    "1.  **首要目标 - 官方网站**: 深度挖掘公司的官方网站，特别是“联系我们”(Contact Us)、“关于我们”(About Us) 或页脚部分。\n"
+    "2.  **香港官方数据库**: 重点查询香港公司注册处 (Cyber Search Centre) 和香港贸易发展局 (HKTDC) 的数据库。\n"
+    "3.  **本地商业目录**: 搜索香港黄页 (yp.com.hk) 和其他本地商业名录。\n"
+    "4.  **专业和社交网络**: 检查公司的 LinkedIn 官方页面，以及它可能所属的行业协会网站。\n"
+    "5.  **善用中文名**: 在搜索香港本地资源时，请充分利用公司的中文名称。\n\n"
+    "--- 输出要求 ---\n"
+    "请只返回一个JSON数组，不要返回任何其他文字、解释或Markdown标记。\n"
+    "数组中每家公司对应一个对象，格式为 {item_format}，编号与公司列表中的编号一致。\n"
+    "如果找不到某家公司的邮箱，请将其 email 设为 \"Not Found\"。{field_notes}"
+)
+
+# 精简版提示词（PROMPT_VARIANT=compact）：省略详细的搜索策略，减少每次调用的输入 token
+COMPACT_PROMPT_TEMPLATE = (
+    "查找以下香港公司的官方联系邮箱（优先官网、公司注册处、HKTDC、黄页）。\n"
+    "英文名: {company_name}\n"
+    "中文名: {company_name_tc}\n"
+    "只返回邮箱地址；找不到则只返回 \"Not Found\"。"
+)
+
+COMPACT_BATCH_PROMPT_TEMPLATE = (
+    "为以下每家香港公司查找官方联系邮箱（优先官网、公司注册处、HKTDC、黄页）。\n"
+    "{company_list}\n"
+    "只返回JSON数组，格式为 [{item_format}]，找不到时 email 为 \"Not Found\"。{field_notes}"
+)
+
+# 额外字段在结构化回复中的说明
+FIELD_PROMPT_HINTS = {
+    'phone': '联系电话',
+    'website': '官方网站网址',
+    'source_url': '找到邮箱的网页地址',
+    'confidence': '邮箱可信度 high/medium/low',
+}
+
+# 邮箱地址格式校验
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+# 结果校验使用的严格格式：常见的本地部分字符，域名由字母数字和连字符组成，顶级域名至少两个字母
+STRICT_EMAIL_PATTERN = r"[A-Za-z0-9._%+'-]+@(?:[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?\.)+[A-Za-z]{2,}"
+# 占位、示例或无效地址
+JUNK_LOCAL_PATTERN = r'^(?:no-?reply|do-?not-?reply|test|example|email|e-mail|name|yourname|your\.name|user|username|someone|x{2,})$'
+JUNK_DOMAIN_PATTERN = (r'(?:^|\.)(?:example\.(?:com|org|net)|domain\.com|email\.com|test\.com|company\.com'
+                       r'|your-?(?:domain|company)\.[a-z.]+|sentry\.[a-z.]+)$|\.(?:png|jpe?g|gif|svg|webp)$')
+# 比较域名与公司名称时忽略的域名部分和公司名称词
+GENERIC_DOMAIN_LABELS = {'www', 'com', 'net', 'org', 'edu', 'gov', 'co', 'hk', 'cn', 'mo', 'tw', 'sg', 'uk', 'io',
+                         'biz', 'info', 'asia'}
+COMPANY_SUFFIX_TOKENS = {'ltd', 'co', 'corp', 'inc', 'intl', 'holdings', 'enterprises', '&', 'hk', 'of', 'the'}
+
+class LookupResult(str):
+    """
+    带额外字段的查询结果。
+
+    字符串值即邮箱列的取值（邮箱地址、"Not Found" 或 "Error: ..."），因此按字符串处理结果的代码无需修改；
+    fields 保存同一次调用返回的其他字段（EXTRACT_FIELDS），如 {'phone': ..., 'website': ...}。
+    """
+
+    def __new__(cls, value: str, fields: dict = None):
+        result = super().__new__(cls, value)
+        result.fields = dict(fields or {})
+        return result
+
+def result_fields(result: str) -> dict:
+    """返回查询结果附带的额外字段，普通字符串结果返回空字典"""
+    return getattr(result, 'fields', {})
+
 # --- 自定义异常 ---
 class QuotaExceededError(Exception):
     """当检测到API配额用尽时抛出此异常"""
     pass
 
+class BackendError(Exception):
+    """查询后端返回的不可重试错误"""
+    pass
+
+class RetryableBackendError(BackendError):
+    """查询后端返回的临时错误（网络波动、5xx 等），可以重试"""
+    pass
+
+class BackendTimeoutError(BackendError):
+    """查询后端调用超时"""
+    pass
+
+class BudgetExceededError(Exception):
+    """调用次数或 token 数达到预算上限时抛出此异常"""
+    pass
+
+# --- 运行指标 ---
+class MetricsRegistry:
+    """
+    线程安全的轻量指标注册表，支持计数器、仪表和直方图。
+
+    指标可导出为 JSON 摘要和 Prometheus textfile 格式（供 node_exporter 的 textfile collector 采集），
+    两种文件都通过临时文件原子替换写入。
+    """
+
+    PREFIX = 'email_investigator_'
+    # Prometheus 文本格式中标签值需要转义的字符
+    LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.definitions = {}  # 指标名 -> (类型, 说明, 直方图桶)
+        self.values = {}  # (指标名, 标签) -> 计数器/仪表的值，或直方图的 [各桶计数, 总和, 次数]
+        self.started_at = time.monotonic()
+
+    def define(self, name: str, kind: str, help_text: str, buckets: tuple = ()):
+        """
+        声明一个指标。
+
+        Args:
+            name (str): 指标名（不含前缀）
+            kind (str): 'counter'、'gauge' 或 'histogram'
+            help_text (str): 指标说明
+            buckets (tuple): 直方图的桶上界（升序）
+        """
+        self.definitions[name] = (kind, help_text, tuple(buckets))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """计数器加上 value"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """设置仪表的值"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """向直方图记录一个观测值"""
+        buckets = self.definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            entry = self.values.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            for i, upper in enumerate(buckets):
+                if value <= upper:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def total(self, name: str) -> float:
+        """返回计数器在所有标签上的总和，或直方图所有观测值的总和"""
+        with self.lock:
+            values = [value for (metric, _), value in self.values.items() if metric == name]
+        return sum(value[1] if isinstance(value, list) else value for value in values)
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        """把标签格式化为 Prometheus 的 {k="v"} 形式（标签值中的反斜杠、双引号和换行按格式要求转义）"""
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        return '{' + ','.join(f'{k}="{str(v).translate(MetricsRegistry.LABEL_ESCAPES)}"' for k, v in items) + '}'
+
+    def to_dict(self) -> dict:
+        """生成 JSON 摘要"""
+        wall_seconds = time.monotonic() - self.started_at
+        sleep_seconds = self.total('sleep_seconds_total')
+        summary = {
+            'wall_seconds': round(wall_seconds, 3),
+            'sleep_seconds': round(sleep_seconds, 3),
+            'work_seconds': round(self.total('gemini_call_seconds'), 3),
+            'metrics': {},
+        }
+        with self.lock:
+            items = sorted(self.values.items())
+        for (name, labels), value in items:
+            metric_key = name + self._format_labels(labels)
+            if isinstance(value, list):
+                bucket_counts, value_sum, count = value
+                summary['metrics'][metric_key] = {
+                    'count': count,
+                    'sum': round(value_sum, 6),
+                    'mean': round(value_sum / count, 6) if count else 0.0,
+                    'buckets': {str(upper): bucket_counts[i] for i, upper in enumerate(self.definitions[name][2])},
+                }
+            else:
+                summary['metrics'][metric_key] = value
+        return summary
+
+    def to_prometheus(self) -> str:
+        """生成 Prometheus textfile 格式的文本"""
+        self.set('run_seconds', time.monotonic() - self.started_at)
+        with self.lock:
+            items = sorted(self.values.items())
+        lines = []
+        described = set()
+        for (name, labels), value in items:
+            kind, help_text, buckets = self.definitions[name]
+            full_name = self.PREFIX + name
+            if name not in described:
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                described.add(name)
+            if kind == 'histogram':
+                bucket_counts, value_sum, count = value
+                for i, upper in enumerate(buckets):
+                    lines.append(f"{full_name}_bucket{self._format_labels(labels, (('le', upper),))} {bucket_counts[i]}")
+                lines.append(f"{full_name}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{full_name}_sum{self._format_labels(labels)} {value_sum}")
+                lines.append(f"{full_name}_count{self._format_labels(labels)} {count}")
+            else:
+                lines.append(f"{full_name}{self._format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """把指标写入 METRICS_JSON_FILE 和 METRICS_PROM_FILE（原子替换）"""
+        for path, content in ((METRICS_JSON_FILE, lambda: json.dumps(self.to_dict(), ensure_ascii=False, indent=2)),
+                              (METRICS_PROM_FILE, self.to_prometheus)):
+            if not path:
+                continue
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content())
+            os.replace(tmp_path, path)
+
+# 全局指标注册表及指标声明
+metrics = MetricsRegistry()
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+metrics.define('gemini_call_seconds', 'histogram', '单次后端调用（子进程或HTTP请求）耗时（秒）', LATENCY_BUCKETS)
+metrics.define('gemini_calls_total', 'counter', '后端调用次数，按结果分类')
+metrics.define('gemini_timeouts_total', 'counter', '后端调用超时次数')
+metrics.define('lookup_retries', 'histogram', '每次查询（单家或一批）的重试次数', (0, 1, 2, 3, 5, 10))
+metrics.define('sleep_seconds_total', 'counter', '等待时间（秒），按原因分类：rate_limit、retry_delay、quota')
+metrics.define('quota_stall_seconds_total', 'counter', '所有模型/凭据配额用尽后暂停等待的时间（秒）')
+metrics.define('excel_save_seconds', 'histogram', 'Excel 导出耗时（秒）', (0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120))
+metrics.define('rows_processed_total', 'counter', '已处理的行数，按结果分类：success、not_found、error')
+metrics.define('run_seconds', 'gauge', '本次运行已耗时（秒）')
+metrics.define('gemini_timeout_seconds', 'gauge', '当前使用的（自适应）调用超时时间（秒）')
+metrics.define('tokens_total', 'counter', '估算的 token 用量，按方向分类：input、output')
+metrics.define('hedged_requests_total', 'counter', '发起的对冲请求数，按胜出方分类：hedge、primary')
+
+# --- 限速器 ---
+class TokenBucketRateLimiter:
+    """
+    线程安全的令牌桶限速器，用于替代固定的任务间隔等待。
+
+    令牌以 requests_per_minute / 60 的速率持续补充，桶中最多存放 burst 个令牌。
+    每次发起查询前调用 acquire() 取走一个令牌，令牌不足时阻塞等待。
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        """
+        Args:
+            requests_per_minute (float): 每分钟允许的查询数，<= 0 表示不限速
+            burst (int): 令牌桶容量
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取走一个令牌，令牌不足时阻塞直到补充完成"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # 按流逝时间补充令牌
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # 计算距离下一个令牌还需等待的时间
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+            metrics.inc('sleep_seconds_total', wait_seconds, reason='rate_limit')
+
+    def try_acquire(self) -> bool:
+        """
+        不阻塞地尝试取走一个令牌。
+
+        Returns:
+            bool: 是否取得令牌
+        """
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+# --- 调用耗时统计 ---
+class LatencyTracker:
+    """
+    记录最近若干次成功调用的耗时，用于计算自适应超时时间和对冲请求的等待时间。
+
+    样本数不足 LATENCY_MIN_SAMPLES 时不做估计，超时时间回退为 GEMINI_TIMEOUT_SECONDS。
+    """
+
+    def __init__(self, window: int, min_samples: int):
+        """
+        Args:
+            window (int): 保留的最近样本数
+            min_samples (int): 开始估计所需的最少样本数
+        """
+        self.samples = deque(maxlen=max(1, window))
+        self.min_samples = max(1, min_samples)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """记录一次成功调用的耗时"""
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float):
+        """
+        返回耗时的 q 分位数（秒），样本不足时返回 None。
+
+        Args:
+            q (float): 分位数（0~100）
+        """
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            samples = list(self.samples)
+        return float(np.percentile(samples, q))
+
+    def timeout(self) -> float:
+        """返回本次调用应使用的超时时间（秒）"""
+        p95 = self.percentile(95) if ADAPTIVE_TIMEOUT_ENABLED else None
+        if p95 is None:
+            return GEMINI_TIMEOUT_SECONDS
+        return min(GEMINI_TIMEOUT_SECONDS, max(ADAPTIVE_TIMEOUT_MIN_SECONDS, p95 * ADAPTIVE_TIMEOUT_FACTOR))
+
+    def hedge_delay(self):
+        """返回发起对冲请求前的等待时间（秒），未启用或样本不足时返回 None"""
+        return self.percentile(HEDGE_PERCENTILE) if HEDGE_ENABLED else None
+
+# --- Token 用量与预算 ---
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数：中日韩字符按每字 1 个 token，其余字符按每 4 个字符 1 个 token。
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+def empty_usage() -> dict:
+    """返回空的用量记录：{'calls': 调用次数, 'input_tokens': 输入 token 数, 'output_tokens': 输出 token 数}"""
+    return {'calls': 0, 'input_tokens': 0, 'output_tokens': 0}
+
+def split_usage(usage: dict, count: int) -> dict:
+    """把一批查询的用量平均分摊到 count 家公司"""
+    return {key: value / max(1, count) for key, value in usage.items()}
+
+def usage_cost(usage: dict) -> float:
+    """按 COST_PER_MILLION_*_TOKENS 估算用量对应的费用（美元）"""
+    return (usage['input_tokens'] * COST_PER_MILLION_INPUT_TOKENS +
+            usage['output_tokens'] * COST_PER_MILLION_OUTPUT_TOKENS) / 1_000_000
+
+class UsageTracker:
+    """
+    统计 Gemini 调用次数与 token 用量，并检查每次运行和每日的预算上限。
+
+    本次运行的用量保存在内存中；每日用量累计在 SQLite 数据库中，多个进程（例如分片工作进程）共享同一份每日预算。
+    工作线程可通过 begin_scope()/end_scope() 取得一次查询期间产生的用量，用于逐行记录。
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): 每日用量数据库路径，为空时只统计本次运行
+        """
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.run_totals = empty_usage()
+        self.day = time.strftime('%Y-%m-%d')
+        self.day_totals = empty_usage()
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage_daily ("
+                "day TEXT PRIMARY KEY, calls INTEGER NOT NULL, input_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL)"
+            )
+            self.conn.commit()
+            self.day_totals = self._load_day(self.day)
+
+    def _load_day(self, day: str) -> dict:
+        """从数据库读取指定日期的累计用量"""
+        row = self.conn.execute(
+            "SELECT calls, input_tokens, output_tokens FROM usage_daily WHERE day = ?", (day,)
+        ).fetchone()
+        return dict(zip(('calls', 'input_tokens', 'output_tokens'), row)) if row else empty_usage()
+
+    def begin_scope(self):
+        """开始统计当前线程中产生的用量"""
+        self.local.scope = empty_usage()
+
+    def end_scope(self) -> dict:
+        """结束统计并返回当前线程自 begin_scope() 以来产生的用量"""
+        scope = getattr(self.local, 'scope', None) or empty_usage()
+        self.local.scope = None
+        return scope
+
+    def _add(self, usage: dict):
+        """把用量计入当前线程、本次运行和当日的累计值（调用方须持有 self.lock）"""
+        scope = getattr(self.local, 'scope', None)
+        if scope is not None:
+            for key, value in usage.items():
+                scope[key] += value
+        for key, value in usage.items():
+            self.run_totals[key] += value
+        day = time.strftime('%Y-%m-%d')
+        if self.conn is None:
+            if day != self.day:
+                self.day, self.day_totals = day, empty_usage()
+            for key, value in usage.items():
+                self.day_totals[key] += value
+            return
+        self.conn.execute(
+            "INSERT INTO usage_daily (day, calls, input_tokens, output_tokens) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(day) DO UPDATE SET calls = calls + excluded.calls, "
+            "input_tokens = input_tokens + excluded.input_tokens, output_tokens = output_tokens + excluded.output_tokens",
+            (day, usage['calls'], usage['input_tokens'], usage['output_tokens'])
+        )
+        self.conn.commit()
+        # 读回累计值，包含其他进程写入的用量
+        self.day, self.day_totals = day, self._load_day(day)
+
+    def _check_limits(self):
+        """任一上限已达到时抛出 BudgetExceededError（调用方须持有 self.lock）"""
+        run_tokens = self.run_totals['input_tokens'] + self.run_totals['output_tokens']
+        day_totals = self.day_totals if self.day == time.strftime('%Y-%m-%d') else empty_usage()
+        day_tokens = day_totals['input_tokens'] + day_totals['output_tokens']
+        limits = (
+            (BUDGET_RUN_CALLS, self.run_totals['calls'], "本次运行调用次数"),
+            (BUDGET_RUN_TOKENS, run_tokens, "本次运行 token 数"),
+            (BUDGET_DAY_CALLS, day_totals['calls'], "当日调用次数"),
+            (BUDGET_DAY_TOKENS, day_tokens, "当日 token 数"),
+        )
+        for limit, used, label in limits:
+            if limit > 0 and used >= limit:
+                raise BudgetExceededError(f"{label}已达到预算上限 ({used}/{limit})")
+
+    def reserve(self, input_tokens: int):
+        """
+        检查预算并预先计入一次调用，每次实际发起调用前调用。
+
+        检查与计数在同一把锁内完成（启用每日用量数据库时在同一个写事务内），
+        并发的工作线程和分片进程不会同时通过检查而使调用次数超出上限。
+        调用完成后由 record() 补记实际 token 用量。
+
+        Args:
+            input_tokens (int): 预估的输入 token 数
+
+        Raises:
+            BudgetExceededError: 本次运行或当日的调用次数/token 数已达到上限
+        """
+        usage = {'calls': 1, 'input_tokens': input_tokens, 'output_tokens': 0}
+        with self.lock:
+            if self.conn is not None:
+                # 写事务期间其他进程无法计入用量，读到的当日累计值在提交前不会变化
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self.day = time.strftime('%Y-%m-%d')
+                    self.day_totals = self._load_day(self.day)
+                    self._check_limits()
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            else:
+                self._check_limits()
+            self._add(usage)
+
+    def record(self, input_tokens: int, output_tokens: int, reserved_input_tokens: int):
+        """
+        补记一次已通过 reserve() 计入的调用的实际 token 用量（无论成功与否）。
+
+        Args:
+            input_tokens (int): 实际输入 token 数
+            output_tokens (int): 输出 token 数
+            reserved_input_tokens (int): reserve() 时预先计入的输入 token 数
+        """
+        metrics.inc('tokens_total', input_tokens, direction='input')
+        metrics.inc('tokens_total', output_tokens, direction='output')
+        with self.lock:
+            self._add({'calls': 0, 'input_tokens': input_tokens - reserved_input_tokens, 'output_tokens': output_tokens})
+
+    def check_budget(self):
+        """
+        检查预算，任一上限已达到时抛出 BudgetExceededError。
+
+        Raises:
+            BudgetExceededError: 本次运行或当日的调用次数/token 数已达到上限
+        """
+        with self.lock:
+            self._check_limits()
+
+    def summary(self) -> str:
+        """返回本次运行用量的摘要文本"""
+        with self.lock:
+            totals = dict(self.run_totals)
+        return (f"Gemini调用 {totals['calls']} 次, 输入约 {totals['input_tokens']} tokens, "
+                f"输出约 {totals['output_tokens']} tokens, 估算费用 ${usage_cost(totals):.4f}")
+
+    def log_row(self, excel_file: str, row, company_en: str, company_tc: str, email: str, usage: dict):
+        """
+        把一行结果的用量追加到 USAGE_LOG_FILE（CSV）。
+
+        Args:
+            excel_file (str): 输入文件路径
+            row: 数据表中的行索引
+            company_en (str): 公司的英文名称
+            company_tc (str): 公司的中文名称
+            email (str): 查询结果
+            usage (dict): 该行分摊到的用量
+        """
+        if not USAGE_LOG_FILE:
+            return
+        with self.lock:
+            write_header = not os.path.exists(USAGE_LOG_FILE)
+            with open(USAGE_LOG_FILE, 'a', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(['time', 'file', 'row', 'company_name', 'company_name_tc', 'email',
+                                     'calls', 'input_tokens', 'output_tokens', 'cost_usd'])
+                writer.writerow([time.strftime('%Y-%m-%d %H:%M:%S'), excel_file, row, company_en, company_tc, email,
+                                 round(usage['calls'], 3), round(usage['input_tokens'], 1),
+                                 round(usage['output_tokens'], 1), f"{usage_cost(usage):.6f}"])
+
+    def close(self):
+        """关闭数据库连接"""
+        if self.conn is not None:
+            with self.lock:
+                self.conn.close()
+
+# 全局用量统计实例，由所有工作线程共享
+usage_tracker = UsageTracker(USAGE_DB_FILE)
+
+# --- 结果日志 ---
+class ResultJournal:
+    """
+    仅追加写入的结果日志（JSONL），每条结果写入后立即 fsync 落盘。
+
+    Excel 只在检查点和任务结束时整体导出，两次导出之间的结果都保存在日志中；
+    程序崩溃或中断后，启动时通过 replay() 把日志中的结果重新应用到数据表上。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 日志文件路径
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, row, company_en: str, company_tc: str, email: str):
+        """
+        追加一条结果并立即落盘。
+
+        Args:
+            row: 数据表中的行索引
+            company_en (str): 公司的英文名称
+            company_tc (str): 公司的中文名称
+            email (str): 查询结果
+        """
+        record = {'row': int(row), 'company_name': company_en, 'company_name_tc': company_tc,
+                  'email': email, 'ts': time.time()}
+        if result_fields(email):
+            record['fields'] = result_fields(email)
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def replay(self, df: pd.DataFrame) -> int:
+        """
+        把日志中的结果应用到数据表上，用于恢复上次未导出的进度。
+
+        公司名称与当前表格不一致的记录（例如表格已被编辑）会被忽略，
+        末尾因崩溃而写了一半的行也会被跳过。
+
+        Args:
+            df (pd.DataFrame): 数据表
+
+        Returns:
+            int: 成功应用的记录数
+        """
+        applied = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                row = record.get('row')
+                if row not in df.index:
+                    continue
+                if get_company_names(df, row) != (record.get('company_name', ''), record.get('company_name_tc', '')):
+                    continue
+                store_result(df, row, record['email'], record.get('fields', {}))
+                applied += 1
+        return applied
+
+    def reset(self):
+        """清空日志（在结果已完整导出到Excel后调用）"""
+        with self.lock:
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """关闭日志文件"""
+        with self.lock:
+            self.file.close()
+
+def journal_path(excel_file: str, sheet_name: str) -> str:
+    """返回输入文件和工作表对应的结果日志路径（各工作表的日志互不影响）"""
+    return f"{os.path.splitext(excel_file)[0]}_{sheet_name}_journal.jsonl"
+
+def add_missing_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """为旧版本创建的数据表补充新增的列"""
+    if column not in [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# --- 分片租约 ---
+class ShardStore:
+    """
+    多进程/多机分片处理使用的共享 SQLite 存储。
+
+    待处理的行被切分为若干区间（每个区间 SHARD_RANGE_SIZE 行），工作进程通过租约认领区间，
+    处理期间定期续约；租约过期（例如工作进程崩溃）的区间会被其他进程重新认领。
+    每条查询结果立即写入 results 表，最后由合并步骤统一写回输入文件。
+    """
+
+    def __init__(self, path: str, lease_seconds: float):
+        """
+        Args:
+            path (str): 共享数据库文件路径（多机运行时应位于共享文件系统上）
+            lease_seconds (float): 租约有效期（秒）
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        # 使用自动提交模式，需要原子性的操作显式执行 BEGIN IMMEDIATE；
+        # 主线程与续约线程共享同一个连接，所有访问都由 self.lock 串行化
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shard_ranges ("
+            "range_id INTEGER PRIMARY KEY, rows TEXT NOT NULL, owner TEXT, "
+            "lease_expires REAL NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shard_results ("
+            "row INTEGER PRIMARY KEY, company_name TEXT NOT NULL, company_name_tc TEXT NOT NULL, "
+            "email TEXT NOT NULL, worker TEXT NOT NULL, ts REAL NOT NULL, fields TEXT NOT NULL DEFAULT '{}')"
+        )
+        add_missing_column(self.conn, 'shard_results', 'fields', "TEXT NOT NULL DEFAULT '{}'")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS shard_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def initialize(self, rows: list, range_size: int, job: dict = None) -> bool:
+        """
+        首次运行时把待处理的行切分为区间；其他进程已初始化时不做任何修改。
+
+        Args:
+            rows (list): 待处理的行索引（按行顺序）
+            range_size (int): 每个区间的行数
+            job (dict): 描述本次任务的键值（输入文件、工作表、处理对象），与区间一起保存，供之后打开时校验
+
+        Returns:
+            bool: 本进程是否执行了初始化
+        """
+        range_size = max(1, range_size)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.conn.execute("SELECT 1 FROM shard_meta WHERE key = 'initialized'").fetchone():
+                    self.conn.execute("COMMIT")
+                    return False
+                self.conn.executemany(
+                    "INSERT INTO shard_ranges (rows) VALUES (?)",
+                    [(json.dumps([int(row) for row in rows[i:i + range_size]]),) for i in range(0, len(rows), range_size)]
+                )
+                self.conn.executemany("INSERT INTO shard_meta (key, value) VALUES (?, ?)",
+                                      [(f"job.{key}", str(value)) for key, value in (job or {}).items()])
+                self.conn.execute("INSERT INTO shard_meta (key, value) VALUES ('initialized', ?)", (str(time.time()),))
+                self.conn.execute("COMMIT")
+                return True
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def mismatched(self, job: dict) -> list:
+        """
+        检查分片存储是否属于给定的任务。
+
+        Args:
+            job (dict): 当前任务的键值，与 initialize() 的 job 参数相同
+
+        Returns:
+            list: 与保存的值不一致的键；旧版本创建的存储中没有保存的键不做检查
+        """
+        with self.lock:
+            stored = dict(self.conn.execute("SELECT key, value FROM shard_meta WHERE key LIKE 'job.%'").fetchall())
+        return [key for key, value in job.items() if stored.get(f"job.{key}", str(value)) != str(value)]
+
+    def claim(self, worker_id: str):
+        """
+        认领一个未完成且没有有效租约的区间。
+
+        Args:
+            worker_id (str): 工作进程标识
+
+        Returns:
+            tuple | None: (区间编号, 行索引列表)，没有可认领的区间时返回 None
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT range_id, rows FROM shard_ranges WHERE done = 0 AND lease_expires < ? "
+                    "ORDER BY range_id LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE shard_ranges SET owner = ?, lease_expires = ? WHERE range_id = ?",
+                        (worker_id, now + self.lease_seconds, row[0])
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def renew(self, range_id: int, worker_id: str) -> bool:
+        """
+        续约区间。
+
+        Returns:
+            bool: 续约是否成功；租约已被其他进程接管时返回 False
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE shard_ranges SET lease_expires = ? WHERE range_id = ? AND owner = ? AND done = 0",
+                (time.time() + self.lease_seconds, range_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, range_id: int, worker_id: str):
+        """把区间标记为已完成"""
+        with self.lock:
+            self.conn.execute("UPDATE shard_ranges SET done = 1 WHERE range_id = ? AND owner = ?", (range_id, worker_id))
+
+    def save_result(self, row, company_en: str, company_tc: str, email: str, worker_id: str):
+        """保存一条查询结果"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO shard_results (row, company_name, company_name_tc, email, worker, ts, fields) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (int(row), company_en, company_tc, email, worker_id, time.time(),
+                 json.dumps(result_fields(email), ensure_ascii=False))
+            )
+
+    def stored_rows(self, rows: list) -> set:
+        """返回给定的行中已经保存了查询结果的行（重新认领的区间不必再次查询这些行）"""
+        rows = [int(row) for row in rows]
+        with self.lock:
+            stored = set()
+            # 分批查询，避免超过 SQLite 的参数个数限制
+            for i in range(0, len(rows), 500):
+                chunk = rows[i:i + 500]
+                stored.update(row for (row,) in self.conn.execute(
+                    f"SELECT row FROM shard_results WHERE row IN ({','.join('?' * len(chunk))})", chunk))
+        return stored
+
+    def results(self) -> list:
+        """返回所有查询结果：[(行索引, 英文名, 中文名, 邮箱, 额外字段), ...]"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT row, company_name, company_name_tc, email, fields FROM shard_results ORDER BY row"
+            ).fetchall()
+        return [(row, company_en, company_tc, email, json.loads(fields)) for row, company_en, company_tc, email, fields in rows]
+
+    def pending_count(self) -> int:
+        """返回尚未完成的区间数"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM shard_ranges WHERE done = 0").fetchone()[0]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+# --- 处理顺序 ---
+def prioritize_rows(df: pd.DataFrame, indices: list, attempts: dict) -> list:
+    """
+    按优先级列、PRIORITY_HEURISTICS 中的启发式规则和原有顺序对待处理的行排序。
+
+    Args:
+        df (pd.DataFrame): 数据表
+        indices (list): 待处理的行索引
+        attempts (dict): {行索引: 已尝试查询的次数}，缺少的行按 0 次计
+
+    Returns:
+        list: 排序后的行索引
+    """
+    if not indices:
+        return []
+    keys = pd.DataFrame({'position': range(len(indices))}, index=pd.Index(indices))
+    columns, ascending = [], []
+    if PRIORITY_COL and PRIORITY_COL in df.columns:
+        # 非数值或空白的优先级排在最后
+        keys['priority'] = pd.to_numeric(df.loc[indices, PRIORITY_COL], errors='coerce').to_numpy()
+        columns.append('priority')
+        ascending.append(not PRIORITY_DESCENDING)
+    for heuristic in PRIORITY_HEURISTICS:
+        if heuristic == 'fewest_attempts':
+            keys['fewest_attempts'] = [attempts.get(index, 0) for index in indices]
+        else:
+            has_name = [df.loc[indices, column].fillna('').astype(str).str.strip().ne('').to_numpy()
+                        if column in df.columns else np.zeros(len(indices), dtype=bool)
+                        for column in (COMPANY_NAME_EN_COL, COMPANY_NAME_TC_COL)]
+            keys['both_names'] = ~(has_name[0] & has_name[1])
+        columns.append(heuristic)
+        ascending.append(True)
+    return keys.sort_values(columns + ['position'], ascending=ascending + [True], kind='stable',
+                            na_position='last').index.tolist()
+
+class TaskQueue:
+    """
+    持久化的处理队列（SQLite），保存每行的处理顺序、已尝试次数和是否仍待处理。
+
+    一次处理（同一菜单选项）被中断或因预算停止后，再次运行时沿用上次的顺序继续，
+    而不是按当时的表格状态重新排序；已尝试次数跨运行累计，供 fewest_attempts 规则使用。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 队列数据库文件路径
+        """
+        self.path = path
+        self.resumed = 0  # 最近一次 order() 中沿用上次顺序的行数
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS task_queue ("
+            "row INTEGER PRIMARY KEY, company_name TEXT NOT NULL, company_name_tc TEXT NOT NULL, "
+            "position INTEGER NOT NULL, choice TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "pending INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def order(self, df: pd.DataFrame, indices: list, choice: str, previously_attempted: pd.Series,
+              reorder: bool = True) -> list:
+        """
+        确定本次处理的行顺序并保存。
+
+        上次同一菜单选项的队列中仍待处理的行按原来的顺序排在最前，其余行按 prioritize_rows 排在后面；
+        没有未完成的队列时全部重新排序。公司名称已变化的行视为新行。
+
+        Args:
+            df (pd.DataFrame): 数据表
+            indices (list): 本次待处理的行索引
+            choice (str): 菜单选项
+            previously_attempted (pd.Series): 表格中已有结果（包括错误结果）的行，队列中没有记录时按尝试过 1 次计
+            reorder (bool): 为 False 时其余行保持传入的顺序（如菜单选项 4 已按评分排好序）
+
+        Returns:
+            list: 排序后的行索引
+        """
+        with self.lock:
+            saved = {row: values for row, *values in self.conn.execute(
+                "SELECT row, company_name, company_name_tc, position, choice, attempts, pending FROM task_queue")}
+        saved = {row: values for row, values in saved.items()
+                 if row in df.index and get_company_names(df, row) == (values[0], values[1])}
+        attempts = {index: saved[index][4] if index in saved else int(bool(previously_attempted.get(index, False)))
+                    for index in indices}
+        resumable = sorted((index for index in indices
+                            if index in saved and saved[index][5] and saved[index][3] == choice),
+                           key=lambda index: saved[index][2])
+        resumed = set(resumable)
+        rest = [index for index in indices if index not in resumed]
+        ordered = resumable + (prioritize_rows(df, rest, attempts) if reorder else rest)
+        self.resumed = len(resumable)
+
+        records = {row: (company_en, company_tc, position, saved_choice, count, 0)
+                   for row, (company_en, company_tc, position, saved_choice, count, _) in saved.items()}
+        for position, index in enumerate(ordered):
+            records[index] = (*get_company_names(df, index), position, choice, attempts[index], 1)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM task_queue")
+                self.conn.executemany(
+                    "INSERT INTO task_queue (row, company_name, company_name_tc, position, choice, attempts, pending) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", [(int(row),) + values for row, values in records.items()]
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ordered
+
+    def mark_done(self, rows: list):
+        """记录这些行已尝试查询一次（无论结果如何），不再待处理"""
+        with self.lock:
+            self.conn.executemany("UPDATE task_queue SET attempts = attempts + 1, pending = 0 WHERE row = ?",
+                                  [(int(row),) for row in rows])
+
+    def reset(self):
+        """清空队列和已尝试次数（重新开始时调用）"""
+        with self.lock:
+            self.conn.execute("DELETE FROM task_queue")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+def task_queue_path(excel_file: str, sheet_name: str) -> str:
+    """返回输入文件和工作表对应的处理队列路径"""
+    return f"{os.path.splitext(excel_file)[0]}_{sheet_name}_queue.sqlite"
+
+# --- 查询缓存 ---
+def normalize_company_name(name: str) -> str:
+    """
+    规范化公司名称，作为缓存键使用。
+
+    统一全角/半角字符（NFKC）、大小写，并合并多余空白。
+
+    Args:
+        name (str): 原始公司名称
+
+    Returns:
+        str: 规范化后的名称
+    """
+    return ' '.join(unicodedata.normalize('NFKC', name or '').casefold().split())
+
+class LookupCache:
+    """
+    基于 SQLite 的本地查询缓存：(英文名, 中文名) -> 邮箱 / "Not Found"。
+
+    每条记录保存写入时间和最近使用时间；已找到与未找到的结果使用不同的有效期，
+    条目数超过上限时按最近使用时间淘汰。同时统计本次运行的命中与未命中次数。
+    """
+
+    def __init__(self, path: str, ttl_found_days: float, ttl_not_found_days: float, max_entries: int):
+        """
+        Args:
+            path (str): 缓存数据库文件路径
+            ttl_found_days (float): 已找到邮箱的有效期（天）
+            ttl_not_found_days (float): "Not Found" 结果的有效期（天）
+            max_entries (int): 最大条目数
+        """
+        self.ttl_found_seconds = ttl_found_days * 86400
+        self.ttl_not_found_seconds = ttl_not_found_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.puts_since_eviction = 0
+        self.lock = threading.Lock()
+        # 工作线程共享同一个连接，所有访问都由 self.lock 串行化；
+        # 分片模式下多个进程共享同一个缓存文件，等待写锁的时间与用量数据库一致
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS lookup_cache ("
+            "name_en TEXT NOT NULL, name_tc TEXT NOT NULL, result TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used_at REAL NOT NULL, fields TEXT NOT NULL DEFAULT '{}', "
+            "PRIMARY KEY (name_en, name_tc))"
+        )
+        add_missing_column(self.conn, 'lookup_cache', 'fields', "TEXT NOT NULL DEFAULT '{}'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_lookup_cache_last_used ON lookup_cache (last_used_at)")
+        self.conn.commit()
+
+    def get(self, company_en: str, company_tc: str, accept_not_found: bool = True):
+        """
+        查询缓存。
+
+        Args:
+            company_en (str): 公司的英文名称
+            company_tc (str): 公司的中文名称
+            accept_not_found (bool): 是否接受缓存中的 "Not Found" 结果
+
+        Returns:
+            str | None: 命中时返回缓存结果（带额外字段时为 LookupResult），未命中、已过期
+                        或缺少 EXTRACT_FIELDS 中的字段时返回 None
+        """
+        key = (normalize_company_name(company_en), normalize_company_name(company_tc))
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, created_at, fields FROM lookup_cache WHERE name_en = ? AND name_tc = ?", key
+            ).fetchone()
+            if row is not None:
+                result, created_at, fields = row
+                fields = json.loads(fields)
+                ttl = self.ttl_not_found_seconds if result == "Not Found" else self.ttl_found_seconds
+                if now - created_at > ttl:
+                    # 已过期，删除后按未命中处理
+                    self.conn.execute("DELETE FROM lookup_cache WHERE name_en = ? AND name_tc = ?", key)
+                    self.conn.commit()
+                    row = None
+                elif result == "Not Found" and not accept_not_found:
+                    row = None
+                elif not set(EXTRACT_FIELDS) <= set(fields):
+                    # 只查过邮箱的旧结果不含需要提取的字段，需要重新查询
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE lookup_cache SET last_used_at = ? WHERE name_en = ? AND name_tc = ?", (now,) + key
+            )
+            self.conn.commit()
+            self.hits += 1
+            return LookupResult(result, fields) if fields else result
+
+    def put(self, company_en: str, company_tc: str, result: str):
+        """
+        写入缓存，错误结果不会被缓存。
+
+        Args:
+            company_en (str): 公司的英文名称
+            company_tc (str): 公司的中文名称
+            result (str): 邮箱地址或 "Not Found"（LookupResult 的额外字段一并缓存）
+        """
+        if not result or result.startswith("Error:"):
+            return
+        key = (normalize_company_name(company_en), normalize_company_name(company_tc))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lookup_cache (name_en, name_tc, result, created_at, last_used_at, fields) "
+                "VALUES (?, ?, ?, ?, ?, ?)", key + (result, now, now, json.dumps(result_fields(result), ensure_ascii=False))
+            )
+            # 每写入 CACHE_EVICT_INTERVAL 条检查一次容量，避免每次写入都统计条目数
+            self.puts_since_eviction += 1
+            if self.puts_since_eviction >= CACHE_EVICT_INTERVAL:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """超出容量时淘汰最久未使用的条目（调用方须持有 self.lock）"""
+        self.conn.execute(
+            "DELETE FROM lookup_cache WHERE rowid IN ("
+            "SELECT rowid FROM lookup_cache ORDER BY last_used_at "
+            "LIMIT MAX(0, (SELECT COUNT(*) FROM lookup_cache) - ?))", (self.max_entries,)
+        )
+        self.puts_since_eviction = 0
+
+    def invalidate(self, company_en: str, company_tc: str):
+        """删除一家公司的缓存结果（例如重新查询疑似错误的结果之前）"""
+        key = (normalize_company_name(company_en), normalize_company_name(company_tc))
+        with self.lock:
+            self.conn.execute("DELETE FROM lookup_cache WHERE name_en = ? AND name_tc = ?", key)
+            self.conn.commit()
+
+    def hit_rate(self) -> float:
+        """返回本次运行的缓存命中率（0~1）"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        """关闭缓存数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+# 全局查询缓存实例，由所有工作线程共享
+lookup_cache = LookupCache(LOOKUP_CACHE_FILE, CACHE_TTL_FOUND_DAYS, CACHE_TTL_NOT_FOUND_DAYS, CACHE_MAX_ENTRIES) if LOOKUP_CACHE_ENABLED else None
+
+# --- 公司名称归并 ---
+# 英文名中常见的写法差异，统一为同一种写法
+EN_TOKEN_ALIASES = {
+    'limited': 'ltd',
+    'company': 'co',
+    'corporation': 'corp',
+    'incorporated': 'inc',
+    'international': 'intl',
+    'holding': 'holdings',
+    'enterprise': 'enterprises',
+    'and': '&',
+}
+
+# 中文名中常见的异体字及简体字，统一为香港常用的繁体写法
+TC_VARIANT_TABLE = str.maketrans({
+    '臺': '台', '裏': '裡', '綫': '線', '峯': '峰', '羣': '群', '衞': '衛', '衆': '眾', '啓': '啟',
+    '麪': '麵', '着': '著', '淸': '清', '敎': '教', '爲': '為', '眞': '真',
+    '国': '國', '际': '際', '贸': '貿', '发': '發', '实': '實', '业': '業', '电': '電', '东': '東',
+    '广': '廣', '华': '華', '汇': '匯', '银': '銀', '务': '務', '运': '運', '输': '輸', '机': '機',
+    '设': '設', '计': '計', '网': '網', '络': '絡', '环': '環', '术': '術', '团': '團', '门': '門',
+    '开': '開', '产': '產', '资': '資', '兴': '興', '创': '創', '记': '記', '饮': '飲', '车': '車',
+    '装': '裝', '饰': '飾', '维': '維', '药': '藥', '医': '醫', '疗': '療', '书': '書', '乐': '樂',
+    '马': '馬', '龙': '龍', '湾': '灣', '岛': '島', '庄': '莊', '宝': '寶', '丰': '豐', '联': '聯',
+    '制': '製', '厂': '廠', '贵': '貴', '储': '儲', '仓': '倉', '筑': '築', '伦': '倫', '准': '準',
+})
+
+def canonical_company_name_en(name: str) -> str:
+    """
+    英文名的归并键：在 normalize_company_name 的基础上去掉标点，统一 Ltd/Limited、
+    Hong Kong/H.K. 等写法，并去掉开头的 The。
+
+    Args:
+        name (str): 原始英文名
+
+    Returns:
+        str: 归并键，名称为空时返回空字符串
+    """
+    text = normalize_company_name(name).replace('&', ' & ')
+    tokens = []
+    initials = ''
+    for token in re.findall(r'[^\W_]+|&', text):
+        # 连续的单个字母（如 H.K.、H K）合并为一个词
+        if len(token) == 1 and token.isalpha():
+            initials += token
+            continue
+        if initials:
+            tokens.append(initials)
+            initials = ''
+        tokens.append(token)
+    if initials:
+        tokens.append(initials)
+    text = ' '.join(EN_TOKEN_ALIASES.get(token, token) for token in tokens)
+    text = re.sub(r'\bhong kong\b', 'hk', text)
+    return text[4:] if text.startswith('the ') else text
+
+def canonical_company_name_tc(name: str) -> str:
+    """
+    中文名的归并键：去掉空白和标点（包括括号），并统一常见的异体字和简体字。
+
+    Args:
+        name (str): 原始中文名
+
+    Returns:
+        str: 归并键，名称为空时返回空字符串
+    """
+    text = ''.join(ch for ch in normalize_company_name(name) if ch.isalnum())
+    return text.translate(TC_VARIANT_TABLE)
+
+def cluster_company_rows(df: pd.DataFrame, indices: list) -> dict:
+    """
+    把名称只有写法差异的行归并为同一家公司，每家公司只需查询一次。
+
+    以英文名和中文名的归并键作为分块键建立索引，只在共享同一个键的行之间合并（并查集），
+    不做两两比较。共享英文名键但中文名键互相冲突（都不为空且不同）的行不会合并，中文名键同理。
+
+    Args:
+        df (pd.DataFrame): 数据表
+        indices (list): 待处理的行索引（按处理顺序）
+
+    Returns:
+        dict: {代表行索引: [同一家公司的所有行索引（含代表行）]}，代表行为处理顺序最靠前的成员，按代表行顺序排列
+    """
+    parent = {index: index for index in indices}
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            # 以处理顺序靠前的行作为代表
+            parent[max(root_a, root_b, key=indices_order.get)] = min(root_a, root_b, key=indices_order.get)
+
+    indices_order = {index: position for position, index in enumerate(indices)}
+    keys = {}
+    blocks = {}
+    for index in indices:
+        company_en, company_tc = get_company_names(df, index)
+        key_en, key_tc = canonical_company_name_en(company_en), canonical_company_name_tc(company_tc)
+        keys[index] = (key_en, key_tc)
+        if key_en:
+            blocks.setdefault(('en', key_en), []).append(index)
+        if key_tc:
+            blocks.setdefault(('tc', key_tc), []).append(index)
+
+    for (side, _), members in blocks.items():
+        if len(members) < 2:
+            continue
+        # 分块内另一侧名称的归并键：只有一种非空取值时整块合并，否则只合并另一侧相同的行
+        other = 1 if side == 'en' else 0
+        groups = {}
+        for index in members:
+            groups.setdefault(keys[index][other], []).append(index)
+        non_empty = [key for key in groups if key]
+        if len(non_empty) <= 1:
+            for index in members[1:]:
+                union(members[0], index)
+        else:
+            for key, group in groups.items():
+                if key:
+                    for index in group[1:]:
+                        union(group[0], index)
+
+    clusters = {}
+    for index in indices:
+        clusters.setdefault(find(index), []).append(index)
+    return clusters
+
+# --- 分层解析 ---
+class TierStats:
+    """记录单个解析层的调用次数、命中次数和累计耗时（线程安全）"""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): 解析层名称
+        """
+        self.name = name
+        self.calls = 0
+        self.hits = 0
+        self.total_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, hits: int, seconds: float, calls: int = 1):
+        """
+        记录一次（或一批）解析结果。
+
+        Args:
+            hits (int): 命中数量
+            seconds (float): 耗时（秒）
+            calls (int): 解析的公司数量
+        """
+        with self.lock:
+            self.calls += calls
+            self.hits += hits
+            self.total_seconds += seconds
+
+    def summary(self) -> str:
+        """返回用于日志输出的统计摘要"""
+        hit_rate = self.hits / self.calls if self.calls else 0.0
+        average_ms = self.total_seconds / self.calls * 1000 if self.calls else 0.0
+        return f"{self.name}: 命中 {self.hits}/{self.calls} ({hit_rate:.1%}), 平均耗时 {average_ms:.1f} 毫秒"
+
+class CompanyDirectory:
+    """
+    本地公司名录：已知公司的邮箱和官网，按规范化后的名称建立索引。
+
+    名录文件为 .csv 或 .sqlite（表名 companies），列为 company_name、company_name_tc、
+    email、website，后两列至少填写一项。查找时依次尝试 (英文名, 中文名)、英文名、中文名精确匹配。
+    """
+
+    COLUMNS = ('company_name', 'company_name_tc', 'email', 'website')
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 名录文件路径
+        """
+        self.by_pair = {}
+        self.by_en = {}
+        self.by_tc = {}
+        for company_en, company_tc, email, website in self._iter_rows(path):
+            entry = ((email or '').strip(), (website or '').strip())
+            if not any(entry):
+                continue
+            key_en = normalize_company_name(company_en)
+            key_tc = normalize_company_name(company_tc)
+            self.by_pair[(key_en, key_tc)] = entry
+            if key_en:
+                self.by_en.setdefault(key_en, entry)
+            if key_tc:
+                self.by_tc.setdefault(key_tc, entry)
+
+    def _iter_rows(self, path: str):
+        """逐行读取名录文件，返回 (英文名, 中文名, 邮箱, 官网)"""
+        if os.path.splitext(path)[1].lower() in ('.sqlite', '.db'):
+            conn = sqlite3.connect(path)
+            try:
+                yield from conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM companies")
+            finally:
+                conn.close()
+        else:
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    yield tuple(row.get(column) for column in self.COLUMNS)
+
+    def find(self, company_en: str, company_tc: str):
+        """
+        查找公司。
+
+        Returns:
+            tuple | None: (邮箱, 官网)，未收录时返回 None
+        """
+        key_en = normalize_company_name(company_en)
+        key_tc = normalize_company_name(company_tc)
+        return (self.by_pair.get((key_en, key_tc))
+                or (self.by_en.get(key_en) if key_en else None)
+                or (self.by_tc.get(key_tc) if key_tc else None))
+
+def directory_result(email: str, website: str) -> str:
+    """名录命中的结果：需要提取官网字段时一并带上名录中的官网"""
+    if 'website' in EXTRACT_FIELDS and website:
+        return LookupResult(email, {'website': website})
+    return email
+
+class ResolverTier:
+    """本地解析层基类，子类实现 lookup()，未命中时返回 None"""
+
+    name = 'base'
+
+    def __init__(self):
+        self.stats = TierStats(self.name)
+
+    def lookup(self, company_en: str, company_tc: str):
+        """解析单家公司，由子类实现"""
+        raise NotImplementedError
+
+    def resolve(self, company_en: str, company_tc: str):
+        """解析单家公司并记录命中率与耗时"""
+        started = time.perf_counter()
+        result = self.lookup(company_en, company_tc)
+        self.stats.record(int(result is not None), time.perf_counter() - started)
+        return result
+
+class DirectoryResolver(ResolverTier):
+    """在本地公司名录中精确查找已知邮箱"""
+
+    name = 'directory'
+
+    def __init__(self, directory: CompanyDirectory):
+        super().__init__()
+        self.directory = directory
+
+    def lookup(self, company_en: str, company_tc: str):
+        entry = self.directory.find(company_en, company_tc)
+        if entry and EMAIL_PATTERN.fullmatch(entry[0]):
+            return directory_result(entry[0], entry[1])
+        return None
+
+class DomainRuleResolver(ResolverTier):
+    """名录中只有官网时，按规则从官网域名推导邮箱（如 info@example.com）"""
+
+    name = 'domain_rule'
+
+    def __init__(self, directory: CompanyDirectory, prefix: str):
+        super().__init__()
+        self.directory = directory
+        self.prefix = prefix
+
+    def lookup(self, company_en: str, company_tc: str):
+        entry = self.directory.find(company_en, company_tc)
+        if not entry or not entry[1]:
+            return None
+        website = entry[1] if '://' in entry[1] else f"http://{entry[1]}"
+        domain = (urllib.parse.urlsplit(website).hostname or '').lower()
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        if '.' not in domain:
+            return None
+        return directory_result(f"{self.prefix}@{domain}", entry[1])
+
+def create_resolver_tiers() -> list:
+    """按配置创建本地解析层，顺序即解析顺序（从便宜到昂贵）"""
+    if not COMPANY_DIRECTORY_FILE:
+        return []
+    directory = CompanyDirectory(COMPANY_DIRECTORY_FILE)
+    tiers = [DirectoryResolver(directory)]
+    if DOMAIN_RULE_ENABLED:
+        tiers.append(DomainRuleResolver(directory, DOMAIN_EMAIL_PREFIX))
+    return tiers
+
+# 全局本地解析层，以及Gemini层（最后一层）的统计
+resolver_tiers = create_resolver_tiers()
+gemini_tier_stats = TierStats('gemini')
+
+# --- 数据读写 ---
+def read_input_table(path: str, sheet_name: str) -> pd.DataFrame:
+    """
+    以流式方式读取输入文件，只保留公司名称列、结果列（邮箱列及 EXTRACT_FIELDS 对应的列）和优先级列。
+
+    支持 .xlsx（openpyxl 只读模式逐行读取）、.csv 和 .parquet，其余列不会载入内存，
+    因此内存占用只与需要的几列有关。行索引与数据行一一对应（从0开始）。
+
+    Args:
+        path (str): 输入文件路径
+        sheet_name (str): 工作表名称（仅 .xlsx 使用）
+
+    Returns:
+        pd.DataFrame: 包含公司名称列、结果列和优先级列（存在时）的数据表
+    """
+    wanted = [COMPANY_NAME_EN_COL, COMPANY_NAME_TC_COL] + RESULT_COLUMNS + ([PRIORITY_COL] if PRIORITY_COL else [])
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        # 保留空行，使行索引与导出时 csv.reader 逐行读取的位置一致
+        return pd.read_csv(path, usecols=lambda column: column in wanted, dtype=object, skip_blank_lines=False,
+                           keep_default_na=False, na_values=[''], encoding='utf-8-sig')
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        present = [column for column in wanted if column in pq.read_schema(path).names]
+        return pd.read_parquet(path, columns=present)
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = next(rows, ())
+        positions = {name: i for i, name in enumerate(header) if name in wanted}
+        columns = {name: [] for name in positions}
+        row_count = 0
+        last_non_empty_row = 0
+        for row in rows:
+            row_count += 1
+            for name, i in positions.items():
+                columns[name].append(row[i] if i < len(row) else None)
+            if any(value is not None for value in row):
+                last_non_empty_row = row_count
+    finally:
+        workbook.close()
+    # 去掉末尾的空行，与 pandas.read_excel 的行为保持一致
+    return pd.DataFrame({name: values[:last_non_empty_row] for name, values in columns.items()}, dtype=object)
+
+def prepare_result_columns(df: pd.DataFrame):
+    """补充数据表中缺少的结果列，并统一转换为 object 类型以便写入字符串（全空的列会被读成浮点类型）"""
+    for column in RESULT_COLUMNS:
+        if column not in df.columns:
+            df[column] = ''
+        df[column] = df[column].astype(object)
+
+def store_result(df: pd.DataFrame, row, email: str, fields: dict = None):
+    """
+    把一条查询结果写入数据表：邮箱写入邮箱列，额外字段写入各自的列。
+
+    Args:
+        df (pd.DataFrame): 数据表
+        row: 行索引
+        email (str): 邮箱列的取值
+        fields (dict): 额外字段，为 None 时取 email 附带的字段
+    """
+    df.at[row, EMAIL_COL] = str(email)
+    for name, value in (result_fields(email) if fields is None else fields).items():
+        column = FIELD_COLUMNS.get(name)
+        if column in df.columns:
+            df.at[row, column] = value
+
+def _merge_result_columns(header: tuple) -> tuple:
+    """返回 (新表头, 各结果列位置)，表头中没有的结果列追加到末尾"""
+    header = list(header)
+    for column in RESULT_COLUMNS:
+        if column not in header:
+            header.append(column)
+    return header, [header.index(column) for column in RESULT_COLUMNS]
+
+def _result_cell(value):
+    """把数据表中的结果值转换为写入文件的单元格值，空值写为空单元格"""
+    return None if pd.isna(value) or value == '' else value
+
+def export_workbook(df: pd.DataFrame, excel_file: str = None, sheet_name: str = None):
+    """
+    将数据表中的结果列（邮箱列及额外字段列）导出到输入文件。
+
+    以流式方式逐行复制原文件并替换（或追加）结果列，其余列与其他工作表原样保留，
+    不需要把整张表载入内存。先写入同目录下的临时文件，再通过 os.replace 原子替换，
+    避免写入过程中崩溃导致原文件损坏。
+
+    Args:
+        df (pd.DataFrame): 数据表
+        excel_file (str): 输入文件路径，默认为 EXCEL_FILE
+        sheet_name (str): 结果列所在的工作表，默认为 SHEET_NAME
+    """
+    started = time.perf_counter()
+    excel_file = excel_file or EXCEL_FILE
+    sheet_name = sheet_name or SHEET_NAME
+    base, ext = os.path.splitext(excel_file)
+    tmp_file = f"{base}.tmp{ext}"
+    # 每行的结果值：[(邮箱, 额外字段...), ...]
+    results = list(zip(*(df[column].tolist() for column in RESULT_COLUMNS)))
+
+    if ext.lower() == '.csv':
+        with open(excel_file, 'r', encoding='utf-8-sig', newline='') as src, \
+                open(tmp_file, 'w', encoding='utf-8', newline='') as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            header, positions = _merge_result_columns(next(reader, ()))
+            writer.writerow(header)
+            for i, row in enumerate(reader):
+                if not row and (i >= len(results) or all(_result_cell(value) is None for value in results[i])):
+                    # 空行原样保留
+                    writer.writerow(row)
+                    continue
+                row += [''] * (len(header) - len(row))
+                if i < len(results):
+                    for pos, value in zip(positions, results[i]):
+                        value = _result_cell(value)
+                        row[pos] = '' if value is None else value
+                writer.writerow(row)
+    elif ext.lower() == '.parquet':
+        # parquet 为列式格式，只能整体重写
+        table = pd.read_parquet(excel_file)
+        for column in RESULT_COLUMNS:
+            table[column] = [_result_cell(value) for value in df[column].tolist()]
+        table.to_parquet(tmp_file, index=False)
+    else:
+        source = openpyxl.load_workbook(excel_file, read_only=True)
+        output = openpyxl.Workbook(write_only=True)
+        try:
+            for name in source.sheetnames:
+                rows = source[name].iter_rows(values_only=True)
+                target = output.create_sheet(name)
+                if name != sheet_name:
+                    # 其他工作表原样复制
+                    for row in rows:
+                        target.append(row)
+                    continue
+                header, positions = _merge_result_columns(next(rows, ()))
+                target.append(header)
+                for i, row in enumerate(rows):
+                    if i >= len(results):
+                        break
+                    row = list(row) + [None] * (len(header) - len(row))
+                    for pos, value in zip(positions, results[i]):
+                        row[pos] = _result_cell(value)
+                    target.append(row)
+            output.save(tmp_file)
+        finally:
+            source.close()
+    os.replace(tmp_file, excel_file)
+    metrics.observe('excel_save_seconds', time.perf_counter() - started)
+
+def classify_email_status(emails: pd.Series) -> pd.Series:
+    """
+    一次向量化计算每行的处理状态。
+
+    Args:
+        emails (pd.Series): 邮箱列
+
+    Returns:
+        pd.Series: 取值为 'success'（已找到邮箱）、'not_found'（"Not Found"）或
+                   'unprocessed'（空白或可重试的错误结果）
+    """
+    unprocessed = emails.isna() | emails.isin(UNPROCESSED_MARKERS)
+    not_found = emails.eq('Not Found')
+    return pd.Series(np.select([unprocessed, not_found], ['unprocessed', 'not_found'], default='success'), index=emails.index)
+
+# --- 结果校验 ---
+def _domain_matches_name(domain: str, name_key: str) -> bool:
+    """
+    判断邮箱域名是否与公司英文名相关：名称中的词出现在域名中、域名是名称的缩写或名称词首字母组成的缩写。
+
+    Args:
+        domain (str): 小写的邮箱域名
+        name_key (str): canonical_company_name_en 生成的英文名归并键
+
+    Returns:
+        bool: 相关或无法判断（名称为空）时返回 True
+    """
+    tokens = [token for token in name_key.split() if token not in COMPANY_SUFFIX_TOKENS]
+    if not tokens:
+        return True
+    labels = [label for label in domain.split('.') if label not in GENERIC_DOMAIN_LABELS]
+    label = ''.join(labels).replace('-', '')
+    if not label:
+        return True
+    if any(len(token) >= 3 and token in label for token in tokens):
+        return True
+    if len(label) >= 3 and label in ''.join(tokens):
+        return True
+    initials = ''.join(token[0] for token in tokens)
+    return len(initials) >= 2 and initials in label
+
+def validate_results(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    对邮箱列做一次整体校验，标记疑似错误的结果并计算重新查询评分。
+
+    格式、占位地址、免费邮箱和重复地址的判断都是按列进行的向量化运算；
+    只有域名与公司名称的比较需要逐行进行，且只针对通过前面检查的邮箱。
+
+    Args:
+        df (pd.DataFrame): 数据表
+
+    Returns:
+        pd.DataFrame: 与 df 行索引一致，每个 SUSPECT_WEIGHTS 标记一列（bool），
+                      以及 score 列（0~1，越高表示越值得重新查询）
+    """
+    emails = df[EMAIL_COL]
+    status = classify_email_status(emails)
+    found = status.eq('success')
+    text = emails.where(found, '').astype(str).str.strip()
+    lower = text.str.lower()
+    parts = lower.str.extract(r'^([^@]*)@(.*)$').fillna('')
+    local, domain = parts[0], parts[1]
+
+    flags = pd.DataFrame(index=df.index)
+    flags['invalid_syntax'] = found & ~text.str.fullmatch(STRICT_EMAIL_PATTERN)
+    flags['junk'] = found & ~flags['invalid_syntax'] & (local.str.contains(JUNK_LOCAL_PATTERN) |
+                                                        domain.str.contains(JUNK_DOMAIN_PATTERN))
+    usable = found & ~flags['invalid_syntax'] & ~flags['junk']
+    flags['free_mail'] = usable & domain.isin(FREE_MAIL_DOMAINS)
+
+    # 同一邮箱对应多家（归并后仍不同的）公司
+    name_en = df[COMPANY_NAME_EN_COL].fillna('').astype(str) if COMPANY_NAME_EN_COL in df.columns else pd.Series('', index=df.index)
+    name_tc = df[COMPANY_NAME_TC_COL].fillna('').astype(str) if COMPANY_NAME_TC_COL in df.columns else pd.Series('', index=df.index)
+    key_en = name_en.map(canonical_company_name_en)
+    company_key = key_en.where(key_en.ne(''), name_tc.map(canonical_company_name_tc))
+    flags['duplicate'] = usable & company_key.where(usable).groupby(lower.where(usable)).transform('nunique').gt(1)
+
+    # 域名与公司英文名是否相关（免费邮箱不比较）
+    check = usable & ~flags['free_mail'] & key_en.ne('')
+    flags['domain_mismatch'] = False
+    if check.any():
+        flags.loc[check, 'domain_mismatch'] = [not _domain_matches_name(d, k) for d, k in zip(domain[check], key_en[check])]
+
+    confidence_col = FIELD_COLUMNS['confidence']
+    if confidence_col in df.columns:
+        flags['low_confidence'] = found & df[confidence_col].astype(str).str.strip().str.lower().eq('low')
+    else:
+        flags['low_confidence'] = False
+    flags['not_found'] = status.eq('not_found')
+
+    flags = flags[list(SUSPECT_WEIGHTS)].astype(bool)
+    weights = np.array([SUSPECT_WEIGHTS[name] for name in flags.columns])
+    flags['score'] = 1 - np.prod(1 - flags.to_numpy() * weights, axis=1)
+    return flags
+
+def rank_requery_candidates(validation: pd.DataFrame, limit: int = None, min_score: float = None) -> pd.DataFrame:
+    """
+    按重新查询评分从高到低选出最值得重新查询的记录（评分相同时按行顺序）。
+
+    Args:
+        validation (pd.DataFrame): validate_results 的返回值
+        limit (int): 最多返回的记录数，默认为 REQUERY_LIMIT
+        min_score (float): 最低评分，默认为 REQUERY_MIN_SCORE
+
+    Returns:
+        pd.DataFrame: 入选的记录（validation 的子集，按评分排序）
+    """
+    limit = REQUERY_LIMIT if limit is None else limit
+    min_score = REQUERY_MIN_SCORE if min_score is None else min_score
+    candidates = validation[validation['score'].ge(min_score) & validation['score'].gt(0)]
+    return candidates.sort_values('score', ascending=False, kind='stable').head(max(0, limit))
+
+def describe_suspect_flags(row: pd.Series) -> str:
+    """把一行的疑似错误标记转换为日志中使用的说明文字"""
+    return '、'.join(label for name, label in SUSPECT_LABELS.items() if row[name])
+
+def describe_suspect_counts(counts: dict) -> str:
+    """把各类疑似错误的数量转换为日志中使用的说明文字"""
+    return ', '.join(f"{SUSPECT_LABELS[name]} {count}" for name, count in counts.items() if count)
+
 # --- 动画函数 ---
 def spinning_cursor(seconds, message=""):
     """
@@ -113,28 +1884,552 @@ if not console_logger.handlers:
     # 将处理器添加到日志记录器
     console_logger.addHandler(console_handler)
 
-# 配置文件日志记录器
-file_logger = logging.getLogger('file_logger')
-if not file_logger.handlers:
-    # 设置日志级别为INFO
-    file_logger.setLevel(logging.INFO)
-    # 创建文件处理器，以写入模式打开，使用UTF-8编码
-    file_handler = logging.FileHandler(LOG_FILE, mode='w', encoding='utf-8')
-    # 设置日志格式：时间 - 消息
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    # 将处理器添加到日志记录器
-    file_logger.addHandler(file_handler)
+# 配置文件日志记录器
+file_logger = logging.getLogger('file_logger')
+if not file_logger.handlers:
+    # 设置日志级别为INFO
+    file_logger.setLevel(logging.INFO)
+    # 创建文件处理器，以写入模式打开，使用UTF-8编码
+    file_handler = logging.FileHandler(LOG_FILE, mode='w', encoding='utf-8')
+    # 设置日志格式：时间 - 消息
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    # 将处理器添加到日志记录器
+    file_logger.addHandler(file_handler)
+
+# --- 查询后端 ---
+class CancellableCall:
+    """
+    一次可被其他线程中止的后端调用。
+
+    后端在调用开始后通过 attach() 登记中止操作（结束子进程、关闭连接），调用结束、
+    资源交还连接池之前通过 detach() 撤销登记；cancel() 会执行已登记的操作，
+    先取消后登记时，登记时立即执行。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.abort = None
+        # 后端返回的实际 token 用量（HTTP 后端的 usageMetadata），为 None 时按文本估算
+        self.input_tokens = None
+        self.output_tokens = None
+
+    def attach(self, abort):
+        """登记中止操作"""
+        with self.lock:
+            self.abort = abort
+            cancelled = self.cancelled
+        if cancelled:
+            abort()
+
+    def detach(self):
+        """撤销登记的中止操作"""
+        with self.lock:
+            self.abort = None
+
+    def cancel(self):
+        """中止调用，对已完成的调用没有影响"""
+        # 在锁内执行中止操作，避免与 detach() 交错后误关闭已交还连接池的连接
+        with self.lock:
+            self.cancelled = True
+            if self.abort is not None:
+                try:
+                    self.abort()
+                except OSError:
+                    pass
+
+class LookupBackend:
+    """
+    查询后端基类：负责把提示词发送给模型并返回原始回复文本。
+
+    子类只需实现 _invoke()，并把失败归类为 QuotaExceededError、RetryableBackendError、
+    BackendTimeoutError 或 BackendError；限速、重试和日志由基类的 run() 统一处理。
+    """
+
+    name = 'base'
+
+    def __init__(self, model: str):
+        """
+        Args:
+            model (str): 使用的模型名称
+        """
+        self.model = model
+        self.latency = LatencyTracker(LATENCY_WINDOW, LATENCY_MIN_SAMPLES)
+
+    def _invoke(self, prompt: str, timeout: float, call: 'CancellableCall') -> str:
+        """
+        执行一次调用并返回回复文本，由子类实现。
+
+        Args:
+            prompt (str): 提示词
+            timeout (float): 本次调用的超时时间（秒）
+            call (CancellableCall): 子类把可中止调用的操作（结束子进程、关闭连接）登记到这里
+        """
+        raise NotImplementedError
+
+    def _timed_invoke(self, prompt: str, timeout: float, call: 'CancellableCall') -> str:
+        """执行 _invoke()，记录调用耗时与结果分类，成功调用的耗时计入耗时统计"""
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            text = self._invoke(prompt, timeout, call)
+            self.latency.record(time.perf_counter() - started)
+            if call.output_tokens is None:
+                call.output_tokens = estimate_tokens(text)
+            return text
+        except BaseException as e:
+            # 对冲请求中落败而被中止的调用单独归类
+            if call.cancelled:
+                outcome = 'cancelled'
+            elif isinstance(e, QuotaExceededError):
+                outcome = 'quota'
+            elif isinstance(e, RetryableBackendError):
+                outcome = 'retryable_error'
+            elif isinstance(e, BackendTimeoutError):
+                outcome = 'timeout'
+                metrics.inc('gemini_timeouts_total', backend=self.name, model=self.model)
+            else:
+                outcome = 'error'
+            raise
+        finally:
+            metrics.observe('gemini_call_seconds', time.perf_counter() - started, backend=self.name, model=self.model)
+            metrics.inc('gemini_calls_total', backend=self.name, model=self.model, outcome=outcome)
+
+    def _call(self, prompt: str, rate_limiter: TokenBucketRateLimiter) -> str:
+        """
+        执行一次调用，超时时间根据最近的调用耗时自适应调整。
+
+        启用对冲请求时，调用超过 HEDGE_PERCENTILE 分位数耗时仍未返回，且限速器中有空闲令牌，
+        则再发起一次相同的调用；先成功返回者胜出，另一次调用随即被中止。
+        两次调用都失败时抛出先发起的那次调用的错误。
+        """
+        timeout = self.latency.timeout()
+        metrics.set('gemini_timeout_seconds', timeout, backend=self.name, model=self.model)
+        hedge_delay = self.latency.hedge_delay()
+        prompt_tokens = estimate_tokens(prompt)
+        # 发起调用前预先计入预算，并发的工作线程不会同时越过上限
+        usage_tracker.reserve(prompt_tokens)
+        calls = []
+        try:
+            if hedge_delay is None:
+                calls.append(CancellableCall())
+                return self._timed_invoke(prompt, timeout, calls[0])
+            return self._hedged_call(prompt, timeout, hedge_delay, rate_limiter, calls)
+        finally:
+            # 每次发出的调用（包括失败和对冲中落败的调用）都补记实际用量
+            for call in calls:
+                usage_tracker.record(prompt_tokens if call.input_tokens is None else call.input_tokens,
+                                     call.output_tokens or 0, prompt_tokens)
+
+    def _hedged_call(self, prompt: str, timeout: float, hedge_delay: float,
+                     rate_limiter: TokenBucketRateLimiter, calls: list) -> str:
+        """执行带对冲请求的调用，发出的调用依次登记到 calls 中（先发起的调用已由 _call() 计入预算）"""
+        outcomes = queue.Queue()
+
+        def launch():
+            call = CancellableCall()
+            calls.append(call)
+
+            def attempt():
+                try:
+                    outcomes.put((call, self._timed_invoke(prompt, timeout, call), None))
+                except BaseException as e:
+                    outcomes.put((call, None, e))
+
+            threading.Thread(target=attempt, daemon=True).start()
+
+        launch()
+        errors = {}
+        try:
+            try:
+                finished = [outcomes.get(timeout=hedge_delay)]
+            except queue.Empty:
+                finished = []
+                # 对冲请求同样消耗配额，只在限速器有空闲令牌且预算未用尽时发起
+                if rate_limiter is None or rate_limiter.try_acquire():
+                    try:
+                        usage_tracker.reserve(estimate_tokens(prompt))
+                    except BudgetExceededError:
+                        pass
+                    else:
+                        launch()
+            while True:
+                for call, text, error in finished:
+                    if error is None:
+                        if len(calls) > 1:
+                            metrics.inc('hedged_requests_total', winner='hedge' if call is calls[1] else 'primary')
+                        return text
+                    errors[call] = error
+                if len(errors) == len(calls):
+                    raise errors[calls[0]]
+                finished = [outcomes.get()]
+        finally:
+            for call in calls:
+                call.cancel()
+
+    def _pause_before_retry(self, attempt: int):
+        """重试前等待 API_RETRY_DELAY_SECONDS 秒，并计入等待时间"""
+        console_logger.info(f"等待 {API_RETRY_DELAY_SECONDS} 秒后进行第 {attempt + 2} 次重试...")
+        # 显示等待动画
+        spinning_cursor(API_RETRY_DELAY_SECONDS, f"等待 {API_RETRY_DELAY_SECONDS} 秒后进行第 {attempt + 2} 次重试...")
+        # 添加一个空行，避免动画被后续日志覆盖
+        console_logger.info("")
+        metrics.inc('sleep_seconds_total', API_RETRY_DELAY_SECONDS, reason='retry_delay')
+
+    def run(self, prompt: str, rate_limiter: TokenBucketRateLimiter = None) -> tuple:
+        """
+        执行一次提示词，包含网络错误和超时的重试机制。
+
+        Args:
+            prompt (str): 发送给Gemini的提示词
+            rate_limiter (TokenBucketRateLimiter): 可选的限速器，每次实际调用前取得令牌
+
+        Returns:
+            tuple: (回复文本, 错误信息)
+                   - 成功时返回 (text, None)
+                   - 出错时返回 (None, "Error: ..." 格式的错误信息)
+
+        Raises:
+            QuotaExceededError: 当API配额用尽时抛出
+        """
+        attempt = 0
+        try:
+            # 实现重试机制
+            for attempt in range(MAX_API_CALL_RETRIES):
+                # 预算已用尽时停止发起新的调用
+                usage_tracker.check_budget()
+                try:
+                    # 从令牌桶取得令牌后再发起调用（重试同样计入速率）
+                    if rate_limiter is not None:
+                        rate_limiter.acquire()
+                    return self._call(prompt, rate_limiter), None
+                except RetryableBackendError as e:
+                    # 网络连接问题、Gemini错误和5xx错误，进行重试
+                    if attempt < MAX_API_CALL_RETRIES - 1:
+                        # 记录警告信息和重试计划
+                        console_logger.warning(f"API调用错误 (尝试 {attempt + 1}/{MAX_API_CALL_RETRIES}): {e}")
+                        self._pause_before_retry(attempt)
+                        continue
+                    else:
+                        # 达到最大重试次数，记录错误并返回
+                        console_logger.error(f"Gemini Error: 达到最大重试次数 ({MAX_API_CALL_RETRIES} 次)，跳过该记录。原始错误: {e}")
+                        return None, "Error: Gemini call failed"
+                except BackendTimeoutError:
+                    # 处理超时情况
+                    if attempt < MAX_API_CALL_RETRIES - 1:
+                        # 记录超时警告和重试计划
+                        console_logger.warning(f"Gemini调用超时 (尝试 {attempt + 1}/{MAX_API_CALL_RETRIES})")
+                        self._pause_before_retry(attempt)
+                        continue
+                    else:
+                        # 达到最大重试次数，记录超时错误并返回
+                        console_logger.error(f"Gemini调用超时，达到最大重试次数 ({MAX_API_CALL_RETRIES} 次)，跳过该记录")
+                        return None, "Error: Timeout"
+                except BackendError as e:
+                    # 其他Gemini错误，直接记录并返回
+                    console_logger.error(f"Gemini Error: {e}")
+                    return None, "Error: Gemini call failed"
+            # 理论上不会执行到这里，但作为兜底返回
+            return None, "Error: Unknown error after retries"
+        finally:
+            # 记录本次查询的重试次数
+            metrics.observe('lookup_retries', attempt)
+
+class GeminiCliBackend(LookupBackend):
+    """通过 gemini-cli 子进程查询，根据 stderr 文本归类错误"""
+
+    name = 'cli'
+
+    def __init__(self, model: str, api_key: str = ''):
+        """
+        Args:
+            model (str): 使用的模型名称
+            api_key (str): 通过 GEMINI_API_KEY 环境变量传给 gemini-cli 的 API Key，为空时使用登录凭据
+        """
+        super().__init__(model)
+        self.env = {**os.environ, 'GEMINI_API_KEY': api_key} if api_key else None
+
+    # stderr 中出现以下文本时视为可重试的临时错误（网络连接问题、Gemini错误和502错误）
+    RETRYABLE_MARKERS = (
+        "Gemini Error",
+        "Error 502",
+        "Client network socket disconnected",
+        "socket hang up",
+        "ECONNRESET",
+        "ETIMEDOUT",
+        "Premature close",
+        "API Error",
+    )
+
+    def _invoke(self, prompt: str, timeout: float, call: CancellableCall) -> str:
+        # 构造gemini-cli命令
+        command = ['gemini', '-m', self.model]
+        try:
+            # 调用gemini-cli执行搜索任务
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,  # 将提示词通过标准输入传递
+                stdout=subprocess.PIPE,  # 捕获标准输出和错误输出
+                stderr=subprocess.PIPE,
+                text=True,  # 以文本模式处理输出
+                encoding='utf-8',  # 指定编码
+                env=self.env  # 指定凭据时通过环境变量传入
+            )
+        except FileNotFoundError:
+            # 处理gemini-cli未安装的情况
+            console_logger.error("'gemini' 命令未找到。请确保 gemini-cli 已安装并位于系统的 PATH 中。")
+            sys.exit(1)
+        # 对冲请求落败时由其他线程结束子进程
+        call.attach(process.kill)
+        try:
+            stdout, stderr = process.communicate(input=prompt, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            process.kill()
+            process.communicate()
+            raise BackendTimeoutError(f"超过 {timeout:.0f} 秒") from e
+        if process.returncode != 0:
+            # 检测配额错误，需要特殊处理
+            if "Quota exceeded" in stderr or "RESOURCE_EXHAUSTED" in stderr:
+                raise QuotaExceededError("API配额已用尽")
+            if any(marker in stderr for marker in self.RETRYABLE_MARKERS):
+                raise RetryableBackendError(stderr.strip())
+            raise BackendError(stderr.strip() or f"退出码 {process.returncode}")
+        return stdout
+
+class GeminiHttpBackend(LookupBackend):
+    """
+    通过 HTTP 直接请求 Gemini 兼容的 generateContent 接口。
+
+    使用长连接池复用 TCP/TLS 连接，避免每次查询都启动 Node 进程；
+    错误根据 HTTP 状态码归类，而不是匹配 stderr 文本。
+    """
+
+    name = 'http'
+
+    # 可重试的 HTTP 状态码
+    RETRYABLE_STATUS = (408, 500, 502, 503, 504)
+
+    def __init__(self, model: str, base_url: str, api_key: str, pool_size: int):
+        """
+        Args:
+            model (str): 使用的模型名称
+            base_url (str): 接口地址，如 https://generativelanguage.googleapis.com
+            api_key (str): API Key
+            pool_size (int): 连接池大小
+        """
+        super().__init__(model)
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme or 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = f"{parsed.path.rstrip('/')}/v1beta/models/{model}:generateContent"
+        self.api_key = api_key
+        self.pool = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _acquire_connection(self) -> http.client.HTTPConnection:
+        """从连接池取出一个空闲连接，没有空闲连接时新建"""
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            return connection_class(self.host, self.port, timeout=GEMINI_TIMEOUT_SECONDS)
+
+    def _release_connection(self, conn: http.client.HTTPConnection):
+        """把连接放回连接池，连接池已满时关闭"""
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _invoke(self, prompt: str, timeout: float, call: CancellableCall) -> str:
+        body = {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}
+        if GEMINI_API_SEARCH_GROUNDING:
+            body['tools'] = [{'google_search': {}}]
+        headers = {'Content-Type': 'application/json', 'x-goog-api-key': self.api_key}
+
+        conn = self._acquire_connection()
+        # 连接池中的连接可能由之前的调用创建，每次按本次的超时时间重新设置
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        # 对冲请求落败时由其他线程关闭连接，使阻塞中的读取立即返回
+        call.attach(lambda: conn.sock is not None and conn.sock.shutdown(socket.SHUT_RDWR))
+        try:
+            conn.request('POST', self.path, body=json.dumps(body).encode('utf-8'), headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except TimeoutError as e:
+            call.detach()
+            conn.close()
+            raise BackendTimeoutError(f"超过 {timeout:.0f} 秒") from e
+        except (OSError, http.client.HTTPException) as e:
+            # 连接被重置、服务端提前关闭等网络错误
+            call.detach()
+            conn.close()
+            raise RetryableBackendError(f"{type(e).__name__}: {e}") from e
+        call.detach()
+        if response.will_close or call.cancelled:
+            conn.close()
+        else:
+            self._release_connection(conn)
+
+        try:
+            data = json.loads(payload.decode('utf-8')) if payload else {}
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            data = {}
+        if response.status != 200:
+            error = data.get('error', {}) if isinstance(data, dict) else {}
+            detail = f"HTTP {response.status} {error.get('status', '')}: {error.get('message', response.reason)}"
+            if response.status == 429 or error.get('status') == 'RESOURCE_EXHAUSTED':
+                raise QuotaExceededError("API配额已用尽")
+            if response.status in self.RETRYABLE_STATUS:
+                raise RetryableBackendError(detail)
+            raise BackendError(detail)
+
+        # 记录接口返回的实际 token 用量
+        usage_metadata = data.get('usageMetadata') or {}
+        if 'promptTokenCount' in usage_metadata:
+            call.input_tokens = usage_metadata['promptTokenCount']
+            call.output_tokens = usage_metadata.get('candidatesTokenCount', 0)
+        # 拼接第一个候选回复中的所有文本片段
+        candidates = data.get('candidates') or []
+        parts = candidates[0].get('content', {}).get('parts', []) if candidates else []
+        text = ''.join(part.get('text', '') for part in parts)
+        if not text.strip():
+            raise RetryableBackendError("回复为空")
+        return text
+
+def create_lookup_backend(name: str, model: str, api_key: str = '') -> LookupBackend:
+    """
+    根据名称创建查询后端。
+
+    Args:
+        name (str): 'cli' 或 'http'
+        model (str): 使用的模型名称
+        api_key (str): 使用的 API Key
+
+    Returns:
+        LookupBackend: 查询后端实例
+    """
+    if name == 'http':
+        return GeminiHttpBackend(model, GEMINI_API_BASE_URL, api_key, HTTP_POOL_SIZE or MAX_CONCURRENT_TASKS)
+    if name == 'cli':
+        return GeminiCliBackend(model, api_key)
+    raise ValueError(f"未知的查询后端: {name}")
+
+# --- 配额调度 ---
+class QuotaScheduler:
+    """
+    配额感知的调度器：在多个（模型, 凭据）组合之间分配查询。
+
+    每个组合单独记录配额状态。某个组合配额用尽后暂时停用，并按指数退避加随机抖动
+    计算下次探测时间，查询自动切换到下一个可用组合；只有全部组合都不可用时才抛出
+    QuotaExceededError，由主线程等待到最早的探测时间。
+    """
+
+    def __init__(self, backends: list, labels: list, backoff_base_seconds: float, backoff_max_seconds: float):
+        """
+        Args:
+            backends (list): 按优先级排列的查询后端
+            labels (list): 与 backends 对应的显示名称（不包含密钥内容）
+            backoff_base_seconds (float): 首次探测间隔（秒）
+            backoff_max_seconds (float): 探测间隔上限（秒）
+        """
+        self.backends = backends
+        self.labels = labels
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.exhausted_until = [0.0] * len(backends)  # 各组合恢复可用的时间（monotonic）
+        self.quota_failures = [0] * len(backends)  # 各组合连续配额错误次数
+        self.lock = threading.Lock()
+
+    def _pick(self):
+        """返回优先级最高的可用组合编号，没有可用组合时返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            for slot, until in enumerate(self.exhausted_until):
+                if until <= now:
+                    return slot
+        return None
 
-def get_email_from_gemini(company_name_en: str, company_name_tc: str) -> str:
+    def _mark_exhausted(self, slot: int):
+        """记录一次配额错误，按指数退避加抖动计算下次探测时间"""
+        with self.lock:
+            now = time.monotonic()
+            if self.exhausted_until[slot] > now:
+                # 组合已停用：同一次配额事件中其他在途调用的失败不再延长探测时间
+                return
+            self.quota_failures[slot] += 1
+            delay = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (self.quota_failures[slot] - 1))
+            # 随机抖动，避免多个组合在同一时刻集中探测
+            delay *= random.uniform(0.75, 1.25)
+            self.exhausted_until[slot] = now + delay
+        console_logger.warning(f"{self.labels[slot]} 配额已用尽，{delay:.0f} 秒后再探测，切换到其他可用模型/凭据")
+
+    def _mark_ok(self, slot: int):
+        """调用成功，清除该组合的配额错误计数"""
+        with self.lock:
+            if self.quota_failures[slot]:
+                console_logger.info(f"{self.labels[slot]} 配额已恢复")
+            self.quota_failures[slot] = 0
+
+    def next_recovery_in(self) -> float:
+        """返回距离最早一个组合可以再次探测的秒数"""
+        with self.lock:
+            return max(0.0, min(self.exhausted_until) - time.monotonic())
+
+    def run(self, prompt: str, rate_limiter: TokenBucketRateLimiter = None) -> tuple:
+        """
+        使用当前可用的组合执行提示词，配额用尽时自动切换到下一个组合。
+
+        Args:
+            prompt (str): 发送给Gemini的提示词
+            rate_limiter (TokenBucketRateLimiter): 可选的限速器
+
+        Returns:
+            tuple: 与 LookupBackend.run 相同
+
+        Raises:
+            QuotaExceededError: 所有组合的配额均已用尽时抛出
+        """
+        while True:
+            slot = self._pick()
+            if slot is None:
+                raise QuotaExceededError("所有模型/凭据的API配额均已用尽")
+            try:
+                result = self.backends[slot].run(prompt, rate_limiter)
+            except QuotaExceededError:
+                self._mark_exhausted(slot)
+                continue
+            self._mark_ok(slot)
+            return result
+
+def create_quota_scheduler() -> QuotaScheduler:
+    """按 GEMINI_MODELS × GEMINI_API_KEYS 创建调度器，模型优先、凭据其次"""
+    keys = GEMINI_API_KEYS or ['']
+    backends, labels = [], []
+    for model in GEMINI_MODELS:
+        for key_number, key in enumerate(keys, start=1):
+            backends.append(create_lookup_backend(LOOKUP_BACKEND, model, key))
+            labels.append(f"{model} (凭据#{key_number})" if len(keys) > 1 else model)
+    return QuotaScheduler(backends, labels, QUOTA_BACKOFF_BASE_SECONDS, RETRY_INTERVAL_MINUTES * 60)
+
+# 全局查询调度器，由所有工作线程共享
+lookup_scheduler = create_quota_scheduler()
+
+def get_email_from_gemini(company_name_en: str, company_name_tc: str, rate_limiter: TokenBucketRateLimiter = None, accept_cached_not_found: bool = True) -> str:
     """
     调用 gemini-cli 获取公司联系邮箱地址。
     
     该函数通过构造特定提示词并调用Gemini API来搜索公司联系邮箱。
-    实现了重试机制以处理网络波动或API临时错误。
+    调用前先检查本地查询缓存，命中时直接返回，不启动 gemini-cli。
+    实际调用由配额调度器（lookup_scheduler）分派给可用的模型/凭据，网络波动或API临时错误的重试由后端负责。
     
     Args:
         company_name_en (str): 公司的英文名称
         company_name_tc (str): 公司的中文名称
+        rate_limiter (TokenBucketRateLimiter): 可选的限速器，每次实际调用前取得令牌
+        accept_cached_not_found (bool): 是否接受缓存中的 "Not Found" 结果（重试失败记录时为 False）
 
     Returns:
         str: 邮箱地址或错误信息
@@ -145,143 +2440,393 @@ def get_email_from_gemini(company_name_en: str, company_name_tc: str) -> str:
     Raises:
         QuotaExceededError: 当API配额用尽时抛出
     """
-    # 使用公司名称填充提示词模板
-    prompt = PROMPT_TEMPLATE.format(company_name=company_name_en, company_name_tc=company_name_tc)
-    # 构造gemini-cli命令
-    command = ['gemini', '-m', GEMINI_MODEL]
-    
-    # 实现重试机制
-    for attempt in range(MAX_API_CALL_RETRIES):
-        try:
-            # 调用gemini-cli执行搜索任务
-            result = subprocess.run(
-                command,
-                capture_output=True,  # 捕获标准输出和错误输出
-                text=True,  # 以文本模式处理输出
-                check=True,  # 如果返回非零退出码则抛出异常
-                encoding='utf-8',  # 指定编码
-                input=prompt,  # 将提示词作为输入传递
-                timeout=GEMINI_TIMEOUT_SECONDS  # 设置超时时间
-            )
-            # 解析输出结果，取最后一行作为邮箱地址
-            lines = result.stdout.strip().split('\n')
-            return lines[-1].strip() if lines else "Error: No output"
-        except subprocess.CalledProcessError as e:
-            # 检测配额错误，需要特殊处理
-            if "Quota exceeded" in e.stderr or "RESOURCE_EXHAUSTED" in e.stderr:
-                raise QuotaExceededError("API配额已用尽") from e
-            
-            # 检测其他API错误，进行重试
-            # 包括网络连接问题、Gemini错误和502错误
-            if ("Gemini Error" in e.stderr or
-                "Error 502" in e.stderr or
-                "Client network socket disconnected" in e.stderr or
-                "socket hang up" in e.stderr or
-                "ECONNRESET" in e.stderr or
-                "ETIMEDOUT" in e.stderr or
-                "Premature close" in e.stderr or
-                "API Error" in e.stderr):
-                if attempt < MAX_API_CALL_RETRIES - 1:
-                    # 记录警告信息和重试计划
-                    console_logger.warning(f"API调用错误 (尝试 {attempt + 1}/{MAX_API_CALL_RETRIES}): {e.stderr.strip()}")
-                    console_logger.info(f"等待 {API_RETRY_DELAY_SECONDS} 秒后进行第 {attempt + 2} 次重试...")
-                    # 显示等待动画
-                    spinning_cursor(API_RETRY_DELAY_SECONDS, f"等待 {API_RETRY_DELAY_SECONDS} 秒后进行第 {attempt + 2} 次重试...")
-                    # 添加一个空行，避免动画被后续日志覆盖
-                    console_logger.info("")
-                    continue
-                else:
-                    # 达到最大重试次数，记录错误并返回
-                    console_logger.error(f"Gemini Error: 达到最大重试次数 ({MAX_API_CALL_RETRIES} 次)，跳过该记录。原始错误: {e.stderr.strip()}")
-                    return "Error: Gemini call failed"
-            else:
-                # 其他Gemini错误，直接记录并返回
-                console_logger.error(f"Gemini Error: {e.stderr.strip()}")
-                return "Error: Gemini call failed"
-        except subprocess.TimeoutExpired:
-            # 处理超时情况
-            if attempt < MAX_API_CALL_RETRIES - 1:
-                # 记录超时警告和重试计划
-                console_logger.warning(f"Gemini调用超时 (尝试 {attempt + 1}/{MAX_API_CALL_RETRIES})")
-                console_logger.info(f"等待 {API_RETRY_DELAY_SECONDS} 秒后进行第 {attempt + 2} 次重试...")
-                # 显示等待动画
-                spinning_cursor(API_RETRY_DELAY_SECONDS, f"等待 {API_RETRY_DELAY_SECONDS} 秒后进行第 {attempt + 2} 次重试...")
-                # 添加一个空行，避免动画被后续日志覆盖
-                console_logger.info("")
-                continue
-            else:
-                # 达到最大重试次数，记录超时错误并返回
-                console_logger.error(f"Gemini调用超时（{GEMINI_TIMEOUT_SECONDS}秒），达到最大重试次数 ({MAX_API_CALL_RETRIES} 次)，跳过该记录")
-                return "Error: Timeout"
-        except FileNotFoundError:
-            # 处理gemini-cli未安装的情况
-            console_logger.error("'gemini' 命令未找到。请确保 gemini-cli 已安装并位于系统的 PATH 中。")
-            sys.exit(1)
-    # 理论上不会执行到这里，但作为兜底返回
-    return "Error: Unknown error after retries"
+    # 优先查询本地缓存
+    if lookup_cache is not None:
+        cached = lookup_cache.get(company_name_en, company_name_tc, accept_not_found=accept_cached_not_found)
+        if cached is not None:
+            return cached
+    return get_email_from_gemini_uncached(company_name_en, company_name_tc, rate_limiter)
 
-def main():
+def get_email_from_gemini_uncached(company_name_en: str, company_name_tc: str, rate_limiter: TokenBucketRateLimiter = None) -> str:
     """
-    主函数，处理整个公司邮箱搜索流程。
-    
-    执行步骤：
-    1. 读取Excel文件中的公司列表
-    2. 显示当前处理进度和配置信息
-    3. 提供交互式菜单选择处理模式
-    4. 调用Gemini API逐个搜索公司邮箱
-    5. 实时保存结果并生成日志报告
+    跳过缓存查询，直接调用 gemini-cli 查询单家公司，并把结果写入缓存。
+
+    Args:
+        company_name_en (str): 公司的英文名称
+        company_name_tc (str): 公司的中文名称
+        rate_limiter (TokenBucketRateLimiter): 可选的限速器，每次实际调用前取得令牌
+
+    Returns:
+        str: 与 get_email_from_gemini 相同的返回值
+
+    Raises:
+        QuotaExceededError: 当API配额用尽时抛出
     """
-    # 记录开始处理的信息
-    console_logger.info("--- 开始处理 ---")
-    
-    # 打印当前配置信息，方便用户确认设置
+    if EXTRACT_FIELDS:
+        # 需要提取多个字段时使用结构化（JSON）回复，单家公司按只有一项的批量提示词查询
+        stdout, error = lookup_scheduler.run(build_batch_prompt([(company_name_en, company_name_tc)]), rate_limiter)
+        if error:
+            return error
+        email = parse_batch_reply(stdout, 1).get(1, "Error: No output")
+    else:
+        # 使用公司名称填充提示词模板
+        template = COMPACT_PROMPT_TEMPLATE if PROMPT_VARIANT == 'compact' else PROMPT_TEMPLATE
+        prompt = template.format(company_name=company_name_en, company_name_tc=company_name_tc)
+        stdout, error = lookup_scheduler.run(prompt, rate_limiter)
+        if error:
+            return error
+        # 解析输出结果，取最后一行作为邮箱地址（去掉模型可能附带的引号、Markdown标记和句号）
+        lines = stdout.strip().split('\n')
+        email = lines[-1].strip().strip('`*"\'<>.。 ') if stdout.strip() else "Error: No output"
+        # 不是邮箱也不是 "Not Found" 的回复（例如说明文字）按错误处理，不会被当作邮箱保存
+        if not email.startswith("Error:") and email != "Not Found" and not EMAIL_PATTERN.fullmatch(email):
+            console_logger.warning(f"无法解析的回复: {email[:100]}")
+            email = "Error: Invalid output"
+    # 写入缓存，供后续运行和其他工作簿复用
+    if lookup_cache is not None:
+        lookup_cache.put(company_name_en, company_name_tc, email)
+    return email
+
+def build_batch_prompt(companies: list) -> str:
+    """
+    构造批量（JSON）提示词，回复对象中包含邮箱以及 EXTRACT_FIELDS 中的字段。
+
+    Args:
+        companies (list): [(英文名, 中文名), ...]
+
+    Returns:
+        str: 提示词
+    """
+    company_list = "\n".join(
+        f"{number}. 英文名: {company_en} | 中文名: {company_tc}"
+        for number, (company_en, company_tc) in enumerate(companies, start=1)
+    )
+    item_format = '{"id": 编号, "email": "邮箱地址"' + ''.join(
+        f', "{name}": "{FIELD_PROMPT_HINTS[name]}"' for name in EXTRACT_FIELDS) + '}'
+    field_notes = f"\n{'、'.join(EXTRACT_FIELDS)} 找不到时设为空字符串。" if EXTRACT_FIELDS else ''
+    template = COMPACT_BATCH_PROMPT_TEMPLATE if PROMPT_VARIANT == 'compact' else BATCH_PROMPT_TEMPLATE
+    return template.format(company_list=company_list, item_format=item_format, field_notes=field_notes)
+
+def parse_batch_reply(stdout: str, count: int) -> dict:
+    """
+    解析批量查询的JSON回复，并逐家校验结果。
+
+    Args:
+        stdout (str): gemini-cli 的标准输出
+        count (int): 本批公司数量
+
+    Returns:
+        dict: {公司编号(从1开始): 邮箱地址或 "Not Found"}，缺失或格式错误的公司不会出现在结果中；
+              设置了 EXTRACT_FIELDS 时结果为带额外字段的 LookupResult
+    """
+    # 截取输出中的JSON数组部分（兼容模型附带的说明文字或Markdown代码块）
+    start = stdout.find('[')
+    end = stdout.rfind(']')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(stdout[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        company_id = item.get('id')
+        email = item.get('email')
+        if isinstance(company_id, str) and company_id.isdigit():
+            company_id = int(company_id)
+        if not isinstance(company_id, int) or not 1 <= company_id <= count or not isinstance(email, str):
+            continue
+        email = email.strip()
+        # 只接受 "Not Found" 或格式合法的邮箱地址
+        if email == "Not Found" or EMAIL_PATTERN.fullmatch(email):
+            if EXTRACT_FIELDS:
+                email = LookupResult(email, {name: '' if item.get(name) is None else str(item[name]).strip()
+                                             for name in EXTRACT_FIELDS})
+            results[company_id] = email
+    return results
+
+def get_emails_from_gemini_batch(companies: list, rate_limiter: TokenBucketRateLimiter = None, accept_cached_not_found: bool = True) -> list:
+    """
+    通过一次 gemini-cli 调用查询多家公司的联系邮箱。
+
+    缓存命中的公司不会进入批量提示词；批量回复中缺失或格式错误的公司，
+    以及整批调用失败时的全部公司，会自动退回到 get_email_from_gemini 逐个查询。
+
+    Args:
+        companies (list): [(英文名, 中文名), ...]
+        rate_limiter (TokenBucketRateLimiter): 可选的限速器，每次实际调用前取得令牌
+        accept_cached_not_found (bool): 是否接受缓存中的 "Not Found" 结果
+
+    Returns:
+        list: 与 companies 一一对应的查询结果，取值同 get_email_from_gemini
+
+    Raises:
+        QuotaExceededError: 当API配额用尽时抛出
+    """
+    if len(companies) == 1:
+        return [get_email_from_gemini(companies[0][0], companies[0][1], rate_limiter, accept_cached_not_found)]
+
+    results = [None] * len(companies)
+    # 先查询缓存，只把未命中的公司放入批量提示词
+    uncached = []
+    for position, (company_en, company_tc) in enumerate(companies):
+        cached = lookup_cache.get(company_en, company_tc, accept_not_found=accept_cached_not_found) if lookup_cache is not None else None
+        if cached is not None:
+            results[position] = cached
+        else:
+            uncached.append(position)
+
+    if len(uncached) > 1:
+        stdout, error = lookup_scheduler.run(build_batch_prompt([companies[position] for position in uncached]), rate_limiter)
+        parsed = parse_batch_reply(stdout, len(uncached)) if not error else {}
+        for number, position in enumerate(uncached, start=1):
+            if number in parsed:
+                results[position] = parsed[number]
+                if lookup_cache is not None:
+                    lookup_cache.put(companies[position][0], companies[position][1], parsed[number])
+        fallback_count = len(uncached) - len(parsed)
+        if fallback_count:
+            console_logger.warning(f"批量回复中有 {fallback_count}/{len(uncached)} 家公司缺失或格式错误，改为逐个查询")
+
+    # 缺失或格式错误的公司退回单条查询（缓存已在上面查过，这里不再重复计数）
+    for position in uncached:
+        if results[position] is None:
+            company_en, company_tc = companies[position]
+            results[position] = get_email_from_gemini_uncached(company_en, company_tc, rate_limiter)
+    return results
+
+def resolve_locally(company_en: str, company_tc: str):
+    """
+    依次尝试本地解析层（名录、域名规则），返回第一个命中的结果。
+
+    Returns:
+        str | None: 命中时返回邮箱，全部未命中时返回 None
+    """
+    for tier in resolver_tiers:
+        result = tier.resolve(company_en, company_tc)
+        if result is not None:
+            return result
+    return None
+
+def lookup_companies(companies: list, rate_limiter: TokenBucketRateLimiter, quota_ok: threading.Event, accept_cached_not_found: bool = True) -> list:
+    """
+    工作线程中执行的查询任务，一次处理一批（BATCH_SIZE 家）公司。
+
+    先按顺序尝试便宜的本地解析层，只有全部未命中的公司才交给Gemini查询。
+    调用Gemini前先等待配额可用（quota_ok 被置位），实际调用前再从令牌桶中取得令牌，
+    从而保证多个并发线程整体不超过配置的查询速率（本地命中和缓存命中不消耗令牌）。
+
+    Args:
+        companies (list): [(英文名, 中文名), ...]
+        rate_limiter (TokenBucketRateLimiter): 共享的令牌桶限速器
+        quota_ok (threading.Event): 配额可用标志，配额用尽期间被清除
+        accept_cached_not_found (bool): 是否接受缓存中的 "Not Found" 结果
+
+    Returns:
+        tuple: (结果列表, 用量列表)，均与 companies 一一对应；结果取值同 get_email_from_gemini，
+               用量为每家公司分摊到的调用次数和 token 数（本地命中为 0）
+
+    Raises:
+        QuotaExceededError: 当API配额用尽时抛出，由主线程统一处理
+        BudgetExceededError: 当调用次数或 token 数达到预算上限时抛出
+    """
+    results = [resolve_locally(company_en, company_tc) for company_en, company_tc in companies]
+    usages = [empty_usage() for _ in companies]
+    remaining = [position for position, result in enumerate(results) if result is None]
+    if not remaining:
+        return results, usages
+
+    quota_ok.wait()
+    started = time.perf_counter()
+    usage_tracker.begin_scope()
+    try:
+        gemini_results = get_emails_from_gemini_batch([companies[position] for position in remaining], rate_limiter, accept_cached_not_found)
+    finally:
+        batch_usage = usage_tracker.end_scope()
+    found = sum(1 for email in gemini_results if email != "Not Found" and not email.startswith("Error:"))
+    gemini_tier_stats.record(found, time.perf_counter() - started, calls=len(remaining))
+    for position, email in zip(remaining, gemini_results):
+        results[position] = email
+        usages[position] = split_usage(batch_usage, len(remaining))
+    return results, usages
+
+def get_company_names(df: pd.DataFrame, index) -> tuple:
+    """
+    读取指定行的英文名和中文名，缺失时返回空字符串。
+
+    Args:
+        df (pd.DataFrame): 数据表
+        index: 行索引
+
+    Returns:
+        tuple: (英文名, 中文名)
+    """
+    company_en = str(df.at[index, COMPANY_NAME_EN_COL]) if COMPANY_NAME_EN_COL in df.columns and pd.notna(df.at[index, COMPANY_NAME_EN_COL]) else ''
+    company_tc = str(df.at[index, COMPANY_NAME_TC_COL]) if COMPANY_NAME_TC_COL in df.columns and pd.notna(df.at[index, COMPANY_NAME_TC_COL]) else ''
+    return company_en, company_tc
+
+def format_display_name(company_en: str, company_tc: str) -> str:
+    """构造显示名称（中英文结合）"""
+    if company_en and company_tc:
+        return f"{company_en} ({company_tc})"
+    return company_en or company_tc
+
+def wait_for_quota_recovery(company_en: str, company_tc: str, accept_cached_not_found: bool = True) -> str:
+    """
+    所有模型/凭据配额都用尽后的等待与重试逻辑，直到配额恢复并成功查询当前公司。
+
+    等待时间取自调度器中最早的探测时间（指数退避加抖动），而不是固定间隔。
+
+    Args:
+        company_en (str): 公司的英文名称
+        company_tc (str): 公司的中文名称
+        accept_cached_not_found (bool): 是否接受缓存中的 "Not Found" 结果
+
+    Returns:
+        str: 配额恢复后的查询结果
+    """
+    wait_seconds = math.ceil(lookup_scheduler.next_recovery_in())
+    console_logger.error(f"错误：所有模型/凭据的API配额均已用尽！将在 {wait_seconds} 秒后探测恢复...")
+    console_logger.error("您可以：")
+    console_logger.error("1. 等待自动重试")
+    console_logger.error("2. 手动中断程序（Ctrl+C）并稍后重新运行")
+
+    # 自动重试逻辑
+    while True:
+        wait_seconds = math.ceil(lookup_scheduler.next_recovery_in())
+        # 显示等待动画
+        spinning_cursor(wait_seconds, f"配额错误等待中，等待 {wait_seconds} 秒...")
+        metrics.inc('sleep_seconds_total', wait_seconds, reason='quota')
+        metrics.inc('quota_stall_seconds_total', wait_seconds)
+        # 添加一个空行，避免动画被后续日志覆盖
+        console_logger.info("")
+        console_logger.info("探测配额是否恢复...")
+        try:
+            # 重试获取邮箱
+            email = get_email_from_gemini(company_en, company_tc, accept_cached_not_found=accept_cached_not_found)
+            console_logger.info("配额已恢复，继续处理！")
+            return email
+        except QuotaExceededError:
+            # 如果配额仍未恢复，继续等待（调度器已延长下次探测时间）
+            console_logger.error(f"配额仍未恢复，{math.ceil(lookup_scheduler.next_recovery_in())} 秒后再次探测...")
+            continue
+
+def print_config():
+    """打印当前配置信息，方便用户确认设置"""
     config_info = {
-        "Excel 文件": EXCEL_FILE,
-        "工作表名称": SHEET_NAME,
         "公司英文名列": COMPANY_NAME_EN_COL,
         "公司中文名列": COMPANY_NAME_TC_COL,
         "邮箱结果列": EMAIL_COL,
+        "额外提取字段": ', '.join(f"{name}→{FIELD_COLUMNS[name]}" for name in EXTRACT_FIELDS) or '无（只查邮箱）',
         "日志文件": LOG_FILE,
-        "Gemini 模型": GEMINI_MODEL,
-        "配额重试间隔 (分钟)": RETRY_INTERVAL_MINUTES,
-        "任务间隔 (秒)": TASK_INTERVAL_SECONDS,
-        "Gemini 调用超时 (秒)": GEMINI_TIMEOUT_SECONDS,
+        "Gemini 模型": ", ".join(GEMINI_MODELS),
+        "API Key 数量": len(GEMINI_API_KEYS) or "使用 gemini-cli 登录凭据",
+        "查询后端": LOOKUP_BACKEND,
+        "查询缓存": LOOKUP_CACHE_FILE if LOOKUP_CACHE_ENABLED else "已禁用",
+        "名称归并": "启用" if DEDUPE_ENABLED else "已禁用",
+        "重新查询疑似错误": f"最多 {REQUERY_LIMIT} 条，评分 ≥ {REQUERY_MIN_SCORE}",
+        "处理顺序": " -> ".join(([f"{PRIORITY_COL}（{'降序' if PRIORITY_DESCENDING else '升序'}）"] if PRIORITY_COL else [])
+                               + PRIORITY_HEURISTICS + ['行顺序']),
+        "本地解析层": " -> ".join([tier.name for tier in resolver_tiers] + ['gemini']),
+        "配额探测间隔 (秒)": f"{QUOTA_BACKOFF_BASE_SECONDS} ~ {RETRY_INTERVAL_MINUTES * 60}",
+        "并发查询数": MAX_CONCURRENT_TASKS,
+        "限速 (次/分钟)": REQUESTS_PER_MINUTE,
+        "限速突发容量": RATE_LIMIT_BURST,
+        "Gemini 调用超时 (秒)": f"{GEMINI_TIMEOUT_SECONDS}（自适应: p95 × {ADAPTIVE_TIMEOUT_FACTOR}）" if ADAPTIVE_TIMEOUT_ENABLED else GEMINI_TIMEOUT_SECONDS,
+        "对冲请求": f"p{HEDGE_PERCENTILE:g} 耗时后发起" if HEDGE_ENABLED else "已禁用",
     }
     console_logger.info("\n--- 当前配置 ---")
     for key, value in config_info.items():
         console_logger.info(f"- {key}: {value}")
     console_logger.info("----------------\n")
 
+# 处理一个工作表（或分片工作进程）的结束状态
+JOB_DONE = 'done'        # 全部处理完成
+JOB_FAILED = 'failed'    # 出错
+JOB_STOPPED = 'stopped'  # 预算用尽而提前停止，未处理的记录下次运行时继续
+
+def process_workbook(excel_file: str = None, sheet_name: str = None, choice: str = None,
+                     executor: ThreadPoolExecutor = None, rate_limiter: TokenBucketRateLimiter = None) -> str:
+    """
+    处理一个工作表的公司邮箱搜索流程。
+
+    执行步骤：
+    1. 读取输入文件中的公司列表
+    2. 显示当前处理进度
+    3. 根据 choice（未指定时通过交互式菜单）选择处理模式
+    4. 通过工作线程池并发调用Gemini API搜索公司邮箱（令牌桶限速）
+    5. 实时保存结果并生成日志报告
+
+    Args:
+        excel_file (str): 输入文件路径，默认为 EXCEL_FILE
+        sheet_name (str): 工作表名称，默认为 SHEET_NAME
+        choice (str): 菜单选项 '1'（继续）、'2'（重新开始）、'3'（重试 Not Found）或 '4'（重新查询疑似错误），
+                      为 None 时询问用户
+        executor (ThreadPoolExecutor): 共享的工作线程池，为 None 时本次处理单独创建
+        rate_limiter (TokenBucketRateLimiter): 共享的限速器，为 None 时本次处理单独创建
+
+    Returns:
+        str: JOB_DONE（全部处理完成）、JOB_STOPPED（预算用尽，已导出已取得的结果但仍有未处理的记录）或 JOB_FAILED
+    """
+    excel_file = excel_file or EXCEL_FILE
+    sheet_name = sheet_name or SHEET_NAME
+    journal_file = journal_path(excel_file, sheet_name)
+    budget_stopped = False  # 是否因预算用尽而提前停止
+    # 记录开始处理的信息
+    console_logger.info(f"--- 开始处理: {excel_file} [{sheet_name}] ---")
+
     # 初始化变量
     df = None  # DataFrame对象，用于存储Excel数据
+    journal = None  # 结果日志，逐条记录查询结果
+    task_queue = None  # 持久化的处理队列
     tasks_to_process_indices = [] # 存储需要处理的任务索引列表
     current_task_number = 0       # 当前处理的任务编号
     total_tasks_for_run = 0       # 本次运行需要处理的总任务数
+    accept_cached_not_found = True  # 是否接受缓存中的 "Not Found" 结果
+    keep_existing = set()  # 重新查询时结果为 "Not Found" 也保留原邮箱的行
     
     try:
-        # 读取Excel文件
-        df = pd.read_excel(EXCEL_FILE, sheet_name=SHEET_NAME, engine='openpyxl')
+        # 流式读取输入文件，只保留公司名称列和邮箱列
+        df = read_input_table(excel_file, sheet_name)
         total_count = len(df)
-        console_logger.info(f"成功读取文件 '{EXCEL_FILE}', 找到 {total_count} 条记录。")
+        console_logger.info(f"成功读取文件 '{excel_file}', 找到 {total_count} 条记录。")
 
-        # 初始化Email列
-        # 如果Excel文件中不存在Email列，则创建一个空的Email列
-        if EMAIL_COL not in df.columns:
-            df[EMAIL_COL] = ''
+        # 初始化结果列
+        # 如果文件中不存在Email列（或额外字段列），则创建空列
+        prepare_result_columns(df)
+
+        # 从结果日志恢复上次运行中尚未导出到Excel的结果
+        journal = ResultJournal(journal_file)
+        replayed_count = journal.replay(df)
+        if replayed_count:
+            console_logger.info(f"已从结果日志 '{journal_file}' 恢复 {replayed_count} 条未导出的结果。")
 
         # --- 统计当前文件状态 ---
-        # 统计已成功处理的记录数（不包括错误和未找到的结果）
-        initial_processed_success_count = df[df[EMAIL_COL].apply(lambda x: pd.notna(x) and x not in ['', 'Error: No output', 'Error: Gemini call failed', 'Not Found'])].shape[0]
-        # 统计处理失败（未找到邮箱）的记录数
-        initial_not_found_count = df[df[EMAIL_COL] == 'Not Found'].shape[0]
-        # 统计尚未处理的记录数（包括空白和错误结果）
-        initial_unprocessed_count = df[df[EMAIL_COL].isin(['', 'Error: No output', 'Error: Gemini call failed']) | pd.isna(df[EMAIL_COL])].shape[0]
+        # 一次向量化计算每行状态：已处理成功、处理失败（Not Found）、未处理（空白和错误结果）
+        status = classify_email_status(df[EMAIL_COL])
+        unprocessed_mask = status.eq('unprocessed')
+        # 已有结果（包括错误结果）的行视为至少尝试过一次，用于安排处理顺序
+        previously_attempted = df[EMAIL_COL].fillna('').astype(str).str.strip().ne('')
+        status_counts = status.value_counts()
+        initial_processed_success_count = int(status_counts.get('success', 0))
+        initial_not_found_count = int(status_counts.get('not_found', 0))
+        initial_unprocessed_count = int(status_counts.get('unprocessed', 0))
 
         console_logger.info("\n--- 当前数据文件状态 ---")
         console_logger.info(f"  - 已处理成功: {initial_processed_success_count} 家")
         console_logger.info(f"  - 处理失败 (Not Found): {initial_not_found_count} 家")
         console_logger.info(f"  - 未处理 (空白或错误): {initial_unprocessed_count} 家")
         console_logger.info(f"  - 总计记录数: {total_count} 家")
+        # 校验已有结果，统计疑似错误的记录
+        validation = validate_results(df)
+        suspect_counts = {name: int(validation[name].sum()) for name in SUSPECT_WEIGHTS if name != 'not_found'}
+        if any(suspect_counts.values()):
+            console_logger.info(f"  - 疑似错误: {describe_suspect_counts(suspect_counts)}（可选择选项 4 按评分重新查询）")
         console_logger.info("------------------------\n")
 
         # --- 交互式菜单 ---
@@ -291,40 +2836,86 @@ def main():
 
         # 根据当前处理进度显示不同的菜单选项
         if initial_processed_success_count > 0 or initial_not_found_count > 0: # 只要有任何处理进度就显示菜单
-            # 显示菜单选项
-            print("\n检测到已有处理进度:")
-            print("1. 继续上次任务（跳过已完成的记录，重试失败的记录）")
-            print("2. 重新开始（清空所有结果）")
-            print("3. 重试处理失败（Not Found）的记录")
-            # 获取用户选择，如果直接回车则默认选择1
-            choice = input("请选择操作 (默认1): ").strip() or "1"
+            if choice is None:
+                # 显示菜单选项
+                print("\n检测到已有处理进度:")
+                print("1. 继续上次任务（跳过已完成的记录，重试失败的记录）")
+                print("2. 重新开始（清空所有结果）")
+                print("3. 重试处理失败（Not Found）的记录")
+                print(f"4. 重新查询疑似错误的记录（按评分排序，最多 {REQUERY_LIMIT} 条）")
+                # 获取用户选择，如果直接回车则默认选择1
+                choice = input("请选择操作 (默认1): ").strip() or "1"
+            else:
+                console_logger.info(f"检测到已有处理进度，按命令行参数执行选项 {choice}。")
             
             # 根据用户选择执行相应操作
             if choice == "2":
                 # 重新开始：清空所有结果并处理所有记录
-                df[EMAIL_COL] = ''
+                df[RESULT_COLUMNS] = ''
+                journal.reset()
+                previously_attempted[:] = False
                 console_logger.info("已清空所有结果，重新开始处理。")
                 tasks_to_process_indices = df.index.tolist()
                 total_tasks_for_run = len(tasks_to_process_indices)
             elif choice == "3":
                 # 重试失败记录：只处理标记为"Not Found"的记录
-                tasks_to_process_indices = df[df[EMAIL_COL] == 'Not Found'].index.tolist()
+                tasks_to_process_indices = status.index[status.eq('not_found')].tolist()
                 total_tasks_for_run = len(tasks_to_process_indices)
+                # 重试失败记录时不使用缓存中的 "Not Found" 结果
+                accept_cached_not_found = False
                 console_logger.info("将重试处理失败 (Not Found) 的记录。")
+            elif choice == "4":
+                # 重新查询疑似错误的记录：只取评分最高的 REQUERY_LIMIT 条，把配额花在最可能改善的记录上
+                candidates = rank_requery_candidates(validation)
+                tasks_to_process_indices = candidates.index.tolist()
+                total_tasks_for_run = len(tasks_to_process_indices)
+                accept_cached_not_found = False
+                # 格式有效的原邮箱在重新查询仍为 "Not Found" 时保留
+                keep_existing = set(candidates.index[~candidates['invalid_syntax'] & ~candidates['junk'] & ~candidates['not_found']])
+                for index, row in candidates.iterrows():
+                    company_en, company_tc = get_company_names(df, index)
+                    # 疑似错误的结果可能来自缓存，重新查询前先使其失效
+                    if lookup_cache is not None:
+                        lookup_cache.invalidate(company_en, company_tc)
+                    file_logger.info(f"重新查询: {format_display_name(company_en, company_tc)} 原结果: {df.at[index, EMAIL_COL]} "
+                                     f"原因: {describe_suspect_flags(row)} 评分: {row['score']:.2f}")
+                console_logger.info(f"将按评分重新查询 {total_tasks_for_run} 条疑似错误的记录"
+                                    f"（评分不低于 {REQUERY_MIN_SCORE} 的共 {int(validation['score'].ge(REQUERY_MIN_SCORE).sum())} 条）。")
             else: # 默认或选择1
                 # 继续上次任务：重置错误状态记录并继续处理
                 # 重置错误状态以便重试，同时统计本次要处理的数量
-                error_mask = df[EMAIL_COL].isin(['Error: No output', 'Error: Gemini call failed'])
-                df.loc[error_mask, EMAIL_COL] = ''
+                df.loc[unprocessed_mask, EMAIL_COL] = ''
                 console_logger.info("已重置错误状态记录，将继续处理。")
-                # 重新计算本次要处理的数量
-                tasks_to_process_indices = df[df[EMAIL_COL].isin(['', 'Error: No output', 'Error: Gemini call failed']) | pd.isna(df[EMAIL_COL])].index.tolist()
+                # 本次要处理的即为所有未处理记录
+                tasks_to_process_indices = status.index[unprocessed_mask].tolist()
                 total_tasks_for_run = len(tasks_to_process_indices)
         else: # 没有处理进度，直接处理所有未处理的
             # 没有任何处理进度时，处理所有未处理的记录
-            tasks_to_process_indices = df[df[EMAIL_COL].isin(['', 'Error: No output', 'Error: Gemini call failed']) | pd.isna(df[EMAIL_COL])].index.tolist()
+            tasks_to_process_indices = status.index[unprocessed_mask].tolist()
             total_tasks_for_run = len(tasks_to_process_indices)
 
+        # 按优先级排序待处理的行（选项 4 保持评分顺序）；上次未完成的处理沿用原来的顺序
+        task_queue = TaskQueue(task_queue_path(excel_file, sheet_name))
+        if choice == "2":
+            task_queue.reset()
+        tasks_to_process_indices = task_queue.order(df, tasks_to_process_indices, choice or "1", previously_attempted,
+                                                    reorder=choice != "4")
+        if task_queue.resumed:
+            console_logger.info(f"沿用上次未完成的处理顺序：{task_queue.resumed} 行。")
+        if PRIORITY_COL in df.columns and choice != "4":
+            console_logger.info(f"按优先级列 '{PRIORITY_COL}' 排序处理顺序。")
+
+        # 归并只有写法差异的公司（Ltd/Limited、标点、异体字等），每家公司只查询一次，结果写回所有成员行
+        if DEDUPE_ENABLED:
+            clusters = cluster_company_rows(df, tasks_to_process_indices)
+        else:
+            clusters = {index: [index] for index in tasks_to_process_indices}
+        if len(clusters) < len(tasks_to_process_indices):
+            console_logger.info(f"已归并名称相近的公司：{len(tasks_to_process_indices)} 行对应 {len(clusters)} 家公司，"
+                                f"节省 {len(tasks_to_process_indices) - len(clusters)} 次查询。")
+        tasks_to_process_indices = list(clusters)
+        total_tasks_for_run = len(tasks_to_process_indices)
+
         # 重置文件日志
         # 移除旧的文件处理器（如果有），确保日志文件不会重复写入
         for handler in file_logger.handlers[:]:
@@ -350,63 +2941,72 @@ def main():
         not_found_count = 0  # 未找到邮箱的记录数
         success_count = 0    # 成功找到邮箱的记录数
 
-        # 遍历所有需要处理的任务索引
-        for index in tasks_to_process_indices:
-            # 更新当前任务编号
-            current_task_number += 1
+        # 共享的限速器与配额状态：所有工作线程共用同一个令牌桶，
+        # 配额用尽期间清除 quota_ok，阻止其他线程继续发起查询
+        if rate_limiter is None:
+            rate_limiter = TokenBucketRateLimiter(REQUESTS_PER_MINUTE, RATE_LIMIT_BURST)
+        quota_ok = threading.Event()
+        quota_ok.set()
+        # 在途任务窗口：(任务编号, 行索引, 英文名, 中文名, future, 批内位置, 提交时间)，按提交顺序（即处理顺序）排列
+        pending = deque()
+        task_iter = iter(tasks_to_process_indices)
+        batch_size = max(1, BATCH_SIZE)
+        max_in_flight = max(1, MAX_CONCURRENT_TASKS) * batch_size * 2
+        # 最近一次配额恢复的时间，用于判断失败的任务是否可以立即重试
+        last_quota_recovery_at = 0.0
+        owns_executor = executor is None
+        if owns_executor:
+            executor = ThreadPoolExecutor(max_workers=max(1, MAX_CONCURRENT_TASKS))
+        # 检查点计数：距上次导出Excel以来处理的记录数与时间
+        rows_since_checkpoint = 0
+        last_checkpoint_at = time.monotonic()
+        last_metrics_export_at = time.monotonic()
 
-            # 获取公司名称（英文和中文）
-            company_en = str(df.at[index, COMPANY_NAME_EN_COL]) if COMPANY_NAME_EN_COL in df.columns and pd.notna(df.at[index, COMPANY_NAME_EN_COL]) else ''
-            company_tc = str(df.at[index, COMPANY_NAME_TC_COL]) if COMPANY_NAME_TC_COL in df.columns and pd.notna(df.at[index, COMPANY_NAME_TC_COL]) else ''
-            
-            # 确定当前公司名称（优先使用英文名，如果没有则使用中文名）
-            current_company = company_en or company_tc
-            # 如果公司名称为空，则跳过该记录
-            if not current_company:
-                console_logger.info(f"[{current_task_number}/{total_tasks_for_run}] 跳过空行...")
-                continue
+        def fill_pending():
+            """按处理顺序把任务分批提交，直到在途窗口填满或任务耗尽"""
+            nonlocal current_task_number
+            batch = []  # 当前批次：(任务编号, 行索引, 英文名, 中文名)
+            # 空位不足一整批时暂不提交，避免每取回一条就发出一个单条批次
+            if pending and max_in_flight - len(pending) < batch_size:
+                return
 
-            # 构造显示名称（中英文结合）
-            display_name = ""
-            if company_en and company_tc:
-                display_name = f"{company_en} ({company_tc})"
-            elif company_en:
-                display_name = company_en
-            elif company_tc:
-                display_name = company_tc
-            
-            # 记录正在处理的公司信息
-            console_logger.info(f"[{current_task_number}/{total_tasks_for_run}] 正在处理: {display_name}")
-            
-            # 调用Gemini API获取邮箱
-            try:
-                email = get_email_from_gemini(company_en, company_tc)
-            except QuotaExceededError as e:
-                # 处理API配额用尽的情况
-                console_logger.error(f"错误：API每日配额已用尽！将在 {RETRY_INTERVAL_MINUTES} 分钟后重试...")
-                console_logger.error("您可以：")
-                console_logger.error("1. 等待自动重试")
-                console_logger.error("2. 手动中断程序（Ctrl+C）并稍后重新运行")
-                
-                # 自动重试逻辑
-                while True:
-                    # 显示等待动画
-                    spinning_cursor(RETRY_INTERVAL_MINUTES * 60, f"配额错误等待中，等待 {RETRY_INTERVAL_MINUTES} 分钟...")
-                    # 添加一个空行，避免动画被后续日志覆盖
-                    console_logger.info("")
-                    console_logger.info(f"重试中... ({RETRY_INTERVAL_MINUTES}分钟间隔)")
-                    try:
-                        # 重试获取邮箱
-                        email = get_email_from_gemini(company_en, company_tc)
-                        console_logger.info("配额已恢复，继续处理！")
-                        break
-                    except QuotaExceededError:
-                        # 如果配额仍未恢复，继续等待
-                        console_logger.error(f"配额仍未恢复，{RETRY_INTERVAL_MINUTES}分钟后再次重试...")
-                        continue
-                
+            def submit_batch():
+                """提交当前批次，并按行顺序登记到在途窗口"""
+                if not batch:
+                    return
+                companies = [(company_en, company_tc) for _, _, company_en, company_tc in batch]
+                future = executor.submit(lookup_companies, companies, rate_limiter, quota_ok, accept_cached_not_found)
+                submitted_at = time.monotonic()
+                for position, (task_number, index, company_en, company_tc) in enumerate(batch):
+                    pending.append((task_number, index, company_en, company_tc, future, position, submitted_at))
+                batch.clear()
+
+            while len(pending) + len(batch) < max_in_flight:
+                index = next(task_iter, None)
+                if index is None:
+                    break
+                # 更新当前任务编号
+                current_task_number += 1
+                # 获取公司名称（英文和中文）
+                company_en, company_tc = get_company_names(df, index)
+                # 如果公司名称为空，则不提交查询，仅按顺序记录跳过（先提交前面的批次以保持行顺序）
+                if not (company_en or company_tc):
+                    submit_batch()
+                    pending.append((current_task_number, index, company_en, company_tc, None, 0, 0.0))
+                    continue
+                # 记录正在处理的公司信息
+                console_logger.info(f"[{current_task_number}/{total_tasks_for_run}] 正在处理: {format_display_name(company_en, company_tc)}")
+                batch.append((current_task_number, index, company_en, company_tc))
+                if len(batch) >= batch_size:
+                    submit_batch()
+            submit_batch()
+
+        def record_result(task_number, index, company_en: str, company_tc: str, email: str, usage: dict):
+            """保存一家公司的查询结果（写回同一家公司的所有行并追加到结果日志），更新计数并按需导出检查点"""
+            nonlocal not_found_count, success_count, rows_since_checkpoint, last_checkpoint_at, last_metrics_export_at
+            current_company = company_en or company_tc
             # 记录处理结果
-            console_logger.info(f"  -> 结果: {email}")
+            console_logger.info(f"[{task_number}/{total_tasks_for_run}] {format_display_name(company_en, company_tc)} -> 结果: {email}")
             # 处理错误结果
             if email.startswith("Error:"):
                 # 区分API调用错误和超时错误
@@ -415,28 +3015,118 @@ def main():
                 else:
                     console_logger.warning("发生API调用错误，跳过该记录")
             else:
-                # 保存成功结果
-                df.at[index, EMAIL_COL] = email
-            
-            # 更新计数器
+                # 保存成功结果（写回同一家公司的所有行），并立即追加到结果日志
+                for member in clusters[index]:
+                    # 重新查询疑似错误的记录时，"Not Found" 不覆盖格式有效的原邮箱
+                    if email == "Not Found" and member in keep_existing:
+                        continue
+                    store_result(df, member, email)
+                    journal.append(member, *get_company_names(df, member), email)
+            usage_tracker.log_row(excel_file, index, company_en, company_tc, email, usage)
+            task_queue.mark_done(clusters[index])
+
+            # 更新计数器（按行计数，归并的行一并计入）
+            member_count = len(clusters[index])
             if email == "Not Found":
                 # 未找到邮箱
-                not_found_count += 1
+                not_found_count += member_count
                 file_logger.info(f"未找到邮箱: {current_company}")
             elif not email.startswith("Error:"): # 仅当不是错误结果时才计入成功
                 # 成功找到邮箱
-                success_count += 1
-            
-            # 实时保存结果到Excel文件
-            df.to_excel(EXCEL_FILE, index=False, engine='openpyxl')
-            # 显示任务间隔等待动画
-            spinning_cursor(TASK_INTERVAL_SECONDS, f"任务间隔中，等待 {TASK_INTERVAL_SECONDS} 秒...")
-            # 添加一个空行，避免动画被后续日志覆盖
-            console_logger.info("")
+                success_count += member_count
+            metrics.inc('rows_processed_total', member_count, result='error' if email.startswith("Error:") else
+                        'not_found' if email == "Not Found" else 'success')
+
+            # 到达检查点时导出Excel文件，导出成功后清空结果日志
+            rows_since_checkpoint += 1
+            if (rows_since_checkpoint >= EXCEL_CHECKPOINT_ROWS or
+                    time.monotonic() - last_checkpoint_at >= EXCEL_CHECKPOINT_SECONDS):
+                export_workbook(df, excel_file, sheet_name)
+                journal.reset()
+                rows_since_checkpoint = 0
+                last_checkpoint_at = time.monotonic()
+            # 定期刷新指标文件，便于运行期间观察
+            if time.monotonic() - last_metrics_export_at >= METRICS_EXPORT_SECONDS:
+                metrics.export()
+                last_metrics_export_at = time.monotonic()
+
+        try:
+            fill_pending()
+            # 按行顺序取回结果，保证保存和日志顺序与表格一致
+            while pending:
+                task_number, index, company_en, company_tc, future, position, submitted_at = pending.popleft()
+                if future is None:
+                    console_logger.info(f"[{task_number}/{total_tasks_for_run}] 跳过空行...")
+                    task_queue.mark_done([index])
+                    fill_pending()
+                    continue
+
+                try:
+                    emails, usages = future.result()
+                    email, usage = emails[position], usages[position]
+                except QuotaExceededError:
+                    email = None
+                    # 配额恢复期间在主线程中发起的调用，用量单独统计到本行
+                    usage_tracker.begin_scope()
+                    try:
+                        # 任务在上次配额恢复之前提交的，配额可能已经恢复，先直接重试一次
+                        if submitted_at < last_quota_recovery_at:
+                            try:
+                                email = get_email_from_gemini(company_en, company_tc, rate_limiter, accept_cached_not_found)
+                            except QuotaExceededError:
+                                email = None
+                        if email is None:
+                            # 处理API配额用尽的情况：暂停所有工作线程，由主线程等待配额恢复
+                            quota_ok.clear()
+                            try:
+                                email = wait_for_quota_recovery(company_en, company_tc, accept_cached_not_found)
+                            finally:
+                                quota_ok.set()
+                                last_quota_recovery_at = time.monotonic()
+                    finally:
+                        usage = usage_tracker.end_scope()
+
+                record_result(task_number, index, company_en, company_tc, email, usage)
+                # 补充新任务到在途窗口（限速由令牌桶负责，无需固定等待）
+                fill_pending()
+        except BudgetExceededError as e:
+            # 预算用尽：停止提交新任务，导出已取得的结果后提前结束（未处理的记录下次运行继续）
+            budget_stopped = True
+            console_logger.warning(f"预算已用尽，停止处理：{e}")
+            file_logger.info(f"预算已用尽，停止处理：{e}")
+            # 取消尚未开始的查询；已经发出的查询已计入预算，等待其返回并照常保存结果，避免已付费的结果丢失
+            for entry in pending:
+                if entry[4] is not None:
+                    entry[4].cancel()
+            for task_number, index, company_en, company_tc, future, position, _ in pending:
+                if future is None or future.cancelled():
+                    continue
+                try:
+                    emails, usages = future.result()
+                except Exception:
+                    # 同样因预算或配额失败的查询不保存，下次运行时重新查询
+                    continue
+                record_result(task_number, index, company_en, company_tc, emails[position], usages[position])
+            pending.clear()
+        finally:
+            # 中断或出错时取消尚未开始的任务（共享线程池只取消本次提交的任务）
+            if owns_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                for entry in pending:
+                    if entry[4] is not None:
+                        entry[4].cancel()
+
+        # 任务结束，导出最终结果
+        export_workbook(df, excel_file, sheet_name)
+        journal.reset()
 
         # 最终报告
         # 显示处理完成信息
-        console_logger.info("--- 全部处理完成！最终结果已在文件中。 ---")
+        if budget_stopped:
+            console_logger.info("--- 预算已用尽，已取得的结果已导出，未处理的记录下次运行时继续。 ---")
+        else:
+            console_logger.info("--- 全部处理完成！最终结果已在文件中。 ---")
         
         # 记录任务结束时间和处理结果汇总
         end_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -447,27 +3137,459 @@ def main():
         file_logger.info(f"总共处理记录数: {total_count}") # 使用total_count表示本次处理了多少行，无论是否跳过
         file_logger.info(f"  - 成功找到邮箱: {success_count} 家")
         file_logger.info(f"  - 未找到邮箱:   {not_found_count} 家")
+        if lookup_cache is not None:
+            cache_summary = f"缓存命中: {lookup_cache.hits} 次, 未命中: {lookup_cache.misses} 次, 命中率: {lookup_cache.hit_rate():.1%}"
+            console_logger.info(cache_summary)
+            file_logger.info(f"  - {cache_summary}")
+        # 各解析层的命中率与耗时，用于评估本地数据源节省的配额
+        for stats in [tier.stats for tier in resolver_tiers] + [gemini_tier_stats]:
+            console_logger.info(f"解析层 {stats.summary()}")
+            file_logger.info(f"  - 解析层 {stats.summary()}")
+        # 调用次数与 token 用量
+        console_logger.info(usage_tracker.summary())
+        file_logger.info(f"  - {usage_tracker.summary()}")
+        # 耗时分布：等待（限速、重试、配额）与实际调用
+        timing = metrics.to_dict()
+        timing_summary = (f"总耗时 {timing['wall_seconds']:.1f} 秒, 累计等待 {timing['sleep_seconds']:.1f} 秒, "
+                          f"Gemini调用累计 {timing['work_seconds']:.1f} 秒")
+        console_logger.info(timing_summary)
+        file_logger.info(f"  - {timing_summary}")
         file_logger.info("="*70)
+        return JOB_STOPPED if budget_stopped else JOB_DONE
 
     except FileNotFoundError:
         # 处理文件未找到的错误
-        console_logger.error(f"错误：文件 '{EXCEL_FILE}' 未找到。请确保文件在正确的路径下。")
-        sys.exit(1)
+        console_logger.error(f"错误：文件 '{excel_file}' 未找到。请确保文件在正确的路径下。")
+        return JOB_FAILED
     except KeyboardInterrupt:
         # 处理用户中断操作（Ctrl+C）
         console_logger.info("\n用户中断操作，已保存当前进度。")
         if df is not None:
-            # 保存当前进度到Excel文件
-            df.to_excel(EXCEL_FILE, index=False, engine='openpyxl')
+            # 保存当前进度到Excel文件（结果已在日志中，导出成功后再清空日志）
+            export_workbook(df, excel_file, sheet_name)
+            if journal is not None:
+                journal.reset()
         sys.exit(0)
     except Exception as e:
         # 处理其他未预期的错误
         console_logger.error(f"发生未知错误: {e}")
         if df is not None:
-            # 保存当前进度到Excel文件
-            df.to_excel(EXCEL_FILE, index=False, engine='openpyxl')
+            # 保存当前进度到Excel文件（结果已在日志中，导出成功后再清空日志）
+            export_workbook(df, excel_file, sheet_name)
+            if journal is not None:
+                journal.reset()
         else:
             console_logger.error("错误发生时尚未加载数据文件")
+        return JOB_FAILED
+    finally:
+        # 关闭结果日志文件和处理队列
+        if journal is not None:
+            journal.close()
+        if task_queue is not None:
+            task_queue.close()
+        # 导出最终的运行指标
+        try:
+            metrics.export()
+        except OSError as e:
+            console_logger.warning(f"导出运行指标失败: {e}")
+
+def shard_store_path(excel_file: str, sheet_name: str) -> str:
+    """返回输入文件和工作表对应的分片数据库路径"""
+    return SHARD_STORE_FILE or f"{os.path.splitext(excel_file)[0]}_{sheet_name}_shards.sqlite"
+
+def shard_job(excel_file: str, sheet_name: str, choice: str) -> dict:
+    """
+    返回保存在分片存储中、用于校验存储归属的任务描述。
+
+    输入文件只记录文件名，多台机器挂载共享文件系统的路径可以不同。
+    """
+    return {
+        'input_file': os.path.basename(excel_file),
+        'sheet': sheet_name,
+        'target': 'not_found' if choice == '3' else 'unprocessed',
+    }
+
+def process_shard_range(excel_file: str, df: pd.DataFrame, rows: list, clusters: dict, store: ShardStore, range_id: int,
+                        worker_id: str, executor: ThreadPoolExecutor, rate_limiter: TokenBucketRateLimiter,
+                        accept_cached_not_found: bool) -> bool:
+    """
+    处理一个已认领的区间，处理期间由后台线程定期续约。
+
+    Args:
+        excel_file (str): 输入文件路径（用于用量记录）
+        df (pd.DataFrame): 数据表
+        rows (list): 区间内的行索引（每家公司的代表行）
+        clusters (dict): {代表行索引: 同一家公司的所有行索引}，结果写回所有成员行
+        store (ShardStore): 分片存储
+        range_id (int): 区间编号
+        worker_id (str): 工作进程标识
+        executor (ThreadPoolExecutor): 工作线程池
+        rate_limiter (TokenBucketRateLimiter): 限速器
+        accept_cached_not_found (bool): 是否接受缓存中的 "Not Found" 结果
+
+    Returns:
+        bool: 区间是否处理完成；租约被其他进程接管时返回 False
+
+    Raises:
+        BudgetExceededError: 当调用次数或 token 数达到预算上限时抛出（区间保持未完成，租约过期后可被重新认领）
+    """
+    stop = threading.Event()
+    lease_lost = threading.Event()
+
+    def heartbeat():
+        """每隔租约有效期的三分之一续约一次"""
+        while not stop.wait(max(1.0, store.lease_seconds / 3)):
+            if not store.renew(range_id, worker_id):
+                lease_lost.set()
+                return
+
+    renewer = threading.Thread(target=heartbeat, daemon=True)
+    renewer.start()
+    quota_ok = threading.Event()
+    quota_ok.set()
+    futures = []
+    try:
+        # 空行不需要查询；重新认领的区间中已保存结果的行（原持有者已处理）也不再查询
+        stored = store.stored_rows(rows)
+        named_rows = [(row, *get_company_names(df, row)) for row in rows if row not in stored]
+        named_rows = [item for item in named_rows if item[1] or item[2]]
+        batch_size = max(1, BATCH_SIZE)
+        batches = [named_rows[i:i + batch_size] for i in range(0, len(named_rows), batch_size)]
+        futures = [executor.submit(lookup_companies, [(en, tc) for _, en, tc in batch], rate_limiter, quota_ok,
+                                   accept_cached_not_found) for batch in batches]
+
+        def save_batch(batch: list, emails: list, usages: list):
+            """保存一批查询结果（错误结果不保存，合并后仍为未处理状态，下次运行会重试）"""
+            for (row, company_en, company_tc), email, usage in zip(batch, emails, usages):
+                console_logger.info(f"[分片 {range_id}] {format_display_name(company_en, company_tc)} -> 结果: {email}")
+                metrics.inc('rows_processed_total', result='error' if email.startswith("Error:") else
+                            'not_found' if email == "Not Found" else 'success')
+                if not email.startswith("Error:"):
+                    for member in clusters.get(row, [row]):
+                        store.save_result(member, *get_company_names(df, member), email, worker_id)
+                usage_tracker.log_row(excel_file, row, company_en, company_tc, email, usage)
+
+        for position, (batch, future) in enumerate(zip(batches, futures)):
+            try:
+                emails, usages = future.result()
+            except BudgetExceededError:
+                # 预算用尽：取消尚未开始的查询，已经发出（已计入预算）的查询等待其返回并保存结果后再停止
+                for later_future in futures[position + 1:]:
+                    later_future.cancel()
+                for later_batch, later_future in zip(batches[position + 1:], futures[position + 1:]):
+                    if later_future.cancelled():
+                        continue
+                    try:
+                        save_batch(later_batch, *later_future.result())
+                    except Exception:
+                        continue
+                raise
+            except QuotaExceededError:
+                # 所有模型/凭据配额用尽：暂停本进程的工作线程，逐家等待配额恢复
+                quota_ok.clear()
+                usage_tracker.begin_scope()
+                try:
+                    emails = [wait_for_quota_recovery(en, tc, accept_cached_not_found) for _, en, tc in batch]
+                finally:
+                    quota_ok.set()
+                    usages = [split_usage(usage_tracker.end_scope(), len(batch))] * len(batch)
+            save_batch(batch, emails, usages)
+            if lease_lost.is_set():
+                console_logger.warning(f"区间 {range_id} 的租约已被其他进程接管，停止处理该区间")
+                return False
+    finally:
+        # 提前结束（租约被接管、预算用尽）时取消尚未开始的查询
+        for future in futures:
+            future.cancel()
+        stop.set()
+        renewer.join()
+    store.complete(range_id, worker_id)
+    return True
+
+def run_shard_worker(excel_file: str, sheet_name: str, choice: str, executor: ThreadPoolExecutor,
+                     rate_limiter: TokenBucketRateLimiter, worker_id: str = None) -> str:
+    """
+    分片工作进程：从共享分片存储中反复认领区间并查询，直到所有区间都已完成。
+
+    可在同一台机器上启动多个进程，或在共享文件系统的多台机器上运行（每个进程可配置不同的
+    GEMINI_API_KEYS）。输入文件在合并前不会被修改，各进程独立读取。
+
+    Args:
+        excel_file (str): 输入文件路径
+        sheet_name (str): 工作表名称
+        choice (str): '3' 表示处理 Not Found 的记录，其他值表示处理未处理的记录
+        executor (ThreadPoolExecutor): 工作线程池
+        rate_limiter (TokenBucketRateLimiter): 限速器
+        worker_id (str): 工作进程标识，默认为 主机名:进程号
+
+    Returns:
+        str: JOB_DONE（所有区间均已完成）、JOB_STOPPED（预算用尽，停止认领区间）或 JOB_FAILED
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        df = read_input_table(excel_file, sheet_name)
+    except FileNotFoundError:
+        console_logger.error(f"错误：文件 '{excel_file}' 未找到。请确保文件在正确的路径下。")
+        return JOB_FAILED
+    prepare_result_columns(df)
+    status = classify_email_status(df[EMAIL_COL])
+    accept_cached_not_found = choice != '3'
+    rows = status.index[status.eq('not_found' if choice == '3' else 'unprocessed')].tolist()
+    # 按优先级排序后再切分区间，区间顺序保存在分片存储中，所有进程按同一顺序认领
+    rows = prioritize_rows(df, rows, {})
+    # 各进程读取同一个文件，归并结果一致；区间中只保存每家公司的代表行
+    clusters = cluster_company_rows(df, rows) if DEDUPE_ENABLED else {row: [row] for row in rows}
+    rows = list(clusters)
+
+    store = ShardStore(shard_store_path(excel_file, sheet_name), SHARD_LEASE_SECONDS)
+    try:
+        job = shard_job(excel_file, sheet_name, choice)
+        if store.initialize(rows, SHARD_RANGE_SIZE, job):
+            console_logger.info(f"已创建分片存储 '{store.path}'：{len(rows)} 行待处理，每个区间 {SHARD_RANGE_SIZE} 行")
+        mismatched = store.mismatched(job)
+        if mismatched:
+            # 区间中保存的是行索引，换了文件、工作表或处理对象后这些行索引不再有效
+            console_logger.error(f"错误：分片存储 '{store.path}' 属于另一个任务（不一致：{', '.join(mismatched)}），"
+                                 f"请先合并或删除该存储，或通过 SHARD_STORE_FILE 指定其他路径。")
+            return JOB_FAILED
+        console_logger.info(f"分片工作进程 {worker_id} 开始认领区间...")
+        waiting = False
+        while True:
+            claim = store.claim(worker_id)
+            if claim is None:
+                if store.pending_count() == 0:
+                    break
+                # 其余区间都由其他进程持有有效租约，定期重试认领，直到它们完成或租约过期
+                if not waiting:
+                    console_logger.info("其余区间均由其他进程处理中，等待其完成或租约过期...")
+                    waiting = True
+                time.sleep(SHARD_POLL_SECONDS)
+                continue
+            waiting = False
+            range_id, range_rows = claim
+            console_logger.info(f"认领区间 {range_id}（{len(range_rows)} 行）")
+            try:
+                process_shard_range(excel_file, df, range_rows, clusters, store, range_id, worker_id, executor,
+                                    rate_limiter, accept_cached_not_found)
+            except BudgetExceededError as e:
+                console_logger.warning(f"预算已用尽，分片工作进程 {worker_id} 停止认领区间：{e}")
+                return JOB_STOPPED
+        console_logger.info(f"所有区间均已完成，请运行 `python main.py {excel_file} --shard-merge` 合并结果。")
+        return JOB_DONE
+    finally:
+        store.close()
+
+def merge_shard_results(excel_file: str, sheet_name: str) -> bool:
+    """
+    把分片存储中的查询结果合并写回输入文件的结果列。
+
+    公司名称与当前表格不一致的结果会被忽略。所有区间都已完成时，合并后删除分片存储。
+
+    Args:
+        excel_file (str): 输入文件路径
+        sheet_name (str): 工作表名称
+
+    Returns:
+        bool: 是否所有区间都已完成并合并
+    """
+    store_path = shard_store_path(excel_file, sheet_name)
+    if not os.path.exists(store_path):
+        console_logger.error(f"错误：分片存储 '{store_path}' 不存在。")
+        return False
+    df = read_input_table(excel_file, sheet_name)
+    prepare_result_columns(df)
+    store = ShardStore(store_path, SHARD_LEASE_SECONDS)
+    try:
+        mismatched = store.mismatched({'input_file': os.path.basename(excel_file), 'sheet': sheet_name})
+        if mismatched:
+            console_logger.error(f"错误：分片存储 '{store_path}' 属于另一个任务（不一致：{', '.join(mismatched)}），未合并。")
+            return False
+        applied = 0
+        for row, company_en, company_tc, email, fields in store.results():
+            if row in df.index and get_company_names(df, row) == (company_en, company_tc):
+                store_result(df, row, email, fields)
+                applied += 1
+        export_workbook(df, excel_file, sheet_name)
+        pending = store.pending_count()
+    finally:
+        store.close()
+    console_logger.info(f"已将 {applied} 条分片结果合并到 '{excel_file}'")
+    if pending:
+        console_logger.warning(f"仍有 {pending} 个区间未完成，分片存储已保留，可在工作进程完成后再次合并")
+        return False
+    os.remove(store_path)
+    return True
+
+def find_watch_jobs(watch_dir: str) -> list:
+    """
+    返回监视目录中已复制完成、可以处理的输入文件（按修改时间排序）。
+
+    Args:
+        watch_dir (str): 监视目录
+
+    Returns:
+        list: 文件路径列表
+    """
+    jobs = []
+    now = time.time()
+    for entry in os.scandir(watch_dir):
+        base, ext = os.path.splitext(entry.name)
+        # 跳过子目录、Office 锁文件和导出时的临时文件
+        if (not entry.is_file() or ext.lower() not in WATCH_FILE_EXTENSIONS or
+                entry.name.startswith(('~$', '.')) or base.endswith('.tmp')):
+            continue
+        if now - entry.stat().st_mtime < WATCH_SETTLE_SECONDS:
+            continue
+        jobs.append(entry.path)
+    return sorted(jobs, key=os.path.getmtime)
+
+def archive_watch_job(path: str, sheet_names: list, succeeded: bool):
+    """
+    把处理完的输入文件移到监视目录下的 done/ 或 failed/ 子目录，并删除各工作表已清空的结果日志；
+    处理成功时一并删除各工作表的处理队列。
+
+    只删除该文件各工作表对应的文件，不影响名称前缀相同的其他输入文件（如 report.csv 与 report_2024.csv）。
+
+    Args:
+        path (str): 输入文件路径
+        sheet_names (list): 处理过的工作表名称
+        succeeded (bool): 是否处理成功
+    """
+    target_dir = os.path.join(os.path.dirname(path), 'done' if succeeded else 'failed')
+    os.makedirs(target_dir, exist_ok=True)
+    for sheet_name in sheet_names:
+        journal_file = journal_path(path, sheet_name)
+        if os.path.exists(journal_file) and os.path.getsize(journal_file) == 0:
+            os.remove(journal_file)
+        # 全部处理完成后不再需要恢复处理顺序；失败的文件保留队列，移回监视目录后可继续
+        queue_file = task_queue_path(path, sheet_name)
+        if succeeded and os.path.exists(queue_file):
+            os.remove(queue_file)
+    target = os.path.join(target_dir, os.path.basename(path))
+    if os.path.exists(target):
+        # 同名文件已存在时追加时间戳，避免覆盖之前的结果
+        base, ext = os.path.splitext(target)
+        target = f"{base}_{time.strftime('%Y%m%d%H%M%S')}{ext}"
+    os.replace(path, target)
+    console_logger.info(f"已将 '{path}' 移动到 '{target}'")
+
+def watch_directory(watch_dir: str, sheet_names: list, choice: str,
+                    executor: ThreadPoolExecutor, rate_limiter: TokenBucketRateLimiter, once: bool = False):
+    """
+    无人值守模式：持续扫描监视目录，依次处理新放入的输入文件。
+
+    所有文件共用同一个工作线程池、限速器、查询缓存和配额调度器。
+    处理完成的文件移到 done/，出错的文件移到 failed/。
+
+    Args:
+        watch_dir (str): 监视目录
+        sheet_names (list): 每个文件要处理的工作表名称
+        choice (str): 菜单选项
+        executor (ThreadPoolExecutor): 共享的工作线程池
+        rate_limiter (TokenBucketRateLimiter): 共享的限速器
+        once (bool): 为 True 时处理完目录中已有的文件后退出
+
+    Returns:
+        str: JOB_STOPPED（预算用尽，未处理完的文件保留在监视目录中）或 JOB_DONE（--once 时目录中的文件均已处理）
+    """
+    console_logger.info(f"监视目录 '{watch_dir}'，每 {WATCH_POLL_SECONDS} 秒扫描一次新文件（Ctrl+C 退出）...")
+    while True:
+        jobs = find_watch_jobs(watch_dir)
+        for path in jobs:
+            results = []
+            for sheet_name in sheet_names:
+                results.append(process_workbook(path, sheet_name, choice, executor, rate_limiter))
+                if results[-1] == JOB_STOPPED:
+                    break
+            if JOB_STOPPED in results:
+                # 预算用尽：文件和处理队列保留在原处，之后的文件也不再处理
+                console_logger.warning(f"预算已用尽，'{path}' 尚未处理完，保留在监视目录中，停止监视。")
+                return JOB_STOPPED
+            archive_watch_job(path, sheet_names, JOB_FAILED not in results)
+        if not jobs:
+            if once:
+                return JOB_DONE
+            time.sleep(WATCH_POLL_SECONDS)
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='使用 Gemini 批量查找公司邮箱')
+    parser.add_argument('files', nargs='*', help=f'要依次处理的输入文件（默认 {EXCEL_FILE}）')
+    parser.add_argument('--sheet', action='append', dest='sheets',
+                        help=f'要处理的工作表名称，可重复指定（默认 {SHEET_NAME}）')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--resume', action='store_const', const='1', dest='choice',
+                      help='菜单选项 1：继续上次任务（跳过已完成的记录，重试失败的记录）')
+    mode.add_argument('--restart', action='store_const', const='2', dest='choice',
+                      help='菜单选项 2：重新开始（清空所有结果）')
+    mode.add_argument('--retry-not-found', action='store_const', const='3', dest='choice',
+                      help='菜单选项 3：重试处理失败（Not Found）的记录')
+    mode.add_argument('--requery-suspects', action='store_const', const='4', dest='choice',
+                      help='菜单选项 4：按评分重新查询疑似错误的记录（最多 REQUERY_LIMIT 条）')
+    parser.add_argument('--watch', metavar='DIR', help='无人值守模式：持续处理放入该目录的输入文件')
+    parser.add_argument('--once', action='store_true', help='与 --watch 一起使用：处理完目录中已有的文件后退出')
+    shard = parser.add_mutually_exclusive_group()
+    shard.add_argument('--shard-worker', action='store_true',
+                       help='分片模式：通过共享的分片存储认领行区间并查询（可同时启动多个进程）')
+    shard.add_argument('--shard-merge', action='store_true', help='把分片存储中的结果合并写回输入文件')
+    parser.add_argument('--worker-id', help='分片工作进程标识（默认 主机名:进程号）')
+    args = parser.parse_args(argv)
+    if args.shard_worker and args.choice in ('2', '4'):
+        parser.error('--shard-worker 不支持 --restart 和 --requery-suspects')
+    if (args.shard_worker or args.shard_merge) and args.watch:
+        parser.error('分片模式不能与 --watch 同时使用')
+    if args.once and not args.watch:
+        parser.error('--once 只能与 --watch 一起使用')
+    return args
+
+def main(argv: list = None):
+    """
+    命令行入口。
+
+    不带参数时与以往相同，处理 EXCEL_FILE 并通过交互式菜单选择处理模式；
+    指定多个文件、工作表或 --watch 时在同一进程中依次处理，共用工作线程池、限速器和查询缓存。
+
+    Args:
+        argv (list): 命令行参数，默认为 sys.argv[1:]
+    """
+    args = parse_args(argv)
+    sheet_names = args.sheets or [SHEET_NAME]
+    # 无人值守模式下没有用户可以回答菜单，默认继续上次任务
+    choice = args.choice or ('1' if args.watch else None)
+    print_config()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, MAX_CONCURRENT_TASKS))
+    rate_limiter = TokenBucketRateLimiter(REQUESTS_PER_MINUTE, RATE_LIMIT_BURST)
+    succeeded = True
+    stopped = False
+    try:
+        if args.watch:
+            stopped = watch_directory(args.watch, sheet_names, choice, executor, rate_limiter, args.once) == JOB_STOPPED
+        else:
+            jobs = [(excel_file, sheet_name) for excel_file in args.files or [EXCEL_FILE] for sheet_name in sheet_names]
+            for position, (excel_file, sheet_name) in enumerate(jobs):
+                if args.shard_worker:
+                    result = run_shard_worker(excel_file, sheet_name, choice, executor, rate_limiter, args.worker_id)
+                elif args.shard_merge:
+                    result = JOB_DONE if merge_shard_results(excel_file, sheet_name) else JOB_FAILED
+                else:
+                    result = process_workbook(excel_file, sheet_name, choice, executor, rate_limiter)
+                succeeded = result != JOB_FAILED and succeeded
+                if result == JOB_STOPPED:
+                    # 预算用尽：之后的文件/工作表不再处理
+                    stopped = True
+                    if position + 1 < len(jobs):
+                        console_logger.warning(f"预算已用尽，其余 {len(jobs) - position - 1} 个文件/工作表未处理。")
+                    break
+    except KeyboardInterrupt:
+        console_logger.info("\n用户中断操作。")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if not succeeded:
+        sys.exit(1)
+    if stopped:
+        # 预算用尽而未处理完，与全部完成区分开，便于脚本判断是否需要再次运行
+        sys.exit(2)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
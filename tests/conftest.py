@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置。
+
+main.py 在导入时读取环境变量并在当前目录创建日志文件，因此先关闭持久化的缓存、用量记录和指标文件，
+再在临时目录中导入，避免在仓库目录中留下文件。
+"""
+
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['LOOKUP_CACHE_ENABLED'] = '0'
+os.environ['USAGE_DB_FILE'] = ''
+os.environ['USAGE_LOG_FILE'] = ''
+os.environ['METRICS_JSON_FILE'] = ''
+os.environ['METRICS_PROM_FILE'] = ''
+os.environ['PRIORITY_COL'] = 'Priority'
+os.environ['PRIORITY_HEURISTICS'] = 'fewest_attempts,both_names'
+os.environ['EXTRACT_FIELDS'] = ''
+os.chdir(tempfile.mkdtemp(prefix='email_investigator_tests_'))
+sys.path.insert(0, REPO_DIR)
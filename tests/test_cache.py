@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""本地查询缓存"""
+
+import time
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(ttl_found_days=90, ttl_not_found_days=7, max_entries=100):
+        cache = main.LookupCache(str(tmp_path / 'cache.sqlite'), ttl_found_days, ttl_not_found_days, max_entries)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def age_entry(cache, company_en, days):
+    """把一条缓存的写入时间提前 days 天"""
+    cache.conn.execute("UPDATE lookup_cache SET created_at = created_at - ? WHERE name_en = ?",
+                       (days * 86400, main.normalize_company_name(company_en)))
+    cache.conn.commit()
+
+
+def test_lookup_is_keyed_by_normalized_names(make_cache):
+    cache = make_cache()
+    cache.put('Alpha  Trading Ltd', '甲貿易', 'info@alpha.com')
+    assert cache.get('ALPHA TRADING LTD', '甲貿易') == 'info@alpha.com'
+    assert cache.get('Alpha Trading Ltd', '') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_errors_are_not_cached(make_cache):
+    cache = make_cache()
+    cache.put('Alpha Ltd', '', 'Error: Timeout')
+    assert cache.get('Alpha Ltd', '') is None
+
+
+def test_entries_expire_by_result_kind(make_cache):
+    cache = make_cache(ttl_found_days=30, ttl_not_found_days=7)
+    cache.put('Alpha Ltd', '', 'info@alpha.com')
+    cache.put('Beta Ltd', '', 'Not Found')
+    age_entry(cache, 'Alpha Ltd', 10)
+    age_entry(cache, 'Beta Ltd', 10)
+    # 已找到的结果仍在有效期内，"Not Found" 已过期并被删除
+    assert cache.get('Alpha Ltd', '') == 'info@alpha.com'
+    assert cache.get('Beta Ltd', '') is None
+    assert cache.conn.execute("SELECT COUNT(*) FROM lookup_cache").fetchone()[0] == 1
+    age_entry(cache, 'Alpha Ltd', 30)
+    assert cache.get('Alpha Ltd', '') is None
+
+
+def test_not_found_can_be_ignored(make_cache):
+    cache = make_cache()
+    cache.put('Alpha Ltd', '', 'Not Found')
+    assert cache.get('Alpha Ltd', '', accept_not_found=False) is None
+    assert cache.get('Alpha Ltd', '') == 'Not Found'
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch, make_cache):
+    monkeypatch.setattr(main, 'CACHE_EVICT_INTERVAL', 1)
+    cache = make_cache(max_entries=2)
+    cache.put('Alpha Ltd', '', 'info@alpha.com')
+    time.sleep(0.01)
+    cache.put('Beta Ltd', '', 'info@beta.com')
+    time.sleep(0.01)
+    assert cache.get('Alpha Ltd', '') == 'info@alpha.com'
+    time.sleep(0.01)
+    cache.put('Gamma Ltd', '', 'info@gamma.com')
+    assert cache.get('Beta Ltd', '') is None
+    assert cache.get('Alpha Ltd', '') == 'info@alpha.com'
+    assert cache.get('Gamma Ltd', '') == 'info@gamma.com'
+
+
+def test_eviction_runs_every_interval(monkeypatch, make_cache):
+    monkeypatch.setattr(main, 'CACHE_EVICT_INTERVAL', 3)
+    cache = make_cache(max_entries=1)
+
+    def count():
+        return cache.conn.execute("SELECT COUNT(*) FROM lookup_cache").fetchone()[0]
+
+    cache.put('Alpha Ltd', '', 'info@alpha.com')
+    cache.put('Beta Ltd', '', 'info@beta.com')
+    assert count() == 2
+    cache.put('Gamma Ltd', '', 'info@gamma.com')
+    assert count() == 1
+    assert cache.get('Gamma Ltd', '') == 'info@gamma.com'
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""令牌桶限速与工作线程池的结果顺序"""
+
+import time
+
+import pytest
+
+import main
+
+
+class FakeClock:
+    """替代 main 中的 time 模块：sleep() 只推进时钟，不真正等待"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(main, 'time', fake)
+    return fake
+
+
+def test_burst_then_steady_rate(clock):
+    limiter = main.TokenBucketRateLimiter(60, burst=2)
+    for _ in range(2):
+        limiter.acquire()
+    assert clock.sleeps == []
+    for _ in range(8):
+        limiter.acquire()
+    # 桶中的 2 个令牌用完后每秒补充 1 个
+    assert clock.now - 1000.0 == pytest.approx(8.0)
+    assert all(seconds == pytest.approx(1.0) for seconds in clock.sleeps)
+
+
+def test_idle_time_refills_up_to_capacity(clock):
+    limiter = main.TokenBucketRateLimiter(120, burst=3)
+    for _ in range(3):
+        limiter.acquire()
+    assert not limiter.try_acquire()
+    clock.now += 60
+    # 空闲再久也只补充到桶容量
+    assert [limiter.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5
+    assert limiter.try_acquire()
+
+
+def test_zero_rate_never_waits(clock):
+    limiter = main.TokenBucketRateLimiter(0)
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.sleeps == []
+    assert limiter.try_acquire()
+
+
+def test_results_are_saved_in_row_order_when_futures_finish_out_of_order(monkeypatch, tmp_path):
+    names = ['Alpha Ltd', 'Beta Ltd', 'Gamma Ltd', 'Delta Ltd']
+    finished = []
+    saved = []
+
+    def lookup(companies, rate_limiter, quota_ok, accept_cached_not_found=True):
+        company_en, _ = companies[0]
+        # 靠前的行耗时更长，查询完成的顺序与行顺序相反
+        time.sleep(0.05 * (len(names) - names.index(company_en)))
+        finished.append(company_en)
+        return [f"info@{company_en.split()[0].lower()}.com"], [main.empty_usage()]
+
+    store_result = main.store_result
+
+    def tracking_store_result(df, index, *args):
+        saved.append(index)
+        store_result(df, index, *args)
+
+    monkeypatch.setattr(main, 'lookup_companies', lookup)
+    monkeypatch.setattr(main, 'store_result', tracking_store_result)
+    monkeypatch.setattr(main, 'MAX_CONCURRENT_TASKS', 4)
+    source = tmp_path / 'companies.csv'
+    source.write_text('company_name,company_name_tc,Email\n' + ''.join(f"{name},,\n" for name in names), encoding='utf-8')
+
+    assert main.process_workbook(str(source), 'Sheet1', '1') == main.JOB_DONE
+    assert finished == list(reversed(names))
+    assert saved == [0, 1, 2, 3]
+    assert [line.split(',')[2] for line in source.read_text(encoding='utf-8').splitlines()[1:]] == [
+        'info@alpha.com', 'info@beta.com', 'info@gamma.com', 'info@delta.com']
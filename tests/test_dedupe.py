@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""公司名称归并"""
+
+import pandas as pd
+
+import main
+
+
+def make_df(names):
+    return pd.DataFrame({
+        main.COMPANY_NAME_EN_COL: [en for en, _ in names],
+        main.COMPANY_NAME_TC_COL: [tc for _, tc in names],
+    })
+
+
+def clusters_of(names):
+    df = make_df(names)
+    return main.cluster_company_rows(df, df.index.tolist())
+
+
+def test_spelling_variants_are_merged():
+    clusters = clusters_of([
+        ('Alpha Trading Limited', '甲貿易有限公司'),
+        ('ALPHA TRADING LTD.', ''),
+        ('The Alpha Trading Ltd', '甲貿易有限公司'),
+        ('Beta (H.K.) Limited', ''),
+        ('Beta (Hong Kong) Ltd', ''),
+    ])
+    assert clusters == {0: [0, 1, 2], 3: [3, 4]}
+
+
+def test_conflicting_chinese_names_in_one_english_block_stay_apart():
+    clusters = clusters_of([
+        ('Golden Dragon Limited', '金龍有限公司'),
+        ('Golden Dragon Ltd', '金龍集團有限公司'),
+        ('GOLDEN DRAGON LIMITED', '金龍有限公司'),
+        ('Golden Dragon Limited', ''),
+    ])
+    # 中文名不同的两家公司不合并；没有中文名的行无法判断归属，不并入任何一组
+    assert clusters == {0: [0, 2], 1: [1], 3: [3]}
+
+
+def test_single_chinese_name_merges_whole_english_block():
+    clusters = clusters_of([
+        ('Golden Dragon Limited', ''),
+        ('Golden Dragon Ltd', '金龍有限公司'),
+    ])
+    assert clusters == {0: [0, 1]}
+
+
+def test_representative_follows_processing_order():
+    df = make_df([('Alpha Ltd', ''), ('Beta Ltd', ''), ('Alpha Limited', '')])
+    assert main.cluster_company_rows(df, [2, 1, 0]) == {2: [2, 0], 1: [1]}
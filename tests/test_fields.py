@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""多字段提取：额外字段写入各自的列，无法解析的回复按未处理保存"""
+
+import csv
+import json
+
+import pandas as pd
+import pytest
+
+import main
+
+
+class FakeScheduler:
+    """按提示词中的公司名返回结构化回复；Beta 的回复无法解析"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def run(self, prompt, rate_limiter=None):
+        self.prompts.append(prompt)
+        if 'Beta' in prompt:
+            return 'Sorry, I could not complete the search.', None
+        return json.dumps([{'id': 1, 'email': 'info@alpha.com', 'phone': '+852 2345 6789',
+                            'website': 'https://alpha.com'}]), None
+
+
+@pytest.fixture
+def extract_fields(monkeypatch):
+    monkeypatch.setattr(main, 'EXTRACT_FIELDS', ['phone', 'website'])
+    monkeypatch.setattr(main, 'RESULT_COLUMNS', [main.EMAIL_COL, 'Phone', 'Website'])
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(main, 'lookup_scheduler', scheduler)
+    return scheduler
+
+
+def test_extra_fields_are_exported_to_their_own_columns(extract_fields, tmp_path):
+    source = tmp_path / 'companies.csv'
+    source.write_text('company_name,company_name_tc,Email,Address\nAlpha Ltd,,,Central\nBeta Ltd,,,Wan Chai\n',
+                      encoding='utf-8')
+
+    assert main.process_workbook(str(source), 'Sheet1', '1') == main.JOB_DONE
+
+    with open(source, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == ['company_name', 'company_name_tc', 'Email', 'Address', 'Phone', 'Website']
+    assert rows[0]['Email'] == 'info@alpha.com'
+    assert rows[0]['Phone'] == '+852 2345 6789'
+    assert rows[0]['Website'] == 'https://alpha.com'
+    assert rows[0]['Address'] == 'Central'
+    # 无法解析的回复不保存，该行保持未处理
+    assert (rows[1]['Email'], rows[1]['Phone'], rows[1]['Website']) == ('', '', '')
+
+
+def test_unparseable_reply_is_retried(extract_fields, tmp_path, monkeypatch):
+    cache = main.LookupCache(str(tmp_path / 'cache.sqlite'), 90, 7, 100)
+    monkeypatch.setattr(main, 'lookup_cache', cache)
+    try:
+        assert main.get_email_from_gemini_uncached('Beta Ltd', '') == 'Error: No output'
+        # 错误结果不写入缓存，并按未处理统计，下次运行会重新查询
+        assert cache.get('Beta Ltd', '') is None
+        assert main.classify_email_status(pd.Series(['Error: No output'])).tolist() == ['unprocessed']
+        main.get_email_from_gemini('Beta Ltd', '')
+        assert len(extract_fields.prompts) == 2
+    finally:
+        cache.close()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""HTTP 查询后端（使用 benchmarks/fake_gemini.py --serve 作为服务端）"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import main
+
+FAKE_GEMINI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fake_gemini.py')
+PROMPT = '1. Alpha Trading Limited'
+
+
+@pytest.fixture
+def fake_server(tmp_path):
+    """返回启动函数：按给定的错误比例启动一个 fake_gemini HTTP 服务并返回其接口地址"""
+    processes = []
+
+    def start(errors=''):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        env = dict(os.environ, FAKE_GEMINI_LATENCY='fixed:0', FAKE_GEMINI_ERRORS=errors,
+                   FAKE_GEMINI_STATE=str(tmp_path / f"state_{port}.json"))
+        env.pop('FAKE_GEMINI_QUOTA', None)
+        processes.append(subprocess.Popen([sys.executable, FAKE_GEMINI, '--serve', str(port)], env=env))
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def invoke(backend):
+    return backend._invoke(PROMPT, 5, main.CancellableCall())
+
+
+def test_successful_reply_is_returned(fake_server):
+    backend = main.GeminiHttpBackend('test-model', fake_server(), 'key', 2)
+    text = invoke(backend)
+    assert '@' in text or 'Not Found' in text
+
+
+@pytest.mark.parametrize('error, expected', [
+    ('RESOURCE_EXHAUSTED', main.QuotaExceededError),
+    ('Error 502', main.RetryableBackendError),
+    ('ECONNRESET', main.RetryableBackendError),
+    ('PERMISSION_DENIED', main.BackendError),
+])
+def test_http_errors_are_classified(fake_server, error, expected):
+    backend = main.GeminiHttpBackend('test-model', fake_server(f"{error}:1"), 'key', 2)
+    with pytest.raises(expected) as error_info:
+        invoke(backend)
+    # 其他 4xx 不可重试
+    assert type(error_info.value) is expected
+
+
+def test_pooled_connection_is_reused(fake_server):
+    backend = main.GeminiHttpBackend('test-model', fake_server(), 'key', 2)
+    invoke(backend)
+    assert backend.pool.qsize() == 1
+    conn = backend.pool.queue[0]
+    local_address = conn.sock.getsockname()
+
+    for _ in range(3):
+        invoke(backend)
+    # 串行调用始终使用同一个连接（同一个本地端口），没有新建连接
+    assert backend.pool.qsize() == 1
+    assert backend.pool.queue[0] is conn
+    assert conn.sock.getsockname() == local_address
+
+
+def test_error_responses_keep_connection_alive(fake_server):
+    backend = main.GeminiHttpBackend('test-model', fake_server('Error 502:1'), 'key', 2)
+    with pytest.raises(main.RetryableBackendError):
+        invoke(backend)
+    conn = backend.pool.queue[0]
+    with pytest.raises(main.RetryableBackendError):
+        invoke(backend)
+    assert backend.pool.queue[0] is conn
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""输入读取与结果导出"""
+
+import csv
+
+import pytest
+
+import main
+
+
+def write_csv(path, lines):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def read_csv_rows(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_csv_blank_lines_keep_row_positions(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    write_csv(path, ['company_name,company_name_tc,Email', 'A Ltd,,', '', 'B Ltd,,', 'C Ltd,,'])
+
+    df = main.read_input_table(path, 'Sheet1')
+    main.prepare_result_columns(df)
+    assert len(df) == 4
+    for row in df.index:
+        company_en, _ = main.get_company_names(df, row)
+        if company_en:
+            df.at[row, main.EMAIL_COL] = f"info@{company_en[0].lower()}.com"
+    main.export_workbook(df, path, 'Sheet1')
+
+    assert read_csv_rows(path) == [
+        ['company_name', 'company_name_tc', 'Email'],
+        ['A Ltd', '', 'info@a.com'],
+        [],
+        ['B Ltd', '', 'info@b.com'],
+        ['C Ltd', '', 'info@c.com'],
+    ]
+
+
+def test_csv_export_appends_missing_result_column(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    write_csv(path, ['company_name,address', 'A Ltd,Unit 1', 'B Ltd,Unit 2'])
+
+    df = main.read_input_table(path, 'Sheet1')
+    main.prepare_result_columns(df)
+    df.at[0, main.EMAIL_COL] = 'Not Found'
+    main.export_workbook(df, path, 'Sheet1')
+
+    assert read_csv_rows(path) == [
+        ['company_name', 'address', 'Email'],
+        ['A Ltd', 'Unit 1', 'Not Found'],
+        ['B Ltd', 'Unit 2', ''],
+    ]
+
+
+def test_journal_path_is_per_sheet():
+    assert main.journal_path('in/data.xlsx', 'Sheet1') == 'in/data_Sheet1_journal.jsonl'
+    assert main.journal_path('in/data.xlsx', 'Sheet1') != main.journal_path('in/data.xlsx', 'Sheet2')
+
+
+def test_once_requires_watch(capsys):
+    assert main.parse_args(['--watch', 'inbox', '--once']).once
+    with pytest.raises(SystemExit) as excinfo:
+        main.parse_args(['data.xlsx', '--once'])
+    assert excinfo.value.code == 2
+    assert '--once' in capsys.readouterr().err
+
+
+def test_archive_watch_job_keeps_unfinished_sheet_journals(tmp_path):
+    source = tmp_path / 'batch.csv'
+    source.write_text('Company Name (EN)\nAcme Ltd\n', encoding='utf-8')
+    finished = tmp_path / 'batch_Sheet1_journal.jsonl'
+    finished.write_text('', encoding='utf-8')
+    pending = tmp_path / 'batch_Sheet2_journal.jsonl'
+    pending.write_text('{"row": 0}\n', encoding='utf-8')
+
+    main.archive_watch_job(str(source), ['Sheet1', 'Sheet2'], succeeded=True)
+
+    assert not finished.exists()
+    assert pending.exists()
+    assert (tmp_path / 'done' / 'batch.csv').exists()
+
+
+def test_archive_watch_job_only_removes_own_queues(tmp_path):
+    source = tmp_path / 'report.csv'
+    source.write_text('company_name\nAcme Ltd\n', encoding='utf-8')
+    own_queue = tmp_path / 'report_Sheet1_queue.sqlite'
+    sibling_queue = tmp_path / 'report_2024_Sheet1_queue.sqlite'
+    own_queue.write_bytes(b'')
+    sibling_queue.write_bytes(b'')
+
+    main.archive_watch_job(str(source), ['Sheet1'], succeeded=True)
+
+    assert not own_queue.exists()
+    # 名称前缀相同的 report_2024.csv 仍在处理中，它的队列不能被删除
+    assert sibling_queue.exists()
+
+
+def test_archive_watch_job_keeps_queue_of_failed_job(tmp_path):
+    source = tmp_path / 'broken.csv'
+    source.write_text('company_name\nAcme Ltd\n', encoding='utf-8')
+    queue = tmp_path / 'broken_Sheet1_queue.sqlite'
+    queue.write_bytes(b'')
+
+    main.archive_watch_job(str(source), ['Sheet1'], succeeded=False)
+
+    assert queue.exists()
+    assert (tmp_path / 'failed' / 'broken.csv').exists()
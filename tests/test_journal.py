@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""结果日志的恢复与清空"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import main
+
+
+class Crash(BaseException):
+    """模拟进程在导出前崩溃"""
+
+
+def make_df():
+    return pd.DataFrame({
+        main.COMPANY_NAME_EN_COL: ['Alpha Ltd', 'Beta Ltd', 'Gamma Ltd'],
+        main.COMPANY_NAME_TC_COL: ['', '', ''],
+        main.EMAIL_COL: ['', '', ''],
+    })
+
+
+def test_replay_restores_matching_rows_and_skips_torn_line(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = main.ResultJournal(path)
+    journal.append(0, 'Alpha Ltd', '', 'info@alpha.com')
+    journal.append(1, 'Renamed Ltd', '', 'info@renamed.com')
+    journal.append(2, 'Gamma Ltd', '', 'Not Found')
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"row": 1, "company_name": "Beta Ltd", "ema')
+
+    df = make_df()
+    assert main.ResultJournal(path).replay(df) == 2
+    # 公司名称不一致的记录和写了一半的行被忽略
+    assert df[main.EMAIL_COL].tolist() == ['info@alpha.com', '', 'Not Found']
+
+
+def test_reset_empties_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = main.ResultJournal(path)
+    journal.append(0, 'Alpha Ltd', '', 'info@alpha.com')
+    journal.reset()
+    journal.append(1, 'Beta Ltd', '', 'info@beta.com')
+    journal.close()
+    df = make_df()
+    assert main.ResultJournal(path).replay(df) == 1
+    assert df[main.EMAIL_COL].tolist() == ['', 'info@beta.com', '']
+
+
+def test_interrupted_run_resumes_from_journal(monkeypatch, tmp_path):
+    queried = []
+
+    def lookup(companies, rate_limiter, quota_ok, accept_cached_not_found=True):
+        queried.extend(company_en for company_en, _ in companies)
+        return [f"info@{company_en.split()[0].lower()}.com" for company_en, _ in companies], \
+               [main.empty_usage() for _ in companies]
+
+    def crash_on_export(*args):
+        raise Crash()
+
+    source = tmp_path / 'companies.csv'
+    source.write_text('company_name,company_name_tc,Email\nAlpha Ltd,,\nBeta Ltd,,\nGamma Ltd,,\n', encoding='utf-8')
+    journal_file = main.journal_path(str(source), 'Sheet1')
+    monkeypatch.setattr(main, 'lookup_companies', lookup)
+    monkeypatch.setattr(main, 'MAX_CONCURRENT_TASKS', 1)
+    monkeypatch.setattr(main, 'EXCEL_CHECKPOINT_ROWS', 2)
+
+    # 第一次运行在第一个检查点导出时崩溃：前两条结果只在结果日志中
+    monkeypatch.setattr(main, 'export_workbook', crash_on_export)
+    with pytest.raises(Crash):
+        main.process_workbook(str(source), 'Sheet1', '1')
+    assert source.read_text(encoding='utf-8').count('@') == 0
+    with open(journal_file, encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+
+    # 再次运行：从日志恢复前两条结果，只查询剩下的一条；全部完成后清空日志
+    monkeypatch.undo()
+    monkeypatch.setattr(main, 'lookup_companies', lookup)
+    queried.clear()
+    assert main.process_workbook(str(source), 'Sheet1', '1') == main.JOB_DONE
+    assert queried == ['Gamma Ltd']
+    assert source.read_text(encoding='utf-8').splitlines()[1:] == [
+        'Alpha Ltd,,info@alpha.com', 'Beta Ltd,,info@beta.com', 'Gamma Ltd,,info@gamma.com']
+    assert os.path.getsize(journal_file) == 0
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""自适应超时与对冲请求"""
+
+import threading
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    monkeypatch.setattr(main, 'ADAPTIVE_TIMEOUT_ENABLED', True)
+    monkeypatch.setattr(main, 'ADAPTIVE_TIMEOUT_FACTOR', 3.0)
+    monkeypatch.setattr(main, 'ADAPTIVE_TIMEOUT_MIN_SECONDS', 30.0)
+    monkeypatch.setattr(main, 'GEMINI_TIMEOUT_SECONDS', 600)
+
+
+def tracker_with(samples, min_samples=5):
+    tracker = main.LatencyTracker(100, min_samples)
+    for seconds in samples:
+        tracker.record(seconds)
+    return tracker
+
+
+def test_falls_back_to_maximum_without_enough_samples(adaptive):
+    assert tracker_with([20] * 4).timeout() == 600
+
+
+@pytest.mark.parametrize('samples, expected', [
+    ([20] * 10, 60),       # p95 × 3
+    ([1] * 10, 30),        # 不低于下限
+    ([500] * 10, 600),     # 不超过上限
+])
+def test_timeout_is_p95_times_factor_clamped(adaptive, samples, expected):
+    assert tracker_with(samples).timeout() == pytest.approx(expected)
+
+
+def test_timeout_uses_recent_window_p95(adaptive):
+    tracker = main.LatencyTracker(20, 5)
+    for _ in range(20):
+        tracker.record(100)
+    for _ in range(20):
+        tracker.record(15)
+    # 旧样本已滑出窗口
+    assert tracker.timeout() == pytest.approx(45)
+
+
+def test_disabled_adaptive_timeout_uses_maximum(adaptive, monkeypatch):
+    monkeypatch.setattr(main, 'ADAPTIVE_TIMEOUT_ENABLED', False)
+    assert tracker_with([20] * 10).timeout() == 600
+
+
+class BlockingPrimaryBackend(main.LookupBackend):
+    """第一次调用一直阻塞到被中止；之后的调用立即返回"""
+
+    def __init__(self):
+        super().__init__('test-model')
+        self.calls = []
+        self.aborted = threading.Event()
+
+    def _invoke(self, prompt, timeout, call):
+        self.calls.append(call)
+        if len(self.calls) > 1:
+            return 'hedge'
+        call.attach(self.aborted.set)
+        if not self.aborted.wait(5):
+            return 'primary'
+        raise main.RetryableBackendError('aborted')
+
+
+def test_hedge_winner_cancels_losing_call(monkeypatch):
+    monkeypatch.setattr(main, 'usage_tracker', main.UsageTracker(''))
+    backend = BlockingPrimaryBackend()
+    monkeypatch.setattr(backend.latency, 'hedge_delay', lambda: 0.05)
+
+    assert backend._call('prompt', None) == 'hedge'
+    primary, _ = backend.calls
+    # 落败的先发调用被中止（执行了登记的中止操作），没有等到其超时
+    assert backend.aborted.wait(1)
+    assert primary.cancelled
+    assert main.usage_tracker.run_totals['calls'] == 2
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""运行指标的 JSON 与 Prometheus textfile 导出"""
+
+import json
+import os
+import re
+
+import pytest
+
+import main
+
+SAMPLE_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)'
+                         r'(?P<labels>\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*"'
+                         r'(?:,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*")*\})?'
+                         r' (?P<value>[-+]?(?:\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|Inf|NaN))$')
+
+
+@pytest.fixture
+def registry():
+    registry = main.MetricsRegistry()
+    registry.define('calls_total', 'counter', '调用次数')
+    registry.define('call_seconds', 'histogram', '调用耗时（秒）', (0.5, 1, 5))
+    registry.define('run_seconds', 'gauge', '已耗时（秒）')
+    registry.inc('calls_total', backend='cli', outcome='ok')
+    registry.inc('calls_total', 2, backend='cli', outcome='quota')
+    registry.inc('calls_total', model='weird "model"\\name')
+    for seconds in (0.2, 0.7, 3, 30):
+        registry.observe('call_seconds', seconds, backend='http')
+    return registry
+
+
+def test_prometheus_textfile_is_well_formed(registry):
+    text = registry.to_prometheus()
+    assert text.endswith('\n')
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            current = line.split()[2]
+            assert current not in families, f"{current} 重复声明"
+            families[current] = None
+        elif line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name == current
+            families[name] = kind
+        else:
+            match = SAMPLE_LINE.match(line)
+            assert match, f"无法解析的行: {line!r}"
+            # 每个样本都属于刚声明的指标族
+            assert match.group('name').startswith(current)
+    assert families == {
+        'email_investigator_call_seconds': 'histogram',
+        'email_investigator_calls_total': 'counter',
+        'email_investigator_run_seconds': 'gauge',
+    }
+    assert 'email_investigator_calls_total{backend="cli",outcome="quota"} 2.0' in text
+    assert 'email_investigator_calls_total{model="weird \\"model\\"\\\\name"} 1.0' in text
+
+
+def test_prometheus_histogram_buckets_are_cumulative(registry):
+    lines = [line for line in registry.to_prometheus().splitlines() if line.startswith('email_investigator_call_seconds')]
+    assert lines == [
+        'email_investigator_call_seconds_bucket{backend="http",le="0.5"} 1',
+        'email_investigator_call_seconds_bucket{backend="http",le="1"} 2',
+        'email_investigator_call_seconds_bucket{backend="http",le="5"} 3',
+        'email_investigator_call_seconds_bucket{backend="http",le="+Inf"} 4',
+        'email_investigator_call_seconds_sum{backend="http"} 33.9',
+        'email_investigator_call_seconds_count{backend="http"} 4',
+    ]
+
+
+def test_json_summary(registry):
+    summary = registry.to_dict()
+    assert set(summary) == {'wall_seconds', 'sleep_seconds', 'work_seconds', 'metrics'}
+    assert summary['metrics']['calls_total{backend="cli",outcome="ok"}'] == 1.0
+    assert summary['metrics']['call_seconds{backend="http"}'] == {
+        'count': 4, 'sum': 33.9, 'mean': 8.475, 'buckets': {'0.5': 1, '1': 2, '5': 3}}
+
+
+def test_export_writes_both_files_atomically(registry, monkeypatch, tmp_path):
+    json_file, prom_file = tmp_path / 'metrics.json', tmp_path / 'metrics.prom'
+    monkeypatch.setattr(main, 'METRICS_JSON_FILE', str(json_file))
+    monkeypatch.setattr(main, 'METRICS_PROM_FILE', str(prom_file))
+    registry.export()
+    assert json.loads(json_file.read_text(encoding='utf-8'))['metrics']['calls_total{backend="cli",outcome="quota"}'] == 2.0
+    assert prom_file.read_text(encoding='utf-8').startswith('# HELP email_investigator_')
+    assert sorted(os.listdir(tmp_path)) == ['metrics.json', 'metrics.prom']
+
+
+def test_export_skips_disabled_files(registry, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'METRICS_JSON_FILE', '')
+    monkeypatch.setattr(main, 'METRICS_PROM_FILE', str(tmp_path / 'metrics.prom'))
+    registry.export()
+    assert os.listdir(tmp_path) == ['metrics.prom']
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""批量查询回复的解析"""
+
+import main
+
+
+def test_parses_markdown_wrapped_reply():
+    reply = ('以下是结果：\n```json\n'
+             '[{"id": 1, "email": "info@alpha.com.hk"}, {"id": "2", "email": "Not Found"}]\n```\n')
+    assert main.parse_batch_reply(reply, 2) == {1: 'info@alpha.com.hk', 2: 'Not Found'}
+
+
+def test_garbled_or_truncated_json_returns_nothing():
+    assert main.parse_batch_reply('[{"id": 1, "email": "info@alpha.com"}, {"id": 2, "em', 2) == {}
+    assert main.parse_batch_reply('[{"id": 1, "email": info@alpha.com}]', 1) == {}
+    assert main.parse_batch_reply('no json here', 1) == {}
+    assert main.parse_batch_reply('] before [', 1) == {}
+
+
+def test_skips_invalid_items_and_keeps_the_rest():
+    reply = ('[{"id": 1, "email": "  sales@beta.com  "},'
+             ' {"id": 2, "email": "I could not find an email"},'
+             ' {"id": 3, "email": null},'
+             ' {"id": 7, "email": "info@out-of-range.com"},'
+             ' {"id": 0, "email": "info@zero.com"},'
+             ' "info@bare-string.com",'
+             ' {"email": "info@no-id.com"}]')
+    assert main.parse_batch_reply(reply, 3) == {1: 'sales@beta.com'}
+
+
+def test_non_list_json_returns_nothing():
+    assert main.parse_batch_reply('{"id": 1, "email": "info@alpha.com"} [1]', 1) == {}
+
+
+def test_extra_fields_are_attached(monkeypatch):
+    monkeypatch.setattr(main, 'EXTRACT_FIELDS', ['phone', 'website'])
+    results = main.parse_batch_reply('[{"id": 1, "email": "info@alpha.com", "phone": " 2345 6789 "}]', 1)
+    assert results == {1: 'info@alpha.com'}
+    assert main.result_fields(results[1]) == {'phone': '2345 6789', 'website': ''}
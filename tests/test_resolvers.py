@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""本地解析层：名录与域名规则"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import main
+
+DIRECTORY_ROWS = [
+    ('Alpha Trading Ltd', '甲貿易有限公司', 'sales@alpha.com', 'https://alpha.com'),
+    ('Beta Ltd', '', '', 'https://www.beta.com.hk/about'),
+    ('Gamma Ltd', '', '', ''),
+    ('Delta Ltd', '', 'n/a', 'delta.com'),
+]
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.prompts = []
+
+    def run(self, prompt, rate_limiter=None):
+        self.prompts.append(prompt)
+        return 'info@from-gemini.com', None
+
+
+def write_csv_directory(path):
+    lines = ['company_name,company_name_tc,email,website'] + [','.join(row) for row in DIRECTORY_ROWS]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def write_sqlite_directory(path):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE companies (company_name TEXT, company_name_tc TEXT, email TEXT, website TEXT)")
+    conn.executemany("INSERT INTO companies VALUES (?, ?, ?, ?)", DIRECTORY_ROWS)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def tiers(request, monkeypatch, tmp_path):
+    if request.param == 'csv':
+        path = write_csv_directory(tmp_path / 'directory.csv')
+    else:
+        path = write_sqlite_directory(tmp_path / 'directory.sqlite')
+    monkeypatch.setattr(main, 'COMPANY_DIRECTORY_FILE', path)
+    monkeypatch.setattr(main, 'DOMAIN_RULE_ENABLED', True)
+    tiers = main.create_resolver_tiers()
+    monkeypatch.setattr(main, 'resolver_tiers', tiers)
+    return tiers
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    fake = FakeScheduler()
+    monkeypatch.setattr(main, 'lookup_scheduler', fake)
+    return fake
+
+
+def lookup(companies):
+    quota_ok = threading.Event()
+    quota_ok.set()
+    results, _ = main.lookup_companies(companies, None, quota_ok)
+    return results
+
+
+def test_tiers_run_from_cheapest_to_gemini(tiers, scheduler):
+    assert [tier.name for tier in tiers] == ['directory', 'domain_rule']
+    results = lookup([('ALPHA TRADING LTD', '甲貿易有限公司'), ('Beta Ltd', ''), ('Delta Ltd', ''), ('Unknown Ltd', '')])
+    assert results == ['sales@alpha.com', 'info@beta.com.hk', 'info@delta.com', 'info@from-gemini.com']
+    # 本地命中的公司不调用Gemini
+    assert len(scheduler.prompts) == 1
+    assert 'Unknown Ltd' in scheduler.prompts[0]
+    directory, domain_rule = tiers
+    assert (directory.stats.calls, directory.stats.hits) == (4, 1)
+    assert (domain_rule.stats.calls, domain_rule.stats.hits) == (3, 2)
+
+
+def test_directory_email_wins_over_domain_rule(tiers, scheduler):
+    # Alpha 同时有邮箱和官网：名录层先命中，不会推导为 info@alpha.com
+    assert lookup([('Alpha Trading Ltd', '')]) == ['sales@alpha.com']
+    assert scheduler.prompts == []
+
+
+def test_chinese_name_alone_matches_directory(tiers, scheduler):
+    assert lookup([('', '甲貿易有限公司')]) == ['sales@alpha.com']
+    assert scheduler.prompts == []
+
+
+def test_domain_rule_can_be_disabled(monkeypatch, tmp_path, scheduler):
+    monkeypatch.setattr(main, 'COMPANY_DIRECTORY_FILE', write_csv_directory(tmp_path / 'directory.csv'))
+    monkeypatch.setattr(main, 'DOMAIN_RULE_ENABLED', False)
+    monkeypatch.setattr(main, 'resolver_tiers', main.create_resolver_tiers())
+    assert lookup([('Beta Ltd', '')]) == ['info@from-gemini.com']
+    assert len(scheduler.prompts) == 1
+
+
+def test_directory_website_is_kept_as_extra_field(tiers, scheduler, monkeypatch):
+    monkeypatch.setattr(main, 'EXTRACT_FIELDS', ['website'])
+    result = lookup([('Beta Ltd', '')])[0]
+    assert result == 'info@beta.com.hk'
+    assert main.result_fields(result) == {'website': 'https://www.beta.com.hk/about'}
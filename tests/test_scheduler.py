@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""配额调度"""
+
+import pytest
+
+import main
+
+
+class QuotaBackend:
+    """配额用尽次数可控的假后端"""
+
+    def __init__(self, quota_errors=0):
+        self.quota_errors = quota_errors
+        self.calls = 0
+
+    def run(self, prompt, rate_limiter=None):
+        self.calls += 1
+        if self.quota_errors:
+            self.quota_errors -= 1
+            raise main.QuotaExceededError('quota')
+        return 'ok', None
+
+
+def make_scheduler(*backends):
+    return main.QuotaScheduler(list(backends), [f"slot{i}" for i in range(len(backends))], 60, 3600)
+
+
+def test_failures_on_parked_slot_do_not_escalate_backoff():
+    scheduler = make_scheduler(QuotaBackend())
+    for _ in range(8):
+        scheduler._mark_exhausted(0)
+    assert scheduler.quota_failures == [1]
+    assert scheduler.next_recovery_in() <= 60 * 1.25
+
+
+def test_backoff_escalates_once_slot_is_probed_again():
+    scheduler = make_scheduler(QuotaBackend())
+    scheduler._mark_exhausted(0)
+    # 模拟探测时间已到，再次失败时间隔翻倍
+    scheduler.exhausted_until[0] = 0.0
+    scheduler._mark_exhausted(0)
+    assert scheduler.quota_failures == [2]
+    assert scheduler.next_recovery_in() > 60 * 0.75 * 2 - 1
+
+
+def test_run_falls_over_to_next_slot_and_resets_on_success():
+    primary, secondary = QuotaBackend(quota_errors=1), QuotaBackend()
+    scheduler = make_scheduler(primary, secondary)
+    assert scheduler.run('prompt') == ('ok', None)
+    assert (primary.calls, secondary.calls) == (1, 1)
+    assert scheduler.quota_failures == [1, 0]
+    assert scheduler._pick() == 1
+
+
+def test_run_raises_when_every_slot_is_exhausted():
+    scheduler = make_scheduler(QuotaBackend(quota_errors=5))
+    with pytest.raises(main.QuotaExceededError):
+        scheduler.run('prompt')
+    assert scheduler.quota_failures == [1]
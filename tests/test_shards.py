@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""分片租约"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+
+def make_store(tmp_path, lease_seconds=60):
+    return main.ShardStore(str(tmp_path / 'shards.sqlite'), lease_seconds)
+
+
+def write_companies(path, names):
+    path.write_text('company_name,company_name_tc,Email\n' + ''.join(f"{name},,\n" for name in names), encoding='utf-8')
+
+
+def run_worker(monkeypatch, source, queried, choice='1'):
+    def lookup(companies, rate_limiter, quota_ok, accept_cached_not_found=True):
+        queried.extend(company_en for company_en, _ in companies)
+        return [f"info@{company_en.split()[0].lower()}.com" for company_en, _ in companies], \
+            [main.empty_usage()] * len(companies)
+
+    monkeypatch.setattr(main, 'lookup_companies', lookup)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        return main.run_shard_worker(str(source), 'Sheet1', choice, executor, main.TokenBucketRateLimiter(0), 'worker')
+
+
+def test_initialize_only_once(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    assert first.initialize([0, 1, 2, 3, 4], 2)
+    assert not second.initialize([0, 1], 1)
+    assert first.pending_count() == 3
+
+
+def test_claimed_range_is_not_handed_out_twice(tmp_path):
+    store = make_store(tmp_path)
+    store.initialize([0, 1, 2], 2)
+    assert store.claim('a') == (1, [0, 1])
+    assert store.claim('b') == (2, [2])
+    assert store.claim('c') is None
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.2)
+    store.initialize([0, 1], 2)
+    assert store.claim('crashed') == (1, [0, 1])
+    assert store.claim('b') is None
+    time.sleep(0.3)
+    # 租约过期后由其他进程接管，原持有者不能再续约或完成
+    assert store.claim('b') == (1, [0, 1])
+    assert not store.renew(1, 'crashed')
+    store.complete(1, 'crashed')
+    assert store.pending_count() == 1
+    assert store.renew(1, 'b')
+    store.complete(1, 'b')
+    assert store.pending_count() == 0
+    assert store.claim('c') is None
+
+
+def test_renew_extends_lease(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.6)
+    store.initialize([0], 1)
+    store.claim('a')
+    time.sleep(0.4)
+    assert store.renew(1, 'a')
+    time.sleep(0.4)
+    assert store.claim('b') is None
+
+
+def test_results_round_trip_extra_fields(tmp_path):
+    store = make_store(tmp_path)
+    store.save_result(3, 'Alpha Ltd', '', main.LookupResult('info@alpha.com', {'phone': '2345 6789'}), 'a')
+    store.save_result(1, 'Beta Ltd', '', 'Not Found', 'a')
+    assert store.results() == [(1, 'Beta Ltd', '', 'Not Found', {}),
+                               (3, 'Alpha Ltd', '', 'info@alpha.com', {'phone': '2345 6789'})]
+
+
+def test_mismatched_reports_keys_of_other_job(tmp_path):
+    store = make_store(tmp_path)
+    store.initialize([0, 1], 1, {'input_file': 'a.xlsx', 'sheet': 'Sheet1', 'target': 'unprocessed'})
+    assert store.mismatched({'input_file': 'a.xlsx', 'sheet': 'Sheet1', 'target': 'unprocessed'}) == []
+    assert store.mismatched({'input_file': 'b.xlsx', 'sheet': 'Sheet1', 'target': 'not_found'}) == ['input_file', 'target']
+
+
+def test_mismatched_ignores_keys_missing_from_old_stores(tmp_path):
+    store = make_store(tmp_path)
+    store.initialize([0], 1)
+    assert store.mismatched({'input_file': 'a.xlsx'}) == []
+
+
+def test_worker_refuses_store_of_other_job(monkeypatch, tmp_path):
+    source = tmp_path / 'companies.csv'
+    write_companies(source, ['Alpha Ltd', 'Beta Ltd'])
+    store = main.ShardStore(main.shard_store_path(str(source), 'Sheet1'), 60)
+    store.initialize([0, 1], 10, main.shard_job(str(tmp_path / 'other.csv'), 'Sheet1', '1'))
+    store.close()
+    queried = []
+    assert run_worker(monkeypatch, source, queried) == main.JOB_FAILED
+    assert queried == []
+
+
+def test_reclaimed_range_skips_rows_with_stored_results(monkeypatch, tmp_path):
+    source = tmp_path / 'companies.csv'
+    write_companies(source, ['Alpha Ltd', 'Beta Ltd', 'Gamma Ltd'])
+    # 原持有者保存了第一行的结果后崩溃，租约随即过期
+    store = main.ShardStore(main.shard_store_path(str(source), 'Sheet1'), 0.1)
+    store.initialize([0, 1, 2], 10, main.shard_job(str(source), 'Sheet1', '1'))
+    assert store.claim('crashed') == (1, [0, 1, 2])
+    store.save_result(0, 'Alpha Ltd', '', 'info@alpha.com', 'crashed')
+    store.close()
+    time.sleep(0.2)
+    queried = []
+    assert run_worker(monkeypatch, source, queried) == main.JOB_DONE
+    assert queried == ['Beta Ltd', 'Gamma Ltd']
+
+
+def test_worker_polls_until_leased_range_is_reclaimed(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'SHARD_POLL_SECONDS', 0.05)
+    source = tmp_path / 'companies.csv'
+    write_companies(source, ['Alpha Ltd'])
+    store = main.ShardStore(main.shard_store_path(str(source), 'Sheet1'), 0.3)
+    store.initialize([0], 10, main.shard_job(str(source), 'Sheet1', '1'))
+    store.claim('crashed')
+    store.close()
+    queried = []
+    start = time.monotonic()
+    assert run_worker(monkeypatch, source, queried) == main.JOB_DONE
+    # 租约过期后很快被重新认领，而不是等待固定的长间隔
+    assert time.monotonic() - start < 2
+    assert queried == ['Alpha Ltd']
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""处理队列的排序与恢复"""
+
+import pandas as pd
+
+import main
+
+
+def make_df():
+    return pd.DataFrame({
+        main.COMPANY_NAME_EN_COL: ['Alpha Ltd', 'Beta Ltd', 'Gamma Ltd', 'Delta Ltd'],
+        main.COMPANY_NAME_TC_COL: ['', '', '', ''],
+        main.EMAIL_COL: ['', '', '', ''],
+        'Priority': [3, 1, 2, 4],
+    })
+
+
+def test_order_sorts_new_rows_by_priority(tmp_path):
+    df = make_df()
+    queue = main.TaskQueue(str(tmp_path / 'queue.sqlite'))
+    ordered = queue.order(df, [0, 1, 2, 3], '1', pd.Series(False, index=df.index))
+    assert ordered == [1, 2, 0, 3]
+    assert queue.resumed == 0
+
+
+def test_order_keeps_given_order_without_reorder(tmp_path):
+    df = make_df()
+    queue = main.TaskQueue(str(tmp_path / 'queue.sqlite'))
+    # 选项 4 的候选已按评分排序，不能再按优先级列打乱
+    ordered = queue.order(df, [3, 0, 2], '4', pd.Series(False, index=df.index), reorder=False)
+    assert ordered == [3, 0, 2]
+
+
+def test_order_resumes_pending_rows_first(tmp_path):
+    df = make_df()
+    path = str(tmp_path / 'queue.sqlite')
+    queue = main.TaskQueue(path)
+    queue.order(df, [0, 1, 2, 3], '1', pd.Series(False, index=df.index))
+    queue.mark_done([1])
+
+    # 中断后重新运行：未完成的行按原顺序排在前面，已完成的行按优先级排在后面
+    df.at[1, main.EMAIL_COL] = 'Not Found'
+    resumed = main.TaskQueue(path)
+    ordered = resumed.order(df, [0, 1, 2, 3], '1', df[main.EMAIL_COL].ne(''))
+    assert ordered == [2, 0, 3, 1]
+    assert resumed.resumed == 3
+
+
+def test_order_treats_renamed_company_as_new_row(tmp_path):
+    df = make_df()
+    path = str(tmp_path / 'queue.sqlite')
+    main.TaskQueue(path).order(df, [0, 1, 2, 3], '1', pd.Series(False, index=df.index))
+
+    df.at[2, main.COMPANY_NAME_EN_COL] = 'Gamma Holdings Ltd'
+    queue = main.TaskQueue(path)
+    ordered = queue.order(df, [0, 1, 2, 3], '1', pd.Series(False, index=df.index))
+    assert ordered[:3] == [1, 0, 3]
+    assert ordered[3] == 2
+    assert queue.resumed == 3
+
+
+def test_prioritize_rows_breaks_ties_with_heuristics():
+    df = pd.DataFrame({
+        main.COMPANY_NAME_EN_COL: ['Alpha Ltd', 'Beta Ltd', 'Gamma Ltd', 'Delta Ltd', 'Epsilon Ltd'],
+        main.COMPANY_NAME_TC_COL: ['', '乙有限公司', '', '丁有限公司', ''],
+        'Priority': [1, 1, 1, None, 1],
+    })
+    attempts = {0: 0, 1: 0, 2: 1, 3: 0, 4: 0}
+    # 优先级相同：未查询过的行在前，同时有中英文名的行在前；没有优先级的行排在最后
+    assert main.prioritize_rows(df, [0, 1, 2, 3, 4], attempts) == [1, 0, 4, 2, 3]
+
+
+def test_prioritize_rows_descending(monkeypatch):
+    monkeypatch.setattr(main, 'PRIORITY_DESCENDING', True)
+    df = make_df()
+    assert main.prioritize_rows(df, [0, 1, 2, 3], dict.fromkeys(range(4), 0)) == [3, 0, 2, 1]
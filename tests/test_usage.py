@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""用量统计与预算"""
+
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def reserve_concurrently(tracker, attempts, threads=8):
+    granted = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(attempts):
+            try:
+                tracker.reserve(10)
+            except main.BudgetExceededError:
+                continue
+            with lock:
+                granted.append(1)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(granted)
+
+
+def test_reserve_never_exceeds_run_call_budget(monkeypatch):
+    monkeypatch.setattr(main, 'BUDGET_RUN_CALLS', 10)
+    tracker = main.UsageTracker('')
+    assert reserve_concurrently(tracker, 50) == 10
+    assert tracker.run_totals['calls'] == 10
+    with pytest.raises(main.BudgetExceededError):
+        tracker.check_budget()
+
+
+def test_reserve_shares_daily_budget_across_trackers(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'BUDGET_DAY_CALLS', 7)
+    path = str(tmp_path / 'usage.sqlite')
+    # 两个实例模拟共享同一数据库的两个分片进程
+    first, second = main.UsageTracker(path), main.UsageTracker(path)
+    try:
+        assert reserve_concurrently(first, 20, threads=4) + reserve_concurrently(second, 20, threads=4) == 7
+        assert first._load_day(first.day)['calls'] == 7
+    finally:
+        first.close()
+        second.close()
+
+
+def test_record_adds_tokens_without_counting_call_again():
+    tracker = main.UsageTracker('')
+    tracker.begin_scope()
+    tracker.reserve(100)
+    tracker.record(120, 30, 100)
+    assert tracker.end_scope() == {'calls': 1, 'input_tokens': 120, 'output_tokens': 30}
+    assert tracker.run_totals == {'calls': 1, 'input_tokens': 120, 'output_tokens': 30}
+
+
+class SlowPrimaryBackend(main.LookupBackend):
+    """第一次调用较慢，之后的调用立即返回"""
+
+    def __init__(self):
+        super().__init__('test-model')
+        self.invocations = 0
+        self.lock = threading.Lock()
+
+    def _invoke(self, prompt, timeout, call):
+        with self.lock:
+            self.invocations += 1
+            first = self.invocations == 1
+        if first:
+            time.sleep(0.3)
+            return 'primary'
+        return 'hedge'
+
+
+@pytest.mark.parametrize('budget, expected_calls, expected_text', [(1, 1, 'primary'), (2, 2, 'hedge')])
+def test_hedge_respects_call_budget(monkeypatch, budget, expected_calls, expected_text):
+    tracker = main.UsageTracker('')
+    monkeypatch.setattr(main, 'usage_tracker', tracker)
+    monkeypatch.setattr(main, 'BUDGET_RUN_CALLS', budget)
+    backend = SlowPrimaryBackend()
+    monkeypatch.setattr(backend.latency, 'hedge_delay', lambda: 0.05)
+
+    assert backend._call('prompt', None) == expected_text
+    assert backend.invocations == expected_calls
+    assert tracker.run_totals['calls'] == expected_calls
+
+
+def write_companies(path, names):
+    path.write_text('company_name,company_name_tc,Email\n' + ''.join(f"{name},,\n" for name in names), encoding='utf-8')
+
+
+def read_emails(path):
+    return [line.split(',')[2] for line in path.read_text(encoding='utf-8').splitlines()[1:]]
+
+
+def test_budget_stop_keeps_results_of_calls_already_made(monkeypatch, tmp_path):
+    def lookup(companies, rate_limiter, quota_ok, accept_cached_not_found=True):
+        company_en, _ = companies[0]
+        if company_en.startswith('Alpha'):
+            # 最先提交的查询最后返回并触发预算上限，其后已完成的查询结果不能丢失
+            time.sleep(0.2)
+            raise main.BudgetExceededError('budget')
+        return [f"info@{company_en.split()[0].lower()}.com"], [main.empty_usage()]
+
+    monkeypatch.setattr(main, 'lookup_companies', lookup)
+    monkeypatch.setattr(main, 'MAX_CONCURRENT_TASKS', 4)
+    source = tmp_path / 'companies.csv'
+    write_companies(source, ['Alpha Ltd', 'Beta Ltd', 'Gamma Ltd'])
+
+    assert main.process_workbook(str(source), 'Sheet1', '1') == main.JOB_STOPPED
+    assert read_emails(source) == ['', 'info@beta.com', 'info@gamma.com']
+    # 未处理的行仍在处理队列中，下次运行时继续
+    queue = main.TaskQueue(main.task_queue_path(str(source), 'Sheet1'))
+    try:
+        assert queue.conn.execute("SELECT row FROM task_queue WHERE pending = 1").fetchall() == [(0,)]
+    finally:
+        queue.close()
+
+
+def test_budget_stop_skips_remaining_files(monkeypatch, tmp_path):
+    def lookup(companies, rate_limiter, quota_ok, accept_cached_not_found=True):
+        raise main.BudgetExceededError('budget')
+
+    monkeypatch.setattr(main, 'lookup_companies', lookup)
+    first, second = tmp_path / 'first.csv', tmp_path / 'second.csv'
+    write_companies(first, ['Alpha Ltd'])
+    write_companies(second, ['Beta Ltd'])
+    processed = []
+    process_workbook = main.process_workbook
+
+    def tracking_process_workbook(excel_file, *args):
+        processed.append(excel_file)
+        return process_workbook(excel_file, *args)
+
+    monkeypatch.setattr(main, 'process_workbook', tracking_process_workbook)
+    with pytest.raises(SystemExit) as exit_info:
+        main.main([str(first), str(second), '--resume'])
+    assert exit_info.value.code == 2
+    assert processed == [str(first)]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""结果校验与重新查询评分"""
+
+import pandas as pd
+import pytest
+
+import main
+
+
+def validate(rows):
+    df = pd.DataFrame(rows, columns=[main.COMPANY_NAME_EN_COL, main.COMPANY_NAME_TC_COL, main.EMAIL_COL])
+    return main.validate_results(df)
+
+
+def test_flags_each_kind_of_suspect_result():
+    flags = validate([
+        ('Alpha Trading Ltd', '', 'info@alphatrading.com.hk'),
+        ('Beta Ltd', '', 'Please contact via the website'),
+        ('Gamma Ltd', '', 'noreply@gamma.com'),
+        ('Delta Ltd', '', 'info@example.com'),
+        ('Epsilon Ltd', '', 'logo@2x.png'),
+        ('Zeta Ltd', '', 'zeta.hk@gmail.com'),
+        ('Eta Ltd', '', 'Not Found'),
+        ('Theta Ltd', '', 'info@unrelated.com'),
+        ('Iota Ltd', '', ''),
+    ])
+    suspects = {index: [name for name in main.SUSPECT_WEIGHTS if flags.at[index, name]] for index in flags.index}
+    assert suspects == {
+        0: [],
+        1: ['invalid_syntax'],
+        2: ['junk'],
+        3: ['junk'],
+        4: ['junk'],
+        5: ['free_mail'],
+        6: ['not_found'],
+        7: ['domain_mismatch'],
+        8: [],
+    }
+    assert flags.at[0, 'score'] == 0
+    assert flags.at[8, 'score'] == 0
+    assert flags.at[1, 'score'] == pytest.approx(1.0)
+    assert flags.at[2, 'score'] == pytest.approx(0.9)
+
+
+def test_duplicate_only_across_different_companies():
+    flags = validate([
+        ('Alpha Trading Limited', '', 'info@alphatrading.com'),
+        ('ALPHA TRADING LTD', '', 'Info@AlphaTrading.com'),
+        ('Omega Holdings Ltd', '', 'info@alphatrading.com'),
+        ('Sigma Ltd', '', 'info@sigma.com'),
+    ])
+    assert flags['duplicate'].tolist() == [True, True, True, False]
+    # 重复且域名不符时按 1 - ∏(1 - 权重) 合并评分
+    assert flags.at[2, 'score'] == pytest.approx(1 - (1 - 0.6) * (1 - 0.4))
+
+
+def test_junk_and_invalid_addresses_are_not_counted_as_duplicates():
+    flags = validate([
+        ('Alpha Ltd', '', 'noreply@alpha.com'),
+        ('Beta Ltd', '', 'noreply@alpha.com'),
+    ])
+    assert flags['junk'].tolist() == [True, True]
+    assert not flags['duplicate'].any()
+
+
+def test_no_usable_email_does_not_fail():
+    flags = validate([('Alpha Ltd', '', 'Not Found'), ('Beta Ltd', '', '')])
+    assert flags['not_found'].tolist() == [True, False]
+    assert not flags['domain_mismatch'].any()
+
+
+def test_rank_requery_candidates_orders_by_score_and_applies_limits():
+    flags = validate([
+        ('Alpha Ltd', '', 'Not Found'),
+        ('Beta Ltd', '', 'garbage text'),
+        ('Gamma Ltd', '', 'info@gamma.com'),
+        ('Delta Ltd', '', 'noreply@delta.com'),
+        ('Epsilon Ltd', '', 'Not Found'),
+    ])
+    assert main.rank_requery_candidates(flags, limit=10, min_score=0).index.tolist() == [1, 3, 0, 4]
+    assert main.rank_requery_candidates(flags, limit=2, min_score=0).index.tolist() == [1, 3]
+    assert main.rank_requery_candidates(flags, limit=10, min_score=0.5).index.tolist() == [1, 3]